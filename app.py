@@ -1,20 +1,33 @@
 # app.py
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages, send_file, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages, send_file, send_from_directory, jsonify, Response, abort
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import sqlite3
 import os
 from datetime import datetime
-from fpdf import FPDF
-import pandas as pd
 import re
-import shutil
-import threading
+import sys
+import subprocess
+import base64
+import hashlib
+import io
+from itertools import chain
 import time
+import click
+import json
 from config import Config
-import matplotlib
-matplotlib.use('Agg')  # Penting: agar jalan di web server
-import matplotlib.pyplot as plt
+import database
+import migrations
+from database import get_db
+from backups import backup_db, start_backup_scheduler
+import audit
+from audit import catat_aktivitas  # Log aktivitas asinkron (antrean + penulis batch)
+import cetak
+import ekspor
+
+# pandas, matplotlib, fpdf (dan importer yang memakai pandas/numpy) sengaja tidak diimpor di sini:
+# modul berat itu dimuat di fungsi yang memakainya, supaya worker cepat start dan hemat memori.
+# Anggaran waktu impor dicek dengan: flask cek-impor (dan tests/test_startup.py)
 
 # Buat folder
 os.makedirs("laporan/pdf", exist_ok=True)
@@ -27,122 +40,55 @@ os.makedirs("backup", exist_ok=True)
 app = Flask(__name__)
 app.config.from_object(Config)
 Config.init_app(app)
+database.init_app(app)  # Koneksi per request dikembalikan ke pool saat teardown
+app.jinja_env.globals['format_ekspor'] = ekspor.format_ekspor  # Tombol ekspor sesuai paket terpasang
 
 # --- FUNGSI BANTUAN ---
-def get_db():
-    conn = sqlite3.connect('desa.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def sanitize_filename(filename):
     return re.sub(r'[<>:"/\\|?*\x00-\x1F]', '_', filename)
 
-def shrink_font_for_fit(pdf, text, max_width, original_size, min_size=6):
+def kirim_laporan(data, nama_file, etag=None):
     """
-    Perkecil ukuran font sampai teks muat dalam lebar kolom.
-    Digunakan agar nama panjang tidak memicu multi_cell (yang bikin jelek).
+    Kirim laporan langsung dari memori (tidak lewat file bersama di disk).
+    send_file mengisi Content-Length dan menjawab If-None-Match / Range dari ETag.
     """
-    pdf.set_font("helvetica", '', original_size)
-    while pdf.get_string_width(text) > max_width and pdf.font_size > min_size:
-        pdf.set_font("helvetica", '', pdf.font_size - 0.5)
-    return pdf.font_size
-
-# --- INISIALISASI DATABASE ---
-def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS penduduk (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nomor_kk TEXT,
-        nik TEXT UNIQUE,
-        nama TEXT,
-        hubungan TEXT,
-        jenis_kelamin TEXT,
-        tempat_lahir TEXT,
-        tanggal_lahir TEXT,
-        agama TEXT,
-        status_perkawinan TEXT,
-        pendidikan TEXT,
-        pekerjaan TEXT,
-        alamat TEXT,
-        rt_rw TEXT,
-        dusun TEXT,
-        golongan_darah TEXT,
-        kesejahteraan TEXT,
-        tanggal_input TEXT,
-        foto_ktp TEXT
-    )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS user (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT,
-        role TEXT,
-        dusun TEXT,
-        nik_masyarakat TEXT
-    )''')
-    conn.commit()
-    conn.close()
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=nama_file,
+                     etag=etag or hashlib.sha256(data).hexdigest()[:32])
 
-def init_log_table():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""CREATE TABLE IF NOT EXISTS log_penghapusan (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nik TEXT NOT NULL,
-        nama TEXT NOT NULL,
-        alasan_hapus TEXT,
-        dusun TEXT,
-        tanggal_hapus DATETIME DEFAULT CURRENT_TIMESTAMP,
-        dihapus_oleh TEXT
-    )""")
-    conn.commit()
-    conn.close()
+# --- INISIALISASI DATABASE & USER AWAL ---
+# Tabel, index, user default, dll. dikelola lewat migrasi bernomor (migrations.py).
+# Saat start hanya cek versi skema; migrasi jalan sekali jika ada yang baru.
+migrations.upgrade_jika_perlu()
 
-def init_audit_log():
+# --- BACKUP OTOMATIS ---
+# Dijalankan saat import agar tetap aktif di bawah server WSGI (bukan hanya __main__)
+start_backup_scheduler()
+
+# --- JOB IMPOR TERPUTUS ---
+# Job impor berjalan di thread proses web; jika prosesnya mati (restart, deploy, worker didaur ulang),
+# job 'menunggu'/'berjalan' miliknya tidak akan pernah selesai. Setiap proses yang menjalankan job
+# memperbarui heartbeat (kolom detak) job miliknya. Dicek saat request (bukan saat import) agar perintah
+# CLI `flask ...` tidak mengambil alih job, dan paling sering sekali per IMPOR_DETAK_DETIK.
+WAKTU_START = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+_cek_job_impor_berikut = 0
+
+@app.before_request
+def pulihkan_job_impor():
+    global _cek_job_impor_berikut
+    sekarang = time.time()
+    if sekarang < _cek_job_impor_berikut:
+        return
+    pertama = not _cek_job_impor_berikut
+    _cek_job_impor_berikut = sekarang + Config.IMPOR_DETAK_DETIK
+    # Request pertama: job yang dibuat sebelum proses ini start mungkin milik proses lama yang baru saja
+    # mati (heartbeat belum kedaluwarsa); pulihkan_job memastikannya lewat kunci job
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""CREATE TABLE IF NOT EXISTS log_aktivitas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL,
-        aksi TEXT NOT NULL,
-        detail TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )""")
-    conn.commit()
-    conn.close()
-
-def catat_aktivitas(username, aksi, detail=""):
-    """
-    Catat aktivitas user ke log_audit
-    """
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO log_aktivitas (username, aksi, detail)
-                          VALUES (?, ?, ?)''', (username, aksi, detail))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error mencatat aktivitas: {str(e)}")
-
-# --- INISIALISASI DATABASE & USER AWAL ---
-if not os.path.exists('desa.db'):
-    init_db()
-
-# Tambah user default
-conn = get_db()
-conn.execute("INSERT OR IGNORE INTO user (username, password, role) VALUES (?, ?, ?)",
-            ('admin', '1234', 'admin'))
-conn.execute("INSERT OR IGNORE INTO user (username, password, role, dusun) VALUES (?, ?, ?, ?)",
-            ('kepala_satu', '1234', 'kepala_dusun', 'SATU'))
-conn.execute("INSERT OR IGNORE INTO user (username, password, role, nik_masyarakat) VALUES (?, ?, ?, ?)",
-            ('warga1', '1234', 'masyarakat', '1234567890123456'))
-conn.commit()
-conn.close()
-
-# Inisialisasi tabel log
-init_log_table()
-init_audit_log()  # ✅ Harus dipanggil setelah definisi fungsi
+    terputus = conn.execute("""SELECT 1 FROM impor_job WHERE status IN ('menunggu', 'berjalan')
+                               AND (detak IS NULL OR detak < ? OR (? AND dibuat < ?)) LIMIT 1""",
+                            (sekarang - Config.IMPOR_DETAK_KADALUARSA_DETIK, pertama, WAKTU_START)).fetchone()
+    if terputus:
+        from importer import pulihkan_job  # Modul berat hanya dimuat jika memang ada job terputus
+        pulihkan_job()
 
 # Flask-Login
 login_manager = LoginManager()
@@ -188,39 +134,88 @@ def load_user(user_id):
 load_users_from_db()
 
 
-def catat_aktivitas(username, aksi, detail=""):
+
+# --- PAGINASI KEYSET ---
+# (ekspresi ORDER BY, alias kolom di hasil SELECT); id sebagai pemutus seri
+KUNCI_URUT_KK = [
+    ("nomor_kk", "nomor_kk"),
+    (database.URUT_KELUARGA, "urut_keluarga"),
+    ("nama", "nama"),
+    ("id", "id"),
+]
+KUNCI_URUT_NIK = [("nama", "nama"), ("id", "id")]
+
+
+def encode_cursor(nilai):
+    return base64.urlsafe_b64encode(json.dumps(nilai).encode()).decode().rstrip('=')
+
+
+def decode_cursor(teks):
+    if not teks:
+        return None
+    try:
+        nilai = json.loads(base64.urlsafe_b64decode(teks + '=' * (-len(teks) % 4)))
+    except Exception:
+        return None
+    # Cursor dari URL bisa diubah user: hanya nilai skalar yang boleh jadi parameter query
+    if isinstance(nilai, list) and all(v is None or isinstance(v, (str, int, float)) for v in nilai):
+        return nilai
+    return None
+
+
+def ambil_halaman_keyset(cursor, base_query, kondisi, params, kunci_urut, limit,
+                         after=None, before=None, akhir=False, offset=0, per_kk=False):
     """
-    Catat aktivitas user ke log_audit
+    Ambil satu halaman dengan seek pagination (WHERE (kunci...) > (cursor...)),
+    jadi biaya halaman 30 sama dengan halaman 1.
+    per_kk=True: halaman dilebarkan sampai batas KK supaya satu keluarga tidak terpotong.
+    Kembalikan (rows, has_prev, has_next).
     """
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO log_aktivitas (username, aksi, detail)
-                          VALUES (?, ?, ?)''', (username, aksi, detail))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error mencatat aktivitas: {str(e)}")
-        
+    kunci = "(" + ", ".join(ekspresi for ekspresi, _ in kunci_urut) + ")"
+    tanda = "(" + ", ".join("?" for _ in kunci_urut) + ")"
+    urut_naik = ", ".join(ekspresi for ekspresi, _ in kunci_urut)
+    urut_turun = ", ".join(ekspresi + " DESC" for ekspresi, _ in kunci_urut)
+
+    def jalankan(tambahan, tambahan_params, order_by, batas=None):
+        semua = kondisi + tambahan
+        sql = base_query
+        if semua:
+            sql += " WHERE " + " AND ".join(semua)
+        sql += " ORDER BY " + order_by
+        args = tuple(params) + tuple(tambahan_params)
+        if batas is not None:
+            sql += " LIMIT ? OFFSET ?"
+            args += batas
+        return cursor.execute(sql, args).fetchall()
+
+    if after is not None and len(after) == len(kunci_urut):
+        rows = jalankan([f"{kunci} > {tanda}"], after, urut_naik, (limit, 0))
+    elif before is not None and len(before) == len(kunci_urut):
+        rows = jalankan([f"{kunci} < {tanda}"], before, urut_turun, (limit, 0))[::-1]
+    elif akhir:
+        rows = jalankan([], (), urut_turun, (limit, 0))[::-1]
+    else:
+        rows = jalankan([], (), urut_naik, (limit, offset))
 
+    if not rows:
+        return [], False, False
 
-# --- BACKUP OTOMATIS ---
-def backup_db():
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = os.path.join("backup", f"desa_{timestamp}.db")
-    try:
-        shutil.copy("desa.db", backup_path)
-        print(f"✅ Backup berhasil: {backup_path}")
-    except Exception as e:
-        print(f"❌ Gagal backup: {str(e)}")
+    def kunci_baris(row):
+        return [row[alias] for _, alias in kunci_urut]
+
+    if per_kk:
+        # Lengkapi keluarga yang terpotong di awal dan akhir halaman
+        pertama, terakhir = rows[0], rows[-1]
+        sebelum = jalankan(["nomor_kk = ?", f"{kunci} < {tanda}"],
+                           [pertama['nomor_kk']] + kunci_baris(pertama), urut_naik)
+        sesudah = jalankan(["nomor_kk = ?", f"{kunci} > {tanda}"],
+                           [terakhir['nomor_kk']] + kunci_baris(terakhir), urut_naik)
+        rows = list(sebelum) + list(rows) + list(sesudah)
+
+    has_prev = bool(jalankan([f"{kunci} < {tanda}"], kunci_baris(rows[0]), urut_turun, (1, 0)))
+    has_next = bool(jalankan([f"{kunci} > {tanda}"], kunci_baris(rows[-1]), urut_naik, (1, 0)))
+    return rows, has_prev, has_next
 
-def start_backup_scheduler():
-    def run():
-        while True:
-            backup_db()
-            time.sleep(86400)  # 24 jam
-    thread = threading.Thread(target=run, daemon=True)
-    thread.start()
 
 @app.route('/')
 @login_required
@@ -248,39 +243,37 @@ def index():
     total_jiwa = total_kk = total_dusun = 0
     rows = []
     total_pages = 1  # ✅ Default 1
+    has_prev = has_next = False
+    cursor_prev = cursor_next = None
+    pakai_fts = False
+    hasil_terbatas = False
 
     # ============ 1. Ambil Statistik ============
     try:
         with get_db() as conn:
             cursor = conn.cursor()
 
-            # Base query
-            base_jiwa = "SELECT COUNT(*) FROM penduduk"
-            base_kk = "SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''"
-            base_dusun = "SELECT COUNT(DISTINCT dusun) FROM penduduk WHERE dusun IS NOT NULL AND TRIM(dusun) != ''"
-            params = ()
-
-            # Filter role
-            if current_user.role == 'kepala_dusun':
-                base_jiwa += " WHERE dusun = ?"
-                base_kk += " AND dusun = ?"
-                base_dusun += " AND dusun = ?"
-                params = (current_user.dusun,)
-            elif current_user.role == 'masyarakat':
-                base_jiwa += " WHERE nik = ?"
-                base_kk += " AND nik = ?"
-                base_dusun += " AND nik = ?"
-                params = (current_user.nik_masyarakat,)
-
-            # Eksekusi
-            cursor.execute(base_jiwa, params)
-            total_jiwa = cursor.fetchone()[0]
-
-            cursor.execute(base_kk, params)
-            total_kk = cursor.fetchone()[0]
-
-            cursor.execute(base_dusun, params)
-            total_dusun = cursor.fetchone()[0]
+            if current_user.role == 'masyarakat':
+                # Hanya satu orang: hitung langsung
+                cursor.execute("SELECT COUNT(*) FROM penduduk WHERE nik = ?", (current_user.nik_masyarakat,))
+                total_jiwa = cursor.fetchone()[0]
+                cursor.execute("""SELECT COUNT(DISTINCT nomor_kk) FROM penduduk
+                                  WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != '' AND nik = ?""",
+                               (current_user.nik_masyarakat,))
+                total_kk = cursor.fetchone()[0]
+                cursor.execute("""SELECT COUNT(DISTINCT dusun) FROM penduduk
+                                  WHERE dusun IS NOT NULL AND TRIM(dusun) != '' AND nik = ?""",
+                               (current_user.nik_masyarakat,))
+                total_dusun = cursor.fetchone()[0]
+            else:
+                # Dari tabel agregat (dijaga trigger)
+                lingkup = current_user.dusun if current_user.role == 'kepala_dusun' else '*'
+                total_jiwa = database.hitung_statistik(conn, 'jiwa', lingkup)
+                total_kk = database.hitung_statistik(conn, 'kk', lingkup)
+                if lingkup == '*':
+                    total_dusun = len(database.statistik_per_dusun(conn, 'jiwa'))
+                else:
+                    total_dusun = 1 if total_jiwa and (lingkup or '').strip() else 0
 
     except Exception as e:
         print(f"Statistik gagal: {str(e)[:100]}...")
@@ -290,67 +283,119 @@ def index():
         with get_db() as conn:
             cursor = conn.cursor()
 
-            base_query = """
-                SELECT nomor_kk, nik, nama, hubungan, alamat, dusun, jenis_kelamin, 
-                       pendidikan, kesejahteraan, tanggal_input
-                FROM penduduk
-            """
+            kolom = f"""id, nomor_kk, nik, nama, hubungan, alamat, dusun, jenis_kelamin, 
+                       pendidikan, kesejahteraan, tanggal_input,
+                       {database.URUT_KELUARGA} AS urut_keluarga"""
+            base_query = f"SELECT {kolom} FROM penduduk"
             count_query = "SELECT COUNT(*) FROM penduduk"
             params = ()
             count_params = ()
 
+            # Pencarian: kata kunci >= 3 huruf lewat FTS5 (diurutkan relevansi),
+            # lebih pendek dari itu tetap pakai LIKE
+            pakai_fts = len(search_query) >= database.FTS_MIN_PANJANG
+            if pakai_fts:
+                cari_join = """ JOIN (SELECT rowid AS cari_id, rank AS cari_rank FROM penduduk_fts
+                                     WHERE penduduk_fts MATCH ?) cari ON cari.cari_id = penduduk.id"""
+                if view_mode == 'nik':
+                    base_query = f"SELECT {kolom}, cari_rank FROM penduduk" + cari_join
+                else:
+                    # Keluarga diurutkan berdasarkan anggota paling relevan
+                    base_query = (f"SELECT {kolom}, MIN(cari_rank) OVER (PARTITION BY nomor_kk) AS cari_rank "
+                                  f"FROM penduduk" + cari_join)
+                count_query += cari_join
+                params = (database.fts_query(search_query),)
+                count_params = params
+
             # Filter role
+            kondisi = []
             if current_user.role == 'kepala_dusun':
-                base_query += " WHERE dusun = ?"
-                count_query += " WHERE dusun = ?"
-                params = (current_user.dusun,)
-                count_params = (current_user.dusun,)
+                kondisi.append("dusun = ?")
+                params += (current_user.dusun,)
+                count_params += (current_user.dusun,)
             elif current_user.role == 'masyarakat':
-                base_query += " WHERE nik = ?"
-                count_query += " WHERE nik = ?"
-                params = (current_user.nik_masyarakat,)
-                count_params = (current_user.nik_masyarakat,)
+                kondisi.append("nik = ?")
+                params += (current_user.nik_masyarakat,)
+                count_params += (current_user.nik_masyarakat,)
 
-            # Pencarian
-            if search_query:
+            if search_query and not pakai_fts:
                 search_param = f'%{search_query}%'
-                where_clause = " (nomor_kk LIKE ? OR nik LIKE ? OR nama LIKE ?)"
-                if "WHERE" in base_query:
-                    base_query += " AND" + where_clause
-                    count_query += " AND" + where_clause
-                else:
-                    base_query += " WHERE" + where_clause
-                    count_query += " WHERE" + where_clause
+                kondisi.append("(nomor_kk LIKE ? OR nik LIKE ? OR nama LIKE ?)")
                 search_values = (search_param, search_param, search_param)
                 params += search_values
                 count_params += search_values
 
             # Hitung total halaman
-            if limit != 'all':
+            if not search_query and current_user.role != 'masyarakat':
+                total_count = total_jiwa  # Sudah ada dari tabel agregat
+            else:
+                if kondisi:
+                    count_query += " WHERE " + " AND ".join(kondisi)
                 cursor.execute(count_query, count_params)
                 total_count = cursor.fetchone()[0]
-                total_pages = (total_count + limit - 1) // limit
-            else:
-                total_pages = 1  # ✅ Tetap kirim 1 jika 'all'
+            total_pages = max(1, (total_count + limit - 1) // limit)
 
             # Urutkan
-            if view_mode == 'nik':
-                order_by = " ORDER BY nama"
+            kunci_urut = KUNCI_URUT_NIK if view_mode == 'nik' else KUNCI_URUT_KK
+
+            if pakai_fts:
+                # Hasil pencarian diurutkan relevansi: LIMIT/OFFSET, dibatasi HALAMAN_OFFSET_MAKS halaman
+                # supaya biaya OFFSET tetap kecil (kata kunci yang lebih spesifik untuk hasil sisanya)
+                hasil_terbatas = total_pages > Config.HALAMAN_OFFSET_MAKS
+                total_pages = min(total_pages, Config.HALAMAN_OFFSET_MAKS)
+                page = min(page, total_pages)
+                offset = (page - 1) * limit
+                if kondisi:
+                    base_query += " WHERE " + " AND ".join(kondisi)
+                order_by = " ORDER BY cari_rank, " + ", ".join(ekspresi for ekspresi, _ in kunci_urut)
+                cursor.execute(base_query + order_by + " LIMIT ? OFFSET ?", params + (limit, offset))
+                rows = cursor.fetchall()
+                has_prev = page > 1
+                has_next = page < total_pages
             else:
-                order_by = " ORDER BY nomor_kk, CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END, nama"
-
-            # Tambah LIMIT dan OFFSET hanya jika tidak "all"
-            if limit != 'all':
-                order_by += " LIMIT ? OFFSET ?"
-                params += (limit, offset)
-
-            cursor.execute(base_query + order_by, params)
-            rows = cursor.fetchall()
+                # Keyset: lanjut dari kunci urut baris terakhir/pertama halaman sebelumnya
+                after = decode_cursor(request.args.get('after'))
+                before = decode_cursor(request.args.get('before'))
+                akhir = request.args.get('akhir') == '1'
+                if after is None and before is None and not akhir and page > 1:
+                    # Link lama tanpa cursor: lompat sekali dengan OFFSET, paling dalam HALAMAN_OFFSET_MAKS
+                    page = min(page, Config.HALAMAN_OFFSET_MAKS)
+                    after_offset = (page - 1) * limit
+                else:
+                    after_offset = 0
+                rows, has_prev, has_next = ambil_halaman_keyset(
+                    cursor, base_query, kondisi, params, kunci_urut, limit,
+                    after=after, before=before, akhir=akhir, offset=after_offset,
+                    per_kk=(view_mode != 'nik'))
+
+                if not has_prev:
+                    page = 1
+                if not has_next:
+                    total_pages = page
+                elif page >= total_pages:
+                    total_pages = page + 1
+                if rows:
+                    cursor_prev = encode_cursor([rows[0][alias] for _, alias in kunci_urut])
+                    cursor_next = encode_cursor([rows[-1][alias] for _, alias in kunci_urut])
 
     except Exception as e:
         print(f"Data utama gagal: {str(e)[:100]}...")
         rows = []
 
+    def page_url(p):
+        args = {'view': view_mode, 'q': search_query, 'limit': limit, 'page': p}
+        if p == page:
+            for nama in ('after', 'before', 'akhir'):
+                if request.args.get(nama):
+                    args[nama] = request.args.get(nama)
+        elif p == page - 1 and cursor_prev:
+            args['before'] = cursor_prev
+        elif p == page + 1 and cursor_next:
+            args['after'] = cursor_next
+        elif p == total_pages and p > 1 and not pakai_fts:
+            args['akhir'] = 1
+        return url_for('index', **args)
+
     # ============ 3. Kirim ke Template ============
     if view_mode == 'nik':
         return render_template('index_nik.html',
@@ -361,7 +406,11 @@ def index():
                              total_dusun=total_dusun,
                              limit=limit,
                              page=page,
-                             total_pages=total_pages)  # ✅ Dikirim
+                             total_pages=total_pages,  # ✅ Dikirim
+                             has_prev=has_prev,
+                             has_next=has_next,
+                             hasil_terbatas=hasil_terbatas,
+                             page_url=page_url)
     else:
         keluarga = {}
         for row in rows:
@@ -384,7 +433,11 @@ def index():
                              total_dusun=total_dusun,
                              limit=limit,
                              page=page,
-                             total_pages=total_pages)  # ✅ Dikirim
+                             total_pages=total_pages,  # ✅ Dikirim
+                             has_prev=has_prev,
+                             has_next=has_next,
+                             hasil_terbatas=hasil_terbatas,
+                             page_url=page_url)
 # --- LOGIN & LOGOUT ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -477,6 +530,8 @@ def tambah():
                  datetime.now().strftime('%Y-%m-%d')))
             
             conn.commit()
+            cetak.hapus_cache_kk(nomor_kk)
+            catat_aktivitas(current_user.username, 'TAMBAH_PENDUDUK', f"Tambah: {nik} {nama}")
             flash(f"Data {nama} berhasil ditambahkan!", "success")
             
         except sqlite3.IntegrityError:
@@ -581,6 +636,8 @@ def edit(nik_old):
                  nik_old))
 
             conn.commit()
+            cetak.hapus_cache_kk(row['nomor_kk'], nomor_kk)  # KK lama dan baru
+            catat_aktivitas(current_user.username, 'EDIT_PENDUDUK', f"Edit: {nik_old} -> {nik} {nama}")
             flash(f"Data {nama} berhasil diubah!", "success")
             
         except Exception as e:
@@ -608,51 +665,66 @@ def upload():
         flash("Anda tidak diizinkan mengakses halaman ini.", "danger")
         return redirect(url_for('index'))
 
+    from importer import FORMAT_IMPOR, buat_job
     if request.method == 'POST':
         if 'file' not in request.files:
-            return render_template('upload.html', result={'success': False, 'message': 'File tidak ditemukan.'})
+            return render_template('upload.html', format_impor=FORMAT_IMPOR, result={'success': False, 'message': 'File tidak ditemukan.'})
         file = request.files['file']
         if file.filename == '':
-            return render_template('upload.html', result={'success': False, 'message': 'Belum pilih file.'})
-        if not file.filename.endswith('.xlsx'):
-            return render_template('upload.html', result={'success': False, 'message': 'Format harus .xlsx'})
+            return render_template('upload.html', format_impor=FORMAT_IMPOR, result={'success': False, 'message': 'Belum pilih file.'})
+        if os.path.splitext(file.filename)[1].lower() not in FORMAT_IMPOR:
+            return render_template('upload.html', format_impor=FORMAT_IMPOR, result={'success': False, 'message': f'Format harus {", ".join(FORMAT_IMPOR)}'})
         try:
-            df = pd.read_excel(file)
-            required_cols = {'nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun'}
-            if not required_cols.issubset(df.columns.str.strip()):
-                return render_template('upload.html', result={'success': False, 'message': f'Kolom tidak lengkap: {", ".join(required_cols)}'})
-            df = df.fillna('')
-            df['nik'] = df['nik'].astype(str).str.strip()
-            df['nomor_kk'] = df['nomor_kk'].astype(str).str.strip()
-            new_count = 0
-            update_count = 0
-            failed_count = 0
-            conn = get_db()
-            for _, row in df.iterrows():
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO penduduk 
-                        (nik, nomor_kk, nama, hubungan, jenis_kelamin, tempat_lahir, tanggal_lahir,
-                         agama, status_perkawinan, pendidikan, pekerjaan, alamat, rt_rw, dusun,
-                         golongan_darah, kesejahteraan, tanggal_input, foto_ktp)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        row['nik'], row['nomor_kk'], row['nama'], row['hubungan'], row['jenis_kelamin'],
-                        row.get('tempat_lahir', ''), row.get('tanggal_lahir', ''),
-                        row.get('agama', ''), row.get('status_perkawinan', ''), row.get('pendidikan', ''),
-                        row.get('pekerjaan', ''), row.get('alamat', ''), row.get('rt_rw', ''), row['dusun'],
-                        row.get('golongan_darah', ''), row.get('kesejahteraan', ''),
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), row.get('foto_ktp', '')
-                    ))
-                    conn.commit()
-                    update_count += 1
-                except sqlite3.IntegrityError:
-                    failed_count += 1
-            conn.close()
-            return render_template('upload.html', result={'success': True, 'message': 'Data berhasil diimpor!', 'new_count': new_count, 'update_count': update_count, 'failed_count': failed_count})
+            # Diproses di latar belakang; halaman upload memantau /upload/status/<job_id>
+            job_id = buat_job(file, current_user.username, dry_run=bool(request.form.get('dry_run')))
         except Exception as e:
-            return render_template('upload.html', result={'success': False, 'message': f'Error membaca file: {str(e)}'})
-    return render_template('upload.html')
+            return render_template('upload.html', format_impor=FORMAT_IMPOR, result={'success': False, 'message': f'Gagal menyimpan file: {str(e)}'})
+        return redirect(url_for('upload', job=job_id))
+    return render_template('upload.html', format_impor=FORMAT_IMPOR, job_id=request.args.get('job'))
+
+
+@app.route('/upload/status/<job_id>')
+@login_required
+def upload_status(job_id):
+    from importer import status_job
+    job = status_job(get_db(), job_id)
+    if not job or (current_user.role != 'admin' and job['username'] != current_user.username):
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    file_error = job.pop('file_error')
+    job['url_kesalahan'] = (url_for('upload_kesalahan', job_id=job_id)
+                            if file_error and os.path.exists(file_error) else None)
+    job['url_jalankan'] = url_for('upload_jalankan', job_id=job_id) if job['dry_run'] else None
+    return jsonify(job)
+
+
+@app.route('/upload/jalankan/<job_id>', methods=['POST'])
+@login_required
+def upload_jalankan(job_id):
+    """Jalankan impor sungguhan dari file yang sudah dipratinjau"""
+    from importer import jalankan_pratinjau, status_job
+    job = status_job(get_db(), job_id)
+    if not job or (current_user.role != 'admin' and job['username'] != current_user.username):
+        flash("Job tidak ditemukan.", "warning")
+        return redirect(url_for('upload'))
+    job_baru = jalankan_pratinjau(job)
+    if not job_baru:
+        flash("File pratinjau sudah tidak tersedia. Silakan upload ulang.", "warning")
+        return redirect(url_for('upload'))
+    return redirect(url_for('upload', job=job_baru))
+
+
+@app.route('/upload/kesalahan/<job_id>')
+@login_required
+def upload_kesalahan(job_id):
+    """Download workbook baris yang ditolak validasi impor"""
+    from importer import status_job
+    job = status_job(get_db(), job_id)
+    if (not job or not job['file_error'] or not os.path.exists(job['file_error'])
+            or (current_user.role != 'admin' and job['username'] != current_user.username)):
+        flash("Laporan kesalahan tidak ditemukan.", "warning")
+        return redirect(url_for('upload'))
+    nama = os.path.splitext(job['nama_file'] or 'impor')[0]
+    return send_file(job['file_error'], as_attachment=True, download_name=f"kesalahan_{nama}.xlsx")
 
 # --- CETAK KK ---
 @app.route('/cetak/kk/<nomor_kk>')
@@ -684,228 +756,39 @@ def cetak_kk(nomor_kk):
         flash("Data tidak ditemukan untuk nomor KK ini.", "warning")
         return redirect(url_for('index'))
 
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    
-    # Background watermark
-    pdf.set_text_color(230, 230, 230)
-    pdf.set_font("helvetica", 'B', 80)
-    pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-    pdf.set_text_color(0, 0, 0)
-
-    # Logo
-    try:
-        pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-    except:
-        pass
-
-    # Header
-    pdf.set_font("helvetica", 'B', 18)
-    pdf.cell(0, 10, "KARTU KELUARGA", ln=True, align='C')
-    pdf.set_font("helvetica", '', 14)
-    pdf.cell(0, 8, f"No. KK: {nomor_kk}", ln=True, align='C')
-    pdf.ln(10)
-
-    # Garis pemisah
-    pdf.set_draw_color(0, 0, 0)
-    pdf.line(10, 40, 290, 40)
-    pdf.ln(5)
-
-    # Tabel
-    pdf.set_font("helvetica", 'B', 9)
-    col_widths = [10, 28, 35, 18, 25, 25, 18, 20, 20, 25, 20, 20]  # Tambah kolom No.
-    headers = ["No", "NIK", "Nama", "JK", "Tmpt Lahir", "Tgl Lahir", "Agama", "Status", "Pendidikan", "Pekerjaan", "Gol. Darah", "Hubungan"]
-    for i, h in enumerate(headers):
-        pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-    pdf.ln(8)
-
-    pdf.set_font("helvetica", '', 8)
-    for idx, row in enumerate(rows, 1):
-        x_before = pdf.get_x()
-        y_before = pdf.get_y()
-        
-        # Kolom 1: No
-        pdf.cell(col_widths[0], 8, str(idx), 1, 0, 'C')
-        
-        # Kolom 2: NIK
-        pdf.cell(col_widths[1], 8, str(row['nik']), 1, 0, 'L')
-        
-        # Kolom 3: Nama
-        max_width = col_widths[2] - 2
-        shrink_font_for_fit(pdf, row['nama'], max_width, 8, 6)
-        pdf.cell(col_widths[2], 8, row['nama'], 1, 0, 'L')
-        pdf.set_font("helvetica", '', 8)
-
-        # Kolom 4: JK
-        pdf.cell(col_widths[3], 8, row['jenis_kelamin'], 1, 0, 'C')
-        # Kolom 5: Tempat Lahir
-        shrink_font_for_fit(pdf, row['tempat_lahir'], col_widths[4] - 2, 8, 6)
-        pdf.cell(col_widths[4], 8, row['tempat_lahir'], 1, 0, 'L')
-        pdf.set_font("helvetica", '', 8)
-        # Kolom 6: Tanggal Lahir
-        pdf.cell(col_widths[5], 8, row['tanggal_lahir'], 1, 0, 'L')
-        # Kolom 7: Agama
-        pdf.cell(col_widths[6], 8, row['agama'], 1, 0, 'L')
-        # Kolom 8: Status
-        pdf.cell(col_widths[7], 8, row['status_perkawinan'], 1, 0, 'L')
-        # Kolom 9: Pendidikan
-        pdf.cell(col_widths[8], 8, row['pendidikan'], 1, 0, 'L')
-        # Kolom 10: Pekerjaan
-        shrink_font_for_fit(pdf, row['pekerjaan'], col_widths[9] - 2, 8, 6)
-        pdf.cell(col_widths[9], 8, row['pekerjaan'], 1, 0, 'L')
-        pdf.set_font("helvetica", '', 8)
-        # Kolom 11: Gol. Darah
-        pdf.cell(col_widths[10], 8, row['golongan_darah'], 1, 0, 'C')
-        # Kolom 12: Hubungan
-        pdf.cell(col_widths[11], 8, row['hubungan'], 1, 0, 'L')
-
-        pdf.ln(8)
-
-    # Total Anggota
-    pdf.set_font("helvetica", 'B', 8)
-    pdf.cell(col_widths[0] + col_widths[1], 8, f"Total Anggota: {len(rows)}", 1, 0, 'C')
-    pdf.cell(sum(col_widths[2:]), 8, "", 1)  # Gabungkan sisa kolom
-    pdf.ln(10)
-
-    # Footer
-    pdf.set_font("helvetica", 'I', 8)
-    pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
-    safe_kk = sanitize_filename(nomor_kk)
-    filename = os.path.join("laporan", "pdf", f"kk_{safe_kk}.pdf")
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
+    # Isi KK di-cache per data (dipakai semua petugas); footer pencetak + waktu dicap saat dikirim
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    data, kunci = cetak.pdf_kk(nomor_kk, rows, current_user.username, waktu)
+    catat_aktivitas(current_user.username, 'CETAK_KK', f"KK {nomor_kk}")
+    etag = hashlib.sha256(repr((kunci, current_user.username, waktu)).encode()).hexdigest()[:32]
+    return kirim_laporan(data, f"kk_{sanitize_filename(nomor_kk)}.pdf", etag=etag)
     
 # --- CETAK SEMUA KK ---
 @app.route('/cetak/semua/kk')
 @login_required
 def cetak_semua_kk():
-    # Filter role
-    base_query = """
-        SELECT DISTINCT nomor_kk FROM penduduk 
-        WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''
-    """
-    params = ()
-    
+    # Filter role; semua KK dibaca dengan satu query berurutan
+    conn = get_db()
     if current_user.role == 'kepala_dusun':
-        base_query += " AND dusun = ?"
-        params = (current_user.dusun,)
+        keluarga = database.keluarga_berurutan(conn, dusun=current_user.dusun)
     elif current_user.role == 'masyarakat':
-        base_query += " AND nik = ?"
-        params = (current_user.nik_masyarakat,)
-
-    base_query += " ORDER BY nomor_kk"
-    
-    conn = get_db()
-    kk_rows = conn.execute(base_query, params).fetchall()
-    conn.close()
+        keluarga = database.keluarga_berurutan(conn, nik=current_user.nik_masyarakat)
+    else:
+        keluarga = database.keluarga_berurutan(conn)
 
-    kks = [row['nomor_kk'] for row in kk_rows]
-    if not kks:
+    pertama = next(keluarga, None)
+    if pertama is None:
+        conn.close()
         flash("Tidak ada data KK untuk dicetak.", "info")
         return redirect(url_for('index'))
 
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    for nomor_kk in kks:
-        conn = get_db()
-        rows = conn.execute("""
-            SELECT * FROM penduduk 
-            WHERE nomor_kk = ? 
-            ORDER BY CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END, nama
-        """, (nomor_kk,)).fetchall()
-        conn.close()
-
-        if not rows:
-            continue
-
-        pdf.add_page()
-        
-        # Background watermark
-        pdf.set_text_color(230, 230, 230)
-        pdf.set_font("helvetica", 'B', 80)
-        pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-        pdf.set_text_color(0, 0, 0)
-
-        # Logo
-        try:
-            pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-        except:
-            pass
-
-        # Header
-        pdf.set_font("helvetica", 'B', 18)
-        pdf.cell(0, 10, "KARTU KELUARGA", ln=True, align='C')
-        pdf.set_font("helvetica", '', 14)
-        pdf.cell(0, 8, f"No. KK: {nomor_kk}", ln=True, align='C')
-        pdf.ln(10)
-
-        # Garis pemisah
-        pdf.set_draw_color(0, 0, 0)
-        pdf.line(10, 40, 290, 40)
-        pdf.ln(5)
-
-        # Tabel
-        pdf.set_font("helvetica", 'B', 9)
-        col_widths = [28, 35, 18, 25, 25, 18, 20, 20, 25, 20, 20]
-        headers = ["NIK", "Nama", "JK", "Tmpt Lahir", "Tgl Lahir", "Agama", "Status", "Pendidikan", "Pekerjaan", "Gol. Darah", "Hubungan"]
-        for i, h in enumerate(headers):
-            pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-        pdf.ln(8)
-
-        pdf.set_font("helvetica", '', 8)
-        for row in rows:
-            x_before = pdf.get_x()
-            y_before = pdf.get_y()
-            
-            # Kolom 1: NIK
-            pdf.cell(col_widths[0], 8, str(row['nik']), 1, 0, 'L')
-            
-            # Kolom 2: Nama (font mengecil otomatis)
-            max_width = col_widths[1] - 2
-            shrink_font_for_fit(pdf, row['nama'], max_width, 8, 6)
-            pdf.cell(col_widths[1], 8, row['nama'], 1, 0, 'L')
-            # Reset font ke 8
-            pdf.set_font("helvetica", '', 8)
-
-            # Kolom 3: JK
-            pdf.cell(col_widths[2], 8, row['jenis_kelamin'], 1, 0, 'C')
-            # Kolom 4: Tempat Lahir
-            shrink_font_for_fit(pdf, row['tempat_lahir'], col_widths[3] - 2, 8, 6)
-            pdf.cell(col_widths[3], 8, row['tempat_lahir'], 1, 0, 'L')
-            pdf.set_font("helvetica", '', 8)
-            # Kolom 5: Tanggal Lahir
-            pdf.cell(col_widths[4], 8, row['tanggal_lahir'], 1, 0, 'L')
-            # Kolom 6: Agama
-            pdf.cell(col_widths[5], 8, row['agama'], 1, 0, 'L')
-            # Kolom 7: Status
-            pdf.cell(col_widths[6], 8, row['status_perkawinan'], 1, 0, 'L')
-            # Kolom 8: Pendidikan
-            pdf.cell(col_widths[7], 8, row['pendidikan'], 1, 0, 'L')
-            # Kolom 9: Pekerjaan
-            shrink_font_for_fit(pdf, row['pekerjaan'], col_widths[8] - 2, 8, 6)
-            pdf.cell(col_widths[8], 8, row['pekerjaan'], 1, 0, 'L')
-            pdf.set_font("helvetica", '', 8)
-            # Kolom 10: Gol. Darah
-            pdf.cell(col_widths[9], 8, row['golongan_darah'], 1, 0, 'C')
-            # Kolom 11: Hubungan
-            pdf.cell(col_widths[10], 8, row['hubungan'], 1, 0, 'L')
-
-            # Pindah baris
-            pdf.ln(8)
-
-        # Footer
-        pdf.ln(10)
-        pdf.set_font("helvetica", 'I', 8)
-        pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
-    filepath = "laporan/pdf/semua_kk.pdf"
-    pdf.output(filepath)
-    return send_file(filepath, as_attachment=True)
+    # Render per potongan KK di process pool, lalu digabung berurutan
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    potongan = cetak.potong_keluarga(chain([pertama], keluarga), current_user.username, waktu)
+    data, nama_file, _ = cetak.cetak_paralel(cetak.render_keluarga, potongan, "semua_kk")
+    conn.close()
+    catat_aktivitas(current_user.username, 'CETAK_SEMUA_KK', "")
+    return kirim_laporan(data, nama_file)
     
 # --- CETAK DARI NIK ---
 @app.route('/cetak/kk/dari-nik', methods=['GET', 'POST'])
@@ -1001,86 +884,13 @@ def cetak_daftar_semua():
         flash("Tidak ada data untuk dicetak.", "info")
         return redirect(url_for('index'))
 
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    
-    # Background watermark
-    pdf.set_text_color(230, 230, 230)
-    pdf.set_font("helvetica", 'B', 80)
-    pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-    pdf.set_text_color(0, 0, 0)
-
-    # Logo
-    try:
-        pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-    except:
-        pass
-
-    # Header
-    pdf.set_font("helvetica", 'B', 16)
-    pdf.cell(0, 10, "DAFTAR SEMUA PENDUDUK", ln=True, align='C')
-    pdf.set_font("helvetica", '', 12)
-    pdf.cell(0, 8, "Desa Nagori Bahapal Raya", ln=True, align='C')
-    pdf.ln(10)
-
-    # Tabel
-    pdf.set_font("helvetica", 'B', 8)
-    col_widths = [10, 25, 28, 35, 25, 18, 20, 20, 25, 25, 30]
-    headers = ["No", "No. KK", "NIK", "Nama", "Hubungan", "JK", "Pendidikan", "Pekerjaan", "Dusun", "Alamat", "Kesejahteraan"]
-    for i, h in enumerate(headers):
-        pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-    pdf.ln(8)
-
-    pdf.set_font("helvetica", '', 7)
-    for idx, row in enumerate(rows, 1):
-        # Kolom 1: No
-        pdf.cell(col_widths[0], 8, str(idx), 1, 0, 'C')
-        # Kolom 2: No. KK
-        pdf.cell(col_widths[1], 8, str(row['nomor_kk'] or '-'), 1)
-        # Kolom 3: NIK
-        pdf.cell(col_widths[2], 8, str(row['nik']), 1)
-        # Kolom 4: Nama
-        shrink_font_for_fit(pdf, row['nama'], col_widths[3] - 2, 7, 6)
-        pdf.cell(col_widths[3], 8, row['nama'], 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 5: Hubungan
-        pdf.cell(col_widths[4], 8, str(row['hubungan'] or '-'), 1)
-        # Kolom 6: JK
-        pdf.cell(col_widths[5], 8, str(row['jenis_kelamin'] or '-'), 1)
-        # Kolom 7: Pendidikan
-        pdf.cell(col_widths[6], 8, str(row['pendidikan'] or '-'), 1)
-        # Kolom 8: Pekerjaan
-        shrink_font_for_fit(pdf, row['pekerjaan'] or '-', col_widths[7] - 2, 7, 6)
-        pdf.cell(col_widths[7], 8, str(row['pekerjaan'] or '-'), 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 9: Dusun
-        pdf.cell(col_widths[8], 8, str(row['dusun']), 1)
-        # Kolom 10: Alamat
-        shrink_font_for_fit(pdf, row['alamat'] or '-', col_widths[9] - 2, 7, 6)
-        pdf.cell(col_widths[9], 8, str(row['alamat'] or '-'), 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 11: Kesejahteraan
-        kesejahteraan = row['kesejahteraan'].replace(',', ', ') if row['kesejahteraan'] else '-'
-        shrink_font_for_fit(pdf, kesejahteraan, col_widths[10] - 2, 7, 6)
-        pdf.cell(col_widths[10], 8, kesejahteraan, 1)
-        pdf.set_font("helvetica", '', 7)
-        pdf.ln(8)
-
-    # Total Penduduk
-    pdf.set_font("helvetica", 'B', 8)
-    pdf.cell(col_widths[0] + sum(col_widths[1:4]), 8, f"TOTAL PENDUDUK: {len(rows)}", 1, 0, 'C')
-    pdf.cell(sum(col_widths[4:]), 8, "", 1)  # Gabungkan sisa kolom
-    pdf.ln(10)
-
-    # Footer
-    pdf.set_font("helvetica", 'I', 8)
-    pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
-    filename = "laporan/pdf/daftar_semua_penduduk.pdf"
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    potongan = cetak.potong_daftar(rows, ["DAFTAR SEMUA PENDUDUK", "Desa Nagori Bahapal Raya"],
+                                   lambda jumlah: f"TOTAL PENDUDUK: {jumlah}",
+                                   current_user.username, waktu)
+    data, nama_file, _ = cetak.cetak_paralel(cetak.render_daftar, potongan, "daftar_semua_penduduk")
+    catat_aktivitas(current_user.username, 'CETAK_DAFTAR', "Semua dusun")
+    return kirim_laporan(data, nama_file)
     
 
 # --- CETAK NIK PER DUSUN ---
@@ -1126,105 +936,14 @@ def cetak_daftar_dusun():
         flash(f"Tidak ada data di Dusun {dusun}.", "info")
         return redirect(url_for('cetak_pilihan'))
 
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    
-    # Background watermark
-    pdf.set_text_color(230, 230, 230)
-    pdf.set_font("helvetica", 'B', 80)
-    pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-    pdf.set_text_color(0, 0, 0)
-
-    # Logo
-    try:
-        pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-    except:
-        pass
-
-    # Header
-    pdf.set_font("helvetica", 'B', 16)
-    pdf.cell(0, 10, f"DAFTAR PENDUDUK DUSUN {dusun.upper()}", ln=True, align='C')
-    pdf.ln(10)
-
-    # Tabel
-    pdf.set_font("helvetica", 'B', 8)
-    col_widths = [10, 25, 28, 35, 25, 18, 20, 20, 25, 30]
-    headers = ["No", "No. KK", "NIK", "Nama", "Hubungan", "JK", "Pendidikan", "Pekerjaan", "Alamat", "Kesejahteraan"]
-    for i, h in enumerate(headers):
-        pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-    pdf.ln(8)
-
-    pdf.set_font("helvetica", '', 7)
-    for idx, row in enumerate(rows, 1):
-        # Kolom 1: No
-        pdf.cell(col_widths[0], 8, str(idx), 1, 0, 'C')
-        # Kolom 2: No. KK
-        pdf.cell(col_widths[1], 8, str(row['nomor_kk'] or '-'), 1)
-        # Kolom 3: NIK
-        pdf.cell(col_widths[2], 8, str(row['nik']), 1)
-        # Kolom 4: Nama
-        shrink_font_for_fit(pdf, row['nama'], col_widths[3] - 2, 7, 6)
-        pdf.cell(col_widths[3], 8, row['nama'], 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 5: Hubungan
-        pdf.cell(col_widths[4], 8, str(row['hubungan'] or '-'), 1)
-        # Kolom 6: JK
-        pdf.cell(col_widths[5], 8, str(row['jenis_kelamin'] or '-'), 1)
-        # Kolom 7: Pendidikan
-        pdf.cell(col_widths[6], 8, str(row['pendidikan'] or '-'), 1)
-        # Kolom 8: Pekerjaan
-        shrink_font_for_fit(pdf, row['pekerjaan'] or '-', col_widths[7] - 2, 7, 6)
-        pdf.cell(col_widths[7], 8, str(row['pekerjaan'] or '-'), 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 9: Alamat
-        shrink_font_for_fit(pdf, row['alamat'] or '-', col_widths[8] - 2, 7, 6)
-        pdf.cell(col_widths[8], 8, str(row['alamat'] or '-'), 1)
-        pdf.set_font("helvetica", '', 7)
-        # Kolom 10: Kesejahteraan
-        kesejahteraan = row['kesejahteraan'].replace(',', ', ') if row['kesejahteraan'] else '-'
-        shrink_font_for_fit(pdf, kesejahteraan, col_widths[9] - 2, 7, 6)
-        pdf.cell(col_widths[9], 8, kesejahteraan, 1)
-        pdf.set_font("helvetica", '', 7)
-        pdf.ln(8)
-
-    # Total Penduduk di Dusun
-    pdf.set_font("helvetica", 'B', 8)
-    pdf.cell(col_widths[0] + sum(col_widths[1:4]), 8, f"TOTAL: {len(rows)} ORANG", 1, 0, 'C')
-    pdf.cell(sum(col_widths[4:]), 8, "", 1)  # Gabungkan sisa kolom
-    pdf.ln(10)
-
-    # Footer
-    pdf.set_font("helvetica", 'I', 8)
-    pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    potongan = cetak.potong_daftar(rows, [f"DAFTAR PENDUDUK DUSUN {dusun.upper()}"],
+                                   lambda jumlah: f"TOTAL: {jumlah} ORANG",
+                                   current_user.username, waktu, dengan_dusun=False)
     safe_dusun = sanitize_filename(dusun)
-    filename = f"laporan/pdf/daftar_dusun_{safe_dusun}.pdf"
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
- 
-    
-def word_wrap(text, pdf, max_width):
-    lines = []
-    words = text.split(' ')
-    current_line = ""
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        if pdf.get_string_width(test_line) <= max_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-            while pdf.get_string_width(current_line) > max_width:
-                current_line = current_line[:-1]
-                if not current_line:
-                    break
-    if current_line:
-        lines.append(current_line)
-    return lines 
-
+    data, nama_file, _ = cetak.cetak_paralel(cetak.render_daftar, potongan, f"daftar_dusun_{safe_dusun}")
+    catat_aktivitas(current_user.username, 'CETAK_DAFTAR', f"Dusun {dusun}")
+    return kirim_laporan(data, nama_file)
  
 @app.route('/cetak/kk/dusun/<dusun>')
 @login_required
@@ -1243,128 +962,23 @@ def cetak_kk_per_dusun(dusun):
         flash("Anda tidak diizinkan mengakses fitur ini.", "danger")
         return redirect(url_for('index'))
 
-    # Ambil semua KK di dusun tersebut
+    # Ambil semua KK di dusun tersebut (satu query, dikelompokkan per KK)
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT DISTINCT nik, nomor_kk, nama, hubungan, jenis_kelamin, tempat_lahir, 
-               tanggal_lahir, agama, status_perkawinan, pendidikan, pekerjaan, 
-               alamat, golongan_darah, dusun
-        FROM penduduk 
-        WHERE nomor_kk = ? AND nama IS NOT NULL AND TRIM(nama) != ''
-        ORDER BY CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END, nama                                                                                                               
-    """, (dusun,))
-    kk_rows = cursor.fetchall()
-    conn.close()
-
-    if not kk_rows:
+    keluarga = database.keluarga_berurutan(conn, dusun=dusun)
+    pertama = next(keluarga, None)
+    if pertama is None:
+        conn.close()
         flash(f"Tidak ada data KK di Dusun {dusun}.", "info")
         return redirect(url_for('cetak_pilihan'))
 
-    kks = [row['nomor_kk'] for row in kk_rows]
-
-    # Buat PDF
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    for nomor_kk in kks:
-        conn = get_db()
-        rows = conn.execute("""
-            SELECT * FROM penduduk 
-            WHERE nomor_kk = ? 
-            ORDER BY CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END, nama
-        """, (nomor_kk,)).fetchall()
-        conn.close()
-
-        if not rows:
-            continue
-
-        pdf.add_page()
-
-        # Background watermark
-        pdf.set_text_color(230, 230, 230)
-        pdf.set_font("helvetica", 'B', 80)
-        pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-        pdf.set_text_color(0, 0, 0)
-
-        # Logo
-        try:
-            pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-        except:
-            pass
-
-        # Header
-        pdf.set_font("helvetica", 'B', 18)
-        pdf.cell(0, 10, "KARTU KELUARGA", ln=True, align='C')
-        pdf.set_font("helvetica", '', 14)
-        pdf.cell(0, 8, f"No. KK: {nomor_kk}", ln=True, align='C')
-        pdf.ln(10)
-
-        # Garis pemisah
-        pdf.set_draw_color(0, 0, 0)
-        pdf.line(10, 40, 290, 40)
-        pdf.ln(5)
-
-        # Tabel
-        pdf.set_font("helvetica", 'B', 9)
-        col_widths = [28, 35, 18, 25, 25, 18, 20, 20, 25, 20, 20]
-        headers = ["NIK", "Nama", "JK", "Tmpt Lahir", "Tgl Lahir", "Agama", "Status", "Pendidikan", "Pekerjaan", "Gol. Darah", "Hubungan"]
-        for i, h in enumerate(headers):
-            pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-        pdf.ln(8)
-
-        pdf.set_font("helvetica", '', 8)
-        for row in rows:
-            # Hitung tinggi baris berdasarkan nama
-            nama_lines = word_wrap(row['nama'], pdf, col_widths[1] - 1)
-            height = max(8, len(nama_lines) * 4)  # Minimal 8mm
-
-            x_before = pdf.get_x()
-            y_before = pdf.get_y()
-
-            # Kolom 1: NIK
-            pdf.cell(col_widths[0], height, str(row['nik']), 1, 0, 'L')
-
-            # Kolom 2: Nama (multi_cell)
-            
-            pdf.set_xy(x_before + col_widths[0], y_before)
-            pdf.multi_cell(col_widths[1], 4, row['nama'], border=1, align='L')
-
-            # Reset posisi Y
-            pdf.set_xy(x_before + col_widths[0] + col_widths[1], y_before)
-
-            # Kolom 3: JK
-            pdf.cell(col_widths[2], height, row['jenis_kelamin'], 1, 0, 'C')
-            # Kolom 4: Tempat Lahir
-            pdf.cell(col_widths[3], height, row['tempat_lahir'], 1, 0, 'L')
-            # Kolom 5: Tanggal Lahir
-            pdf.cell(col_widths[4], height, row['tanggal_lahir'], 1, 0, 'L')
-            # Kolom 6: Agama
-            pdf.cell(col_widths[5], height, row['agama'], 1, 0, 'L')
-            # Kolom 7: Status
-            pdf.cell(col_widths[6], height, row['status_perkawinan'], 1, 0, 'L')
-            # Kolom 8: Pendidikan
-            pdf.cell(col_widths[7], height, row['pendidikan'], 1, 0, 'L')
-            # Kolom 9: Pekerjaan
-            pdf.cell(col_widths[8], height, row['pekerjaan'], 1, 0, 'L')
-            # Kolom 10: Gol. Darah
-            pdf.cell(col_widths[9], height, row['golongan_darah'], 1, 0, 'C')
-            # Kolom 11: Hubungan
-            pdf.cell(col_widths[10], height, row['hubungan'], 1, 0, 'L')
-
-            # Pindah baris
-            pdf.ln(height)
-
-        # Footer
-        pdf.ln(10)
-        pdf.set_font("helvetica", 'I', 8)
-        pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
+    # Render per potongan KK di process pool, lalu digabung berurutan
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    potongan = cetak.potong_keluarga(chain([pertama], keluarga), current_user.username, waktu, bungkus_nama=True)
     safe_dusun = sanitize_filename(dusun)
-    filename = f"laporan/pdf/kk_dusun_{safe_dusun}.pdf"
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
+    data, nama_file, _ = cetak.cetak_paralel(cetak.render_keluarga, potongan, f"kk_dusun_{safe_dusun}")
+    conn.close()
+    catat_aktivitas(current_user.username, 'CETAK_KK_DUSUN', f"Dusun {dusun}")
+    return kirim_laporan(data, nama_file)
 
 @app.route('/cetak/kk/dusun')
 @login_required
@@ -1389,124 +1003,23 @@ def cetak_kk_per_dusun_form():
         flash("Anda tidak diizinkan mengakses fitur ini.", "danger")
         return redirect(url_for('index'))
 
-    # Ambil semua KK di dusun tersebut
+    # Ambil semua KK di dusun tersebut (satu query, dikelompokkan per KK)
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT DISTINCT nomor_kk FROM penduduk 
-        WHERE dusun = ? AND nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''
-        ORDER BY nomor_kk
-    """, (dusun,))
-    kk_rows = cursor.fetchall()
-    conn.close()
-
-    if not kk_rows:
+    keluarga = database.keluarga_berurutan(conn, dusun=dusun)
+    pertama = next(keluarga, None)
+    if pertama is None:
+        conn.close()
         flash(f"Tidak ada data KK di Dusun {dusun}.", "info")
         return redirect(url_for('cetak_pilihan'))
 
-    kks = [row['nomor_kk'] for row in kk_rows]
-
-    # Buat PDF
-    pdf = FPDF(orientation='L', unit='mm', format='A4')
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    for nomor_kk in kks:
-        conn = get_db()
-        rows = conn.execute("""
-            SELECT * FROM penduduk 
-            WHERE nomor_kk = ? 
-            ORDER BY CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END, nama
-        """, (nomor_kk,)).fetchall()
-        conn.close()
-
-        if not rows:
-            continue
-
-        pdf.add_page()
-
-        # Background watermark
-        pdf.set_text_color(230, 230, 230)
-        pdf.set_font("helvetica", 'B', 80)
-        pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
-        pdf.set_text_color(0, 0, 0)
-
-        # Logo
-        try:
-            pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
-        except:
-            pass
-
-        # Header
-        pdf.set_font("helvetica", 'B', 18)
-        pdf.cell(0, 10, "KARTU KELUARGA", ln=True, align='C')
-        pdf.set_font("helvetica", '', 14)
-        pdf.cell(0, 8, f"No. KK: {nomor_kk}", ln=True, align='C')
-        pdf.ln(10)
-
-        # Garis pemisah
-        pdf.set_draw_color(0, 0, 0)
-        pdf.line(10, 40, 290, 40)
-        pdf.ln(5)
-
-        # Tabel
-        pdf.set_font("helvetica", 'B', 9)
-        col_widths = [28, 35, 18, 25, 25, 18, 20, 20, 25, 20, 20]
-        headers = ["NIK", "Nama", "JK", "Tmpt Lahir", "Tgl Lahir", "Agama", "Status", "Pendidikan", "Pekerjaan", "Gol. Darah", "Hubungan"]
-        for i, h in enumerate(headers):
-            pdf.cell(col_widths[i], 8, h, 1, 0, 'C')
-        pdf.ln(8)
-
-        pdf.set_font("helvetica", '', 8)
-        for row in rows:
-            # Hitung tinggi baris berdasarkan nama
-            nama_lines = word_wrap(row['nama'], pdf, col_widths[1] - 1)
-            height = max(8, len(nama_lines) * 4)  # Minimal 8mm
-
-            x_before = pdf.get_x()
-            y_before = pdf.get_y()
-
-            # Kolom 1: NIK
-            pdf.cell(col_widths[0], height, str(row['nik']), 1, 0, 'L')
-
-            # Kolom 2: Nama (multi_cell)
-            pdf.set_xy(x_before + col_widths[0], y_before)
-            pdf.multi_cell(col_widths[1], 4, row['nama'], border=1, align='L')
-
-            # Reset posisi Y
-            pdf.set_xy(x_before + col_widths[0] + col_widths[1], y_before)
-
-            # Kolom 3: JK
-            pdf.cell(col_widths[2], height, row['jenis_kelamin'], 1, 0, 'C')
-            # Kolom 4: Tempat Lahir
-            pdf.cell(col_widths[3], height, row['tempat_lahir'], 1, 0, 'L')
-            # Kolom 5: Tanggal Lahir
-            pdf.cell(col_widths[4], height, row['tanggal_lahir'], 1, 0, 'L')
-            # Kolom 6: Agama
-            pdf.cell(col_widths[5], height, row['agama'], 1, 0, 'L')
-            # Kolom 7: Status
-            pdf.cell(col_widths[6], height, row['status_perkawinan'], 1, 0, 'L')
-            # Kolom 8: Pendidikan
-            pdf.cell(col_widths[7], height, row['pendidikan'], 1, 0, 'L')
-            # Kolom 9: Pekerjaan
-            pdf.cell(col_widths[8], height, row['pekerjaan'], 1, 0, 'L')
-            # Kolom 10: Gol. Darah
-            pdf.cell(col_widths[9], height, row['golongan_darah'], 1, 0, 'C')
-            # Kolom 11: Hubungan
-            pdf.cell(col_widths[10], height, row['hubungan'], 1, 0, 'L')
-
-            # Pindah baris
-            pdf.ln(height)
-
-        # Footer
-        pdf.ln(10)
-        pdf.set_font("helvetica", 'I', 8)
-        pdf.cell(0, 6, f"Dicetak oleh: {current_user.username} | Tanggal: {datetime.now().strftime('%d-%m-%Y %H:%M')}", 0, 1, 'C')
-
-    os.makedirs("laporan/pdf", exist_ok=True)
+    # Render per potongan KK di process pool, lalu digabung berurutan
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    potongan = cetak.potong_keluarga(chain([pertama], keluarga), current_user.username, waktu, bungkus_nama=True)
     safe_dusun = sanitize_filename(dusun)
-    filename = f"laporan/pdf/kk_dusun_{safe_dusun}.pdf"
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
+    data, nama_file, _ = cetak.cetak_paralel(cetak.render_keluarga, potongan, f"kk_dusun_{safe_dusun}")
+    conn.close()
+    catat_aktivitas(current_user.username, 'CETAK_KK_DUSUN', f"Dusun {dusun}")
+    return kirim_laporan(data, nama_file)
 
 @app.route('/statistik')
 @login_required
@@ -1514,101 +1027,50 @@ def statistik():
     conn = get_db()
     cursor = conn.cursor()
 
-    # Base query dan parameter
-    base_where = ""
-    params = ()
-
     # Filter berdasarkan role
-    if current_user.role == 'kepala_dusun':
-        base_where = "dusun = ?"
-        params = (current_user.dusun,)
-    elif current_user.role == 'masyarakat':
-        base_where = "nik = ?"
-        params = (current_user.nik_masyarakat,)
+    if current_user.role == 'masyarakat':
+        # Hanya data diri sendiri: hitung langsung
+        cursor.execute("SELECT COUNT(*) FROM penduduk WHERE nik = ?", (current_user.nik_masyarakat,))
+        total_jiwa = cursor.fetchone()[0]
+        cursor.execute("""SELECT COUNT(DISTINCT nomor_kk) FROM penduduk
+                          WHERE nik = ? AND nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''""",
+                       (current_user.nik_masyarakat,))
+        total_kk = cursor.fetchone()[0]
+        conn.close()
+        return render_template('statistik.html',
+            total_jiwa=total_jiwa,
+            total_kk=total_kk,
+            agama_data=[],
+            pendidikan_data=[],
+            dusun_summary={},
+            user_role=current_user.role
+        )
 
-    # 1. Total Jiwa
-    jiwa_query = "SELECT COUNT(*) FROM penduduk"
-    if base_where:
-        jiwa_query += " WHERE " + base_where
-    cursor.execute(jiwa_query, params)
-    total_jiwa = cursor.fetchone()[0]
-
-    # 2. Total KK
-    kk_query = "SELECT COUNT(DISTINCT nomor_kk) FROM penduduk"
-    kk_conditions = []
-    kk_params = list(params)
-
-    if base_where:
-        kk_conditions.append(base_where)
-    kk_conditions.append("nomor_kk IS NOT NULL")
-    kk_conditions.append("TRIM(nomor_kk) != ''")
-
-    if kk_conditions:
-        kk_query += " WHERE " + " AND ".join(kk_conditions)
-
-    cursor.execute(kk_query, kk_params)
-    total_kk = cursor.fetchone()[0]
-
-    # 3. Agama (hanya admin & kepala dusun)
-    if current_user.role in ['admin', 'kepala_dusun']:
-        agama_query = "SELECT agama, COUNT(*) as jumlah FROM penduduk"
-        if base_where:
-            agama_query += " WHERE " + base_where
-        agama_query += " GROUP BY agama ORDER BY jumlah DESC"
-        cursor.execute(agama_query, params)
-        agama_data = cursor.fetchall()
-    else:
-        agama_data = []
-
-    # 4. Pendidikan (hanya admin & kepala dusun)
-    if current_user.role in ['admin', 'kepala_dusun']:
-        pendidikan_query = "SELECT pendidikan, COUNT(*) as jumlah FROM penduduk"
-        if base_where:
-            pendidikan_query += " WHERE " + base_where
-        pendidikan_query += " GROUP BY pendidikan ORDER BY jumlah DESC"
-        cursor.execute(pendidikan_query, params)
-        pendidikan_data = cursor.fetchall()
-    else:
-        pendidikan_data = []
+    # Admin & kepala dusun: baca dari tabel agregat
+    lingkup = current_user.dusun if current_user.role == 'kepala_dusun' else '*'
 
-    # 5. Dusun Detail (hanya untuk admin)
-    if current_user.role == 'admin':
-        cursor.execute("""
-            SELECT 
-                dusun,
-                COUNT(*) as jiwa,
-                SUM(CASE WHEN jenis_kelamin = 'L' THEN 1 ELSE 0 END) as laki,
-                SUM(CASE WHEN jenis_kelamin = 'P' THEN 1 ELSE 0 END) as perempuan
-            FROM penduduk 
-            WHERE dusun IS NOT NULL AND TRIM(dusun) != ''
-            GROUP BY dusun 
-            ORDER BY dusun
-        """)
-        dusun_data = cursor.fetchall()
+    # 1. Total Jiwa & 2. Total KK
+    total_jiwa = database.hitung_statistik(conn, 'jiwa', lingkup)
+    total_kk = database.hitung_statistik(conn, 'kk', lingkup)
 
-        cursor.execute("""
-            SELECT dusun, COUNT(DISTINCT nomor_kk) as kk 
-            FROM penduduk 
-            WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != '' 
-              AND dusun IS NOT NULL AND TRIM(dusun) != ''
-            GROUP BY dusun 
-            ORDER BY dusun
-        """)
-        kk_per_dusun = cursor.fetchall()
+    # 3. Agama & 4. Pendidikan
+    agama_data = database.rincian_statistik(conn, 'agama', lingkup)
+    pendidikan_data = database.rincian_statistik(conn, 'pendidikan', lingkup)
 
+    # 5. Dusun Detail (hanya untuk admin)
+    if current_user.role == 'admin':
         dusun_summary = {}
-        for row in dusun_data:
-            dusun_summary[row['dusun']] = {
-                'jiwa': row['jiwa'],
-                'laki': row['laki'],
-                'perempuan': row['perempuan']
-            }
-        for row in kk_per_dusun:
-            if row['dusun'] in dusun_summary:
-                dusun_summary[row['dusun']]['kk'] = row['kk']
+        for dusun, jiwa in database.statistik_per_dusun(conn, 'jiwa'):
+            dusun_summary[dusun] = {'jiwa': jiwa, 'laki': 0, 'perempuan': 0}
+        for kunci, jk in (('laki', 'L'), ('perempuan', 'P')):
+            for dusun, jumlah in database.statistik_per_dusun(conn, 'jenis_kelamin', jk):
+                dusun_summary[dusun][kunci] = jumlah
+        for dusun, kk in database.statistik_per_dusun(conn, 'kk'):
+            if dusun in dusun_summary:
+                dusun_summary[dusun]['kk'] = kk
             else:
-                dusun_summary[row['dusun']] = {
-                    'jiwa': 0, 'laki': 0, 'perempuan': 0, 'kk': row['kk']
+                dusun_summary[dusun] = {
+                    'jiwa': 0, 'laki': 0, 'perempuan': 0, 'kk': kk
                 }
     else:
         dusun_summary = {}
@@ -1623,8 +1085,76 @@ def statistik():
         dusun_summary=dusun_summary,
         user_role=current_user.role
     )
-    
-    
+
+
+# --- API STATISTIK (JSON UNTUK GRAFIK DI BROWSER) ---
+JENIS_STATISTIK = ('dusun', 'agama', 'pendidikan', 'pertumbuhan')
+
+
+def total_statistik(conn):
+    """(total_jiwa, total_kk) sesuai hak akses; kartu dashboard dan /api/statistik memakai angka yang sama."""
+    if current_user.role == 'masyarakat':
+        total_jiwa = conn.execute("SELECT COUNT(*) FROM penduduk WHERE nik = ?",
+                                  (current_user.nik_masyarakat,)).fetchone()[0]
+        total_kk = conn.execute("""SELECT COUNT(DISTINCT nomor_kk) FROM penduduk
+                                   WHERE nik = ? AND nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''""",
+                                (current_user.nik_masyarakat,)).fetchone()[0]
+        return total_jiwa, total_kk
+    lingkup = current_user.dusun if current_user.role == 'kepala_dusun' else '*'
+    return database.hitung_statistik(conn, 'jiwa', lingkup), database.hitung_statistik(conn, 'kk', lingkup)
+
+
+def baris_statistik(conn, jenis):
+    """Baris (label, jumlah) satu jenis grafik sesuai hak akses, sama seperti statistik()."""
+    if current_user.role == 'masyarakat':
+        return []  # Hanya data diri sendiri: tidak ada rincian
+    lingkup = current_user.dusun if current_user.role == 'kepala_dusun' else '*'
+    if jenis == 'dusun':
+        return [row for row in database.statistik_per_dusun(conn, 'jiwa')
+                if lingkup == '*' or row['dusun'] == lingkup]
+    if jenis == 'pertumbuhan':
+        return database.rincian_statistik(conn, 'bulan', lingkup, urut='nilai')
+    return database.rincian_statistik(conn, jenis, lingkup)
+
+
+def data_statistik(conn, jenis):
+    """Seri grafik {'label': [...], 'jumlah': [...]} untuk /api/statistik."""
+    rows = baris_statistik(conn, jenis)
+    return {'label': [row[0] for row in rows], 'jumlah': [row[1] for row in rows]}
+
+
+def kirim_json(data):
+    """JSON dengan ETag: browser yang datanya belum berubah cukup dapat 304."""
+    response = jsonify(data)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Selalu validasi ulang, tanpa unduh ulang
+    return response.make_conditional(request)
+
+
+@app.route('/api/statistik')
+@login_required
+def api_statistik():
+    conn = get_db()
+    total_jiwa, total_kk = total_statistik(conn)
+    data = {'total_jiwa': total_jiwa, 'total_kk': total_kk}
+    for jenis in JENIS_STATISTIK:
+        data[jenis] = data_statistik(conn, jenis)
+    conn.close()
+    return kirim_json(data)
+
+
+@app.route('/api/statistik/<jenis>')
+@login_required
+def api_statistik_jenis(jenis):
+    if jenis not in JENIS_STATISTIK:
+        return jsonify({'error': 'Jenis statistik tidak dikenal'}), 404
+    conn = get_db()
+    data = data_statistik(conn, jenis)
+    conn.close()
+    return kirim_json(data)
+
+
 # --- TAMBAH USER (ADMIN SAJA) ---
 @app.route('/tambah/user', methods=['GET', 'POST'])
 @login_required
@@ -1672,112 +1202,36 @@ def tambah_user():
     return render_template('tambah_user.html')
     
 
-def create_charts(dusun_data, agama_data, pendidikan_data, pertumbuhan_data):
-    # Hapus grafik lama
-    chart_dir = 'static/charts'
-    if not os.path.exists(chart_dir):
-        os.makedirs(chart_dir)
-    
-    for f in os.listdir(chart_dir):
-        if f.startswith('chart_'):
-            os.remove(os.path.join(chart_dir, f))
-
-    # 1. Bar Chart: Jiwa per Dusun
-    if dusun_data:
-        plt.figure(figsize=(8, 5))
-        dusun = [row['dusun'] for row in dusun_data]
-        jumlah = [row['jumlah'] for row in dusun_data]
-        plt.bar(dusun, jumlah, color='skyblue')
-        plt.title('Jumlah Jiwa per Dusun')
-        plt.xlabel('Dusun')
-        plt.ylabel('Jumlah Jiwa')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig('static/charts/chart_dusun.png')
-        plt.close()
-
-    # 2. Pie Chart: Agama
-    if agama_data:
-        plt.figure(figsize=(8, 6))
-        agama = [row['agama'] for row in agama_data]
-        jumlah = [row['jumlah'] for row in agama_data]
-        plt.pie(jumlah, labels=agama, autopct='%1.1f%%', startangle=90)
-        plt.title('Persentase Agama')
-        plt.axis('equal')
-        plt.tight_layout()
-        plt.savefig('static/charts/chart_agama.png')
-        plt.close()
-
-    # 3. Bar Chart: Pendidikan
-    if pendidikan_data:
-        plt.figure(figsize=(10, 5))
-        pendidikan = [row['pendidikan'] for row in pendidikan_data]
-        jumlah = [row['jumlah'] for row in pendidikan_data]
-        plt.bar(pendidikan, jumlah, color='lightgreen')
-        plt.title('Pendidikan Terakhir Penduduk')
-        plt.xlabel('Pendidikan')
-        plt.ylabel('Jumlah')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig('static/charts/chart_pendidikan.png')
-        plt.close()
-
-    # 4. Line Chart: Pertumbuhan
-    if pertumbuhan_data:
-        plt.figure(figsize=(10, 5))
-        bulan = [row['bulan'] for row in pertumbuhan_data]
-        jumlah = [row['jumlah'] for row in pertumbuhan_data]
-        plt.plot(bulan, jumlah, marker='o', color='orange')
-        plt.title('Pertumbuhan Penduduk per Bulan')
-        plt.xlabel('Bulan')
-        plt.ylabel('Jumlah Penduduk Baru')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig('static/charts/chart_pertumbuhan.png')
-        plt.close()
-
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    # Semua angka dibaca dari tabel agregat (dijaga trigger), dibatasi hak akses seperti /api/statistik
     conn = get_db()
-    cursor = conn.cursor()
 
-    # 1. Jiwa per Dusun
-    cursor.execute("""
-        SELECT dusun, COUNT(*) as jumlah 
-        FROM penduduk 
-        WHERE dusun IS NOT NULL AND TRIM(dusun) != ''
-        GROUP BY dusun ORDER BY dusun
-    """)
-    dusun_data = cursor.fetchall()
+    # 1. Jiwa per Dusun (kepala dusun: hanya dusunnya)
+    dusun_data = baris_statistik(conn, 'dusun')
 
     # 2. Agama
-    cursor.execute("SELECT agama, COUNT(*) as jumlah FROM penduduk GROUP BY agama ORDER BY jumlah DESC")
-    agama_data = cursor.fetchall()
+    agama_data = baris_statistik(conn, 'agama')
 
     # 3. Pendidikan
-    cursor.execute("SELECT pendidikan, COUNT(*) as jumlah FROM penduduk GROUP BY pendidikan ORDER BY jumlah DESC")
-    pendidikan_data = cursor.fetchall()
+    pendidikan_data = baris_statistik(conn, 'pendidikan')
 
     # 4. Pertumbuhan per Bulan
-    cursor.execute("""
-        SELECT SUBSTR(tanggal_input, 1, 7) as bulan, COUNT(*) as jumlah 
-        FROM penduduk 
-        GROUP BY bulan ORDER BY bulan
-    """)
-    pertumbuhan_data = cursor.fetchall()
+    pertumbuhan_data = baris_statistik(conn, 'pertumbuhan')
 
-    # 🔴 Tambah: total_jiwa
-    cursor.execute("SELECT COUNT(*) FROM penduduk")
-    total_jiwa = cursor.fetchone()[0]
-    # ✅ Tambah: total_kk
-    cursor.execute("SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''")
-    total_kk = cursor.fetchone()[0]
+    # Kartu total_jiwa dan total_kk
+    total_jiwa, total_kk = total_statistik(conn)
 
     conn.close()
 
-    # Buat grafik
-    create_charts(dusun_data, agama_data, pendidikan_data, pertumbuhan_data)
+    # Mode 'browser': grafik digambar di browser dari /api/statistik, server tidak merender apa pun.
+    # Mode 'server': PNG matplotlib, hanya dirender ulang jika data agregatnya berubah.
+    file_grafik = None
+    if Config.GRAFIK_DASHBOARD == 'server':
+        import grafik  # matplotlib hanya dimuat di mode server
+        file_grafik = grafik.siapkan_grafik(dusun=dusun_data, agama=agama_data,
+                                            pendidikan=pendidikan_data, pertumbuhan=pertumbuhan_data)
 
     # 🔴 Kirim total_jiwa ke template
     return render_template('dashboard.html',
@@ -1785,40 +1239,43 @@ def dashboard():
                      agama_data=agama_data,
                      pendidikan_data=pendidikan_data,
                      pertumbuhan_data=pertumbuhan_data,
+                     file_grafik=file_grafik,
+                     refresh_grafik=Config.GRAFIK_REFRESH_DETIK,
                      total_jiwa=total_jiwa,
                      total_kk=total_kk)
 
+@app.route('/grafik/<nama_file>')
+@login_required
+def grafik_dashboard(nama_file):
+    # Nama file memuat hash data, jadi isinya tidak pernah berubah: boleh disimpan lama di browser
+    response = send_from_directory(Config.CHART_FOLDER, nama_file, max_age=Config.GRAFIK_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/cetak/statistik')
 @login_required
 def cetak_statistik():
     try:
         conn = get_db()
-        cursor = conn.cursor()
 
         # 1. Total Jiwa & KK
-        cursor.execute("SELECT COUNT(*) FROM penduduk")
-        total_jiwa = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''")
-        total_kk = cursor.fetchone()[0]
+        total_jiwa = database.hitung_statistik(conn, 'jiwa')
+        total_kk = database.hitung_statistik(conn, 'kk')
 
         # 2. Agama
-        cursor.execute("SELECT agama, COUNT(*) FROM penduduk GROUP BY agama ORDER BY COUNT(*) DESC")
-        agama_data = cursor.fetchall()
+        agama_data = database.rincian_statistik(conn, 'agama')
 
         # 3. Dusun
-        cursor.execute("""
-            SELECT dusun, COUNT(*) as jiwa 
-            FROM penduduk 
-            WHERE dusun IS NOT NULL AND TRIM(dusun) != ''
-            GROUP BY dusun ORDER BY dusun
-        """)
-        dusun_data = cursor.fetchall()
+        dusun_data = database.statistik_per_dusun(conn, 'jiwa')
 
         conn.close()
 
         # Buat PDF
+        from fpdf import FPDF
         pdf = FPDF(orientation='P', unit='mm', format='A4')
+        pdf.set_creation_date(cetak.waktu_dokumen())
         pdf.add_page()
         pdf.set_font("helvetica", 'B', 16)
         pdf.cell(0, 10, "STATISTIK KEPENDUDUKAN", ln=True, align='C')
@@ -1852,79 +1309,104 @@ def cetak_statistik():
         pdf.cell(0, 6, f"Dicetak pada: {datetime.now().strftime('%d-%m-%Y %H:%M')}", ln=True)
         pdf.cell(0, 6, f"Oleh: {current_user.username}", ln=True)
 
-        # Simpan PDF
-        os.makedirs("laporan/pdf", exist_ok=True)
-        filepath = "laporan/pdf/statistik.pdf"
-        pdf.output(filepath)
-
-        # Download file
-        return send_file(filepath, as_attachment=True)
+        # Download langsung dari memori
+        catat_aktivitas(current_user.username, 'CETAK_STATISTIK', "")
+        return kirim_laporan(bytes(pdf.output()), "statistik.pdf")
 
     except Exception as e:
         flash(f"Gagal cetak statistik: {str(e)}", "danger")
         return redirect(url_for('statistik'))
 
+# --- EKSPOR DATA ---
+def pilihan_ekspor(format_file):
+    """
+    Kolom (?kolom=nik,nama,dusun) dan filter dusun (?dusun=SATU&dusun=DUA) dari query string,
+    ditambah filter hak akses seperti index(). Kembalikan (kolom, kondisi, params).
+    404 jika format_file tidak tersedia (Parquet tanpa pyarrow).
+    ValueError jika ada kolom yang tidak dikenal.
+    """
+    if format_file not in ekspor.format_ekspor():
+        abort(404)
+    kolom = [k.strip() for k in request.args.get('kolom', '').split(',') if k.strip()] or None
+    salah = [k for k in kolom or [] if k not in ekspor.KOLOM_EKSPOR]
+    if salah:
+        raise ValueError(f"Kolom tidak dikenal: {', '.join(salah)}. Pilihan: {', '.join(ekspor.KOLOM_EKSPOR)}")
+
+    kondisi, params = [], []
+    if current_user.role == 'kepala_dusun':
+        kondisi.append("dusun = ?")
+        params.append(current_user.dusun)
+    elif current_user.role == 'masyarakat':
+        kondisi.append("nik = ?")
+        params.append(current_user.nik_masyarakat)
+    dusun = [d.strip() for d in request.args.getlist('dusun') if d.strip()]
+    if dusun:
+        kondisi.append(f"dusun IN ({', '.join('?' * len(dusun))})")
+        params += dusun
+    return kolom, kondisi, params
+
+
 @app.route('/ekspor/excel')
 @login_required
 def ekspor_excel():
     try:
-        # Buat folder ekspor jika belum ada
-        os.makedirs("ekspor", exist_ok=True)
-        
-        # Ambil data dari database
-        conn = get_db()
-        df = pd.read_sql_query("SELECT * FROM penduduk", conn)
-        conn.close()
+        kolom, kondisi, params = pilihan_ekspor('excel')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Jika tidak ada data
-        if df.empty:
+    try:
+        conn = get_db()
+        if not ekspor.ada_penduduk(conn, kondisi, params):
+            conn.close()
             flash("Tidak ada data untuk diekspor.", "warning")
             return redirect(url_for('index'))
 
-        # Bersihkan nama kolom
-        df = df.rename(columns={
-            'nomor_kk': 'Nomor KK',
-            'nik': 'NIK',
-            'nama': 'Nama',
-            'hubungan': 'Hubungan',
-            'jenis_kelamin': 'Jenis Kelamin',
-            'tempat_lahir': 'Tempat Lahir',
-            'tanggal_lahir': 'Tanggal Lahir',
-            'agama': 'Agama',
-            'status_perkawinan': 'Status Perkawinan',
-            'pendidikan': 'Pendidikan',
-            'pekerjaan': 'Pekerjaan',
-            'alamat': 'Alamat',
-            'rt_rw': 'RT/RW',
-            'dusun': 'Dusun',
-            'golongan_darah': 'Gol. Darah',
-            'kesejahteraan': 'Program Kesejahteraan',
-            'tanggal_input': 'Tanggal Input',
-            'foto_ktp': 'Foto KTP'
-        })
+        # Ditulis streaming ke file sementara (bukan DataFrame penuh), dihapus setelah terkirim
+        f = ekspor.tulis_excel(conn, kolom, kondisi, params)
+        conn.close()
 
         # Nama file: hindari karakter ilegal
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"data_penduduk_{timestamp}.xlsx"
-        filepath = os.path.join('ekspor', filename)
-
-        # Simpan ke Excel
-        try:
-            df.to_excel(filepath, index=False, sheet_name='Data Penduduk')
-        except Exception as e:
-            # Jika gagal karena path terlalu panjang
-            if "path too long" in str(e).lower() or "cannot save" in str(e).lower():
-                flash("Gagal ekspor: Path terlalu panjang. Coba simpan di folder lebih pendek.", "danger")
-            else:
-                flash(f"Gagal simpan file: {str(e)}", "danger")
-            return redirect(url_for('index'))
 
         # Download file
-        return send_file(filepath, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        catat_aktivitas(current_user.username, 'EKSPOR_EXCEL', filename)
+        return send_file(f, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
     except Exception as e:
         flash(f"Error saat ekspor: {str(e)}", "danger")
         return redirect(url_for('index'))
+
+
+@app.route('/ekspor/csv')
+@login_required
+def ekspor_csv():
+    try:
+        kolom, kondisi, params = pilihan_ekspor('csv')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"data_penduduk_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    catat_aktivitas(current_user.username, 'EKSPOR_CSV', filename)
+    # Baris dialirkan per halaman query, tidak pernah dikumpulkan utuh di memori
+    return Response(ekspor.baris_csv(kolom, kondisi, params), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/ekspor/parquet')
+@login_required
+def ekspor_parquet():
+    try:
+        kolom, kondisi, params = pilihan_ekspor('parquet')
+        conn = get_db()
+        f = ekspor.tulis_parquet(conn, kolom, kondisi, params)
+        conn.close()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f"data_penduduk_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+    catat_aktivitas(current_user.username, 'EKSPOR_PARQUET', filename)
+    return send_file(f, as_attachment=True, download_name=filename, mimetype='application/vnd.apache.parquet')
         
         
 import re
@@ -1992,13 +1474,7 @@ def progress():
     # ================================
     # 🔵 PROGRESS UTAMA (TANPA FILTER)
     # ================================
-    cursor.execute("""
-        SELECT dusun, COUNT(*) as jumlah 
-        FROM penduduk 
-        WHERE dusun IS NOT NULL AND TRIM(dusun) != ''
-        GROUP BY dusun
-    """)
-    data_dusun = cursor.fetchall()
+    data_dusun = database.statistik_per_dusun(conn, 'jiwa')
 
     progress_data = []
     total_terinput = 0  # Reset, akan diisi ulang
@@ -2111,6 +1587,8 @@ def hapus(nik):
             # Hapus dari penduduk
             cursor.execute("DELETE FROM penduduk WHERE nik = ?", (nik,))
             conn.commit()
+            cetak.hapus_cache_kk(row['nomor_kk'])
+            catat_aktivitas(current_user.username, 'HAPUS_PENDUDUK', f"Hapus: {nik} ({alasan})")
             flash(f"Data NIK {nik} berhasil dihapus!", "success")
         except Exception as e:
             conn.rollback()
@@ -2177,6 +1655,7 @@ def riwayat_hapus():
                         catat_aktivitas(current_user.username, 'ROLLBACK_HAPUS', f"Kembalikan data: {nik}")
                         
                         conn.commit()
+                        cetak.hapus_cache_kk(row['nomor_kk'])
                         flash(f"Data NIK {nik} berhasil dikembalikan!", "success")
                 
                 except Exception as e:
@@ -2205,6 +1684,7 @@ def log_aktivitas():
         flash("Akses ditolak.", "danger")
         return redirect(url_for('index'))
     
+    audit.flush()  # Tampilkan juga event yang masih di antrean
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute("""
@@ -2228,6 +1708,126 @@ def download_template(filename):
         flash("Template tidak ditemukan.", "danger")
         return redirect(url_for('upload'))   
         
+# --- PERINTAH CLI ---
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Terapkan migrasi skema yang belum dijalankan (flask db-upgrade)."""
+    conn = get_db()
+    diterapkan = migrations.upgrade(conn)
+    conn.close()
+    if diterapkan:
+        print(f"✅ Migrasi diterapkan: {', '.join(str(n) for n in diterapkan)}")
+    else:
+        print("✅ Skema sudah versi terbaru.")
+
+@app.cli.command('backup')
+def backup_command():
+    """Buat backup database sekarang (flask backup)."""
+    if not backup_db():
+        raise SystemExit("Backup gagal.")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """Tampilkan versi skema dan migrasi yang tertunda (flask db-status)."""
+    conn = get_db()
+    versi = migrations.versi_sekarang(conn)
+    conn.close()
+    print(f"Versi skema: {versi} (terbaru: {migrations.VERSI_TERBARU})")
+    for nomor, nama, _ in migrations.MIGRATIONS:
+        print(f"  {'✅' if nomor <= versi else '⏳'} {nomor:03d} {nama}")
+
+@app.cli.command('cek-index')
+def cek_index_command():
+    """Pastikan query utama memakai index penduduk (flask cek-index)."""
+    conn = get_db()
+    hasil = database.cek_query_plan(conn)
+    conn.close()
+    gagal = 0
+    for nama, ok, rencana in hasil:
+        print(f"{'✅' if ok else '❌'} {nama}: {rencana}")
+        if not ok:
+            gagal += 1
+    if gagal:
+        raise SystemExit(f"{gagal} query tidak memakai index yang diharapkan.")
+
+def ukur_impor_app(ulang=3, cwd=None):
+    """
+    Jalankan `python -X importtime -c "import app"` di subprocess, ambil percobaan tercepat.
+    cwd: folder kerja (desa.db dan folder data); modul app tetap dicari di app.root_path.
+    Kembalikan {nama modul: (waktu kumulatif us, kedalaman)}.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app.root_path, os.environ.get('PYTHONPATH')])))
+    terbaik = None
+    for _ in range(ulang):
+        proses = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                                cwd=cwd or app.root_path, env=env, capture_output=True, text=True)
+        if proses.returncode != 0:
+            raise RuntimeError(f"import app gagal:\n{proses.stderr[-2000:]}")
+        waktu = {}
+        for baris in proses.stderr.splitlines():
+            bagian = baris.removeprefix('import time:').split('|')
+            if len(bagian) != 3 or not bagian[1].strip().isdigit():
+                continue  # Baris judul atau keluaran lain
+            nama = bagian[2].rstrip()
+            waktu[nama.strip()] = (int(bagian[1]), (len(nama) - len(nama.lstrip())) // 2)
+        if terbaik is None or waktu['app'][0] < terbaik['app'][0]:
+            terbaik = waktu
+    return terbaik
+
+
+def periksa_impor_app(waktu):
+    """Daftar pelanggaran anggaran start-up (kosong jika lolos): modul berat ikut dimuat, atau terlalu lambat."""
+    gagal = []
+    berat = sorted({nama.split('.')[0] for nama in waktu} & set(Config.STARTUP_MODUL_BERAT))
+    if berat:
+        gagal.append(f"modul berat ikut dimuat saat start: {', '.join(berat)}")
+    total_ms = waktu['app'][0] / 1000
+    if total_ms > Config.STARTUP_MAX_MS:
+        gagal.append(f"import app {total_ms:.0f} ms melebihi anggaran {Config.STARTUP_MAX_MS} ms")
+    return gagal
+
+
+@app.cli.command('cek-impor')
+@click.option('--ulang', default=3, help='Ambil waktu tercepat dari beberapa percobaan.')
+def cek_impor_command(ulang):
+    """Ukur waktu 'import app' (python -X importtime) terhadap anggaran start-up (flask cek-impor)."""
+    try:
+        terbaik = ukur_impor_app(ulang)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+    total_ms = terbaik['app'][0] / 1000
+    print(f"import app: {total_ms:.0f} ms (anggaran {Config.STARTUP_MAX_MS} ms)")
+    langsung = sorted(((us, nama) for nama, (us, dalam) in terbaik.items() if dalam == 1), reverse=True)
+    for us, nama in langsung[:5]:
+        print(f"  {nama}: {us / 1000:.0f} ms")
+    gagal = periksa_impor_app(terbaik)
+    if gagal:
+        raise SystemExit("❌ " + "; ".join(gagal))
+    print("✅ Start-up dalam anggaran.")
+
+@app.cli.command('rebuild-statistik')
+def rebuild_statistik_command():
+    """Hitung ulang tabel agregat statistik dari data penduduk (flask rebuild-statistik)."""
+    conn = get_db()
+    database.rebuild_statistik(conn)
+    conn.commit()
+    conn.close()
+    print("✅ Tabel statistik dibangun ulang.")
+
+@app.cli.command('cek-statistik')
+def cek_statistik_command():
+    """Bandingkan tabel agregat dengan GROUP BY langsung (flask cek-statistik)."""
+    conn = get_db()
+    selisih = database.cek_statistik(conn)
+    conn.close()
+    if not selisih:
+        print("✅ Tabel statistik konsisten dengan data penduduk.")
+        return
+    for (dimensi, lingkup, nilai), tersimpan, live in selisih:
+        print(f"❌ {dimensi} [{lingkup}] {nilai!r}: tersimpan {tersimpan}, seharusnya {live}")
+    raise SystemExit(f"{len(selisih)} angka statistik tidak cocok. Jalankan: flask rebuild-statistik")
+
 # --- ERROR HANDLER ---
 @app.errorhandler(404)
 def not_found(error):
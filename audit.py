@@ -0,0 +1,145 @@
+# audit.py
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+from queue import Queue, Empty, Full
+from config import Config
+from database import pool, dengan_retry
+
+# --- LOG AKTIVITAS ASINKRON ---
+# Request hanya memasukkan event ke antrean; thread penulis menyimpannya per batch
+# dalam satu transaksi, jadi aksi admin tidak lagi menunggu fsync.
+
+_antrean = Queue(maxsize=Config.AUDIT_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+_SEGERA = object()  # Penanda dari flush(): simpan batch sekarang
+
+SQL_INSERT = '''INSERT INTO log_aktivitas (username, aksi, detail, timestamp)
+                VALUES (?, ?, ?, ?)'''
+
+
+def catat_aktivitas(username, aksi, detail=""):
+    """
+    Catat aktivitas user ke log_aktivitas (asinkron).
+    Jika antrean penuh, event ditulis langsung supaya tidak ada yang hilang; jika itu pun gagal
+    (database terkunci), request menunggu tempat di antrean.
+    """
+    # Format sama dengan DEFAULT CURRENT_TIMESTAMP (UTC), diambil saat aksi terjadi
+    waktu = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    event = (username, aksi, detail, waktu)
+    _pastikan_writer()
+    try:
+        _antrean.put_nowait(event)
+    except Full:
+        if not _tulis([event]):
+            _antrean.put(event)
+
+
+def _simpan(conn, events):
+    try:
+        conn.executemany(SQL_INSERT, events)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _tulis(events):
+    """Simpan events dalam satu transaksi, diulang jika database terkunci. Kembalikan True jika tersimpan."""
+    conn = pool.acquire()
+    try:
+        dengan_retry(conn, _simpan, conn, events)
+        return True
+    except Exception as e:
+        print(f"Error mencatat aktivitas: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+
+def _tulis_sampai_berhasil(events):
+    """
+    Batch tidak pernah dibuang (bisa sampai AUDIT_BATCH event): jika gagal, misalnya kunci tulis dipegang
+    impor atau backup lebih lama dari busy_timeout, diulang dengan jeda bertambah sampai tersimpan.
+    """
+    jeda = 1
+    while not _tulis(events):
+        time.sleep(jeda)
+        jeda = min(jeda * 2, 30)
+
+
+def _ambil_batch(tunggu):
+    """
+    Tunggu event pertama, lalu kumpulkan sampai AUDIT_BATCH atau jendela AUDIT_FLUSH_DETIK habis.
+    Kembalikan (events, jumlah item yang diambil dari antrean, termasuk penanda flush).
+    """
+    try:
+        item = _antrean.get(timeout=tunggu)
+    except Empty:
+        return [], 0
+    items = [item]
+    batas = time.monotonic() + Config.AUDIT_FLUSH_DETIK
+    while item is not _SEGERA and len(items) < Config.AUDIT_BATCH:
+        sisa = batas - time.monotonic()
+        if sisa <= 0:
+            break
+        try:
+            item = _antrean.get(timeout=sisa)
+        except Empty:
+            break
+        items.append(item)
+    return [e for e in items if e is not _SEGERA], len(items)
+
+
+def _run():
+    while True:
+        events, diambil = _ambil_batch(tunggu=60)
+        try:
+            if events:
+                _tulis_sampai_berhasil(events)
+        finally:
+            for _ in range(diambil):
+                _antrean.task_done()
+
+
+def _pastikan_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name='audit-writer', daemon=True)
+            _writer.start()
+
+
+def flush():
+    """
+    Tunggu sampai semua event yang sudah dicatat tersimpan (saat shutdown, atau sebelum log dibaca).
+    Penanda _SEGERA membuat penulis langsung menyimpan batch tanpa menunggu jendela habis.
+    """
+    if _writer is not None and _writer.is_alive():
+        try:
+            _antrean.put_nowait(_SEGERA)
+        except Full:
+            pass  # Antrean penuh: penulis tetap mengambil batch penuh tanpa menunggu
+        _antrean.join()
+        return
+    # Tidak ada penulis (mis. setelah fork): simpan langsung
+    while True:
+        events = []
+        while len(events) < Config.AUDIT_BATCH:
+            try:
+                item = _antrean.get_nowait()
+            except Empty:
+                break
+            _antrean.task_done()
+            if item is not _SEGERA:
+                events.append(item)
+        if not events:
+            return
+        _tulis_sampai_berhasil(events)
+
+
+atexit.register(flush)
@@ -0,0 +1,168 @@
+# backups.py
+import os
+import re
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from config import Config
+from database import pool
+
+try:
+    import fcntl  # Tidak ada di Windows
+except ImportError:
+    fcntl = None
+
+# Nama file: desa_YYYYmmdd_HHMMSS.db atau .db.gz (format lama tanpa kompresi tetap dikenali)
+POLA_BACKUP = re.compile(r'^desa_(\d{8}_\d{6})\.db(\.gz)?$')
+
+
+def daftar_backup(folder=None):
+    """List (waktu, path) semua file backup, terbaru di depan."""
+    folder = folder or Config.BACKUP_FOLDER
+    hasil = []
+    for nama in os.listdir(folder) if os.path.isdir(folder) else []:
+        cocok = POLA_BACKUP.match(nama)
+        if cocok:
+            waktu = datetime.strptime(cocok.group(1), "%Y%m%d_%H%M%S")
+            hasil.append((waktu, os.path.join(folder, nama)))
+    return sorted(hasil, reverse=True)
+
+
+def backup_db():
+    """
+    Backup online memakai SQLite backup API.
+    Disalin bertahap per BACKUP_PAGES_PER_STEP halaman dengan jeda, jadi penulis tidak tertahan
+    lama; hasilnya dicek dengan PRAGMA integrity_check lalu dikompres gzip.
+    Kembalikan path backup, atau None jika gagal.
+    """
+    with _backup_lock:
+        return _backup_db()
+
+
+def _backup_db():
+    os.makedirs(Config.BACKUP_FOLDER, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_path = os.path.join(Config.BACKUP_FOLDER, f"desa_{timestamp}.db.gz")
+    fd, tmp_path = tempfile.mkstemp(prefix='.desa_', suffix='.db.tmp', dir=Config.BACKUP_FOLDER)
+    os.close(fd)
+    gz_tmp_path = tmp_path + '.gz'
+    try:
+        src = pool.acquire()
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst, pages=Config.BACKUP_PAGES_PER_STEP, sleep=Config.BACKUP_SLEEP_PER_STEP)
+            dst.execute("PRAGMA journal_mode = DELETE")  # Salinan berdiri sendiri, tanpa file -wal
+            hasil = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        if hasil != 'ok':
+            raise RuntimeError(f"integrity_check gagal: {hasil}")
+
+        with open(tmp_path, 'rb') as f_in, gzip.open(gz_tmp_path, 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=1024 * 1024)
+        os.replace(gz_tmp_path, backup_path)
+        print(f"✅ Backup berhasil: {backup_path}")
+        terapkan_retensi()
+        return backup_path
+    except Exception as e:
+        print(f"❌ Gagal backup: {str(e)}")
+        return None
+    finally:
+        for path in (tmp_path, gz_tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def terapkan_retensi(folder=None):
+    """
+    Simpan backup harian terbaru (BACKUP_SIMPAN_HARIAN hari), satu per minggu
+    (BACKUP_SIMPAN_MINGGUAN minggu) dan satu per bulan (BACKUP_SIMPAN_BULANAN bulan).
+    Sisanya dihapus. Kembalikan list path yang dihapus.
+    """
+    folder = folder or Config.BACKUP_FOLDER
+    semua = daftar_backup(folder)
+    simpan = set()
+    hari, minggu, bulan = {}, {}, {}
+    for waktu, path in semua:  # Terbaru dulu: yang pertama per periode yang dipertahankan
+        hari.setdefault(waktu.date(), path)
+        minggu.setdefault(waktu.isocalendar()[:2], path)
+        bulan.setdefault((waktu.year, waktu.month), path)
+    for kunci in sorted(hari, reverse=True)[:Config.BACKUP_SIMPAN_HARIAN]:
+        simpan.add(hari[kunci])
+    for kunci in sorted(minggu, reverse=True)[:Config.BACKUP_SIMPAN_MINGGUAN]:
+        simpan.add(minggu[kunci])
+    for kunci in sorted(bulan, reverse=True)[:Config.BACKUP_SIMPAN_BULANAN]:
+        simpan.add(bulan[kunci])
+    if semua:
+        simpan.add(semua[0][1])  # Backup terbaru selalu disimpan
+
+    dihapus = []
+    for _, path in semua:
+        if path not in simpan:
+            try:
+                os.remove(path)
+                dihapus.append(path)
+            except OSError as e:
+                print(f"❌ Gagal hapus backup lama {path}: {str(e)}")
+
+    # Sisa file sementara dari proses yang mati di tengah backup
+    for nama in os.listdir(folder):
+        path = os.path.join(folder, nama)
+        if nama.startswith('.desa_') and time.time() - os.path.getmtime(path) > 3600:
+            os.remove(path)
+    return dihapus
+
+
+_backup_lock = threading.Lock()
+_scheduler_started = False
+_scheduler_lock_file = None
+
+
+def _ambil_kunci_scheduler():
+    """Hanya satu proses (worker) yang menjalankan jadwal backup."""
+    global _scheduler_lock_file
+    if fcntl is None:
+        return True
+    os.makedirs(Config.BACKUP_FOLDER, exist_ok=True)
+    f = open(os.path.join(Config.BACKUP_FOLDER, '.scheduler.lock'), 'w')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _scheduler_lock_file = f  # Tetap dibuka selama proses hidup
+    return True
+
+
+def start_backup_scheduler():
+    """
+    Jalankan thread backup berkala. Aman dipanggil berkali-kali dan dari banyak worker.
+    Setelah restart, backup hanya dibuat jika backup terakhir sudah lewat BACKUP_INTERVAL_JAM.
+    """
+    global _scheduler_started
+    if _scheduler_started:
+        return
+    _scheduler_started = True
+    if not _ambil_kunci_scheduler():
+        return
+    interval = Config.BACKUP_INTERVAL_JAM * 3600
+
+    def run():
+        time.sleep(Config.BACKUP_TUNDA_AWAL)  # Jangan membebani cold start
+        while True:
+            semua = daftar_backup()
+            umur = (datetime.now() - semua[0][0]).total_seconds() if semua else None
+            if umur is None or umur >= interval:
+                backup_db()
+                tunggu = interval
+            else:
+                tunggu = interval - umur
+            time.sleep(max(60, tunggu))
+
+    thread = threading.Thread(target=run, name='backup-scheduler', daemon=True)
+    thread.start()
@@ -0,0 +1,124 @@
+# bench.py
+# Pengukuran performa untuk pengembang, terpisah dari aplikasi:
+#   python bench.py validasi [--baris 100000]
+#   python bench.py cetak [--workers 1,2,4,8] [--ulang 1]
+#   python bench.py teks [--ulang 3]
+import argparse
+import os
+import time
+import timeit
+from datetime import datetime
+
+
+def bench_validasi(baris):
+    """Ukur validasi impor per kolom vs per baris."""
+    from app import get_db, validasi_data
+    from config import Config
+    from importer import ValidasiImpor
+    data = {
+        'nik': [str(9100000000000000 + i) for i in range(baris)],
+        'nomor_kk': [str(9200000000000000 + i // 4) for i in range(baris)],
+        'nama': ['WARGA CONTOH' if i % 50 else 'warga 1' for i in range(baris)],
+        'hubungan': ['Anak'] * baris,
+        'jenis_kelamin': ['L'] * baris,
+        'dusun': [['SATU', 'DUA', 'TIGA', 'EMPAT', 'LIMA'][i % 5] for i in range(baris)],
+    }
+    data['_baris'] = list(range(2, baris + 2))
+    conn = get_db()
+    validasi = ValidasiImpor(conn)
+    ukuran = Config.IMPOR_BACA_CHUNK
+    mulai = time.perf_counter()
+    ditolak = 0
+    for i in range(0, baris, ukuran):
+        _, salah, _ = validasi.periksa({k: v[i:i + ukuran] for k, v in data.items()})
+        ditolak += len(salah)
+    per_kolom = time.perf_counter() - mulai
+
+    # Pembanding: aturan yang sama satu baris demi satu baris, cek database per NIK
+    mulai = time.perf_counter()
+    terlihat = set()
+    for nama, nik, nomor_kk, dusun in zip(data['nama'], data['nik'], data['nomor_kk'], data['dusun']):
+        validasi_data(nama, nik, nomor_kk, dusun)
+        if nik not in terlihat:
+            terlihat.add(nik)
+            conn.execute("SELECT dusun FROM penduduk WHERE nik = ?", (nik,)).fetchone()
+    per_baris = time.perf_counter() - mulai
+    conn.close()
+    print(f"{baris} baris, {ditolak} ditolak")
+    print(f"  per kolom (ValidasiImpor): {per_kolom:.3f} detik")
+    print(f"  per baris (validasi_data + query per NIK): {per_baris:.3f} detik")
+
+
+def bench_cetak(workers, ulang):
+    """Ukur halaman/detik cetak semua KK untuk tiap jumlah proses."""
+    import cetak
+    import database
+    from config import Config
+    conn = database.get_db()
+    keluarga = list(database.keluarga_berurutan(conn)) * ulang
+    conn.close()
+    if not keluarga:
+        raise SystemExit("Tidak ada data KK untuk diukur.")
+    waktu = datetime.now().strftime('%d-%m-%Y %H:%M')
+    print(f"{len(keluarga)} KK, {os.cpu_count()} core, potongan {Config.CETAK_CHUNK_KK} KK, "
+          f"gabung: {'pypdf' if cetak.pdf_writer() else 'zip'}")
+    for jumlah in [int(w) for w in workers.split(',')]:
+        mulai = time.perf_counter()
+        # 1 proses = satu potongan tanpa penggabungan, sama seperti cetak serial
+        ukuran = Config.CETAK_CHUNK_KK if jumlah > 1 else len(keluarga)
+        potongan = cetak.potong_keluarga(keluarga, 'bench', waktu, ukuran=ukuran)
+        _, _, halaman = cetak.cetak_paralel(cetak.render_keluarga, potongan, 'bench_semua_kk', workers=jumlah)
+        detik = time.perf_counter() - mulai
+        print(f"  {jumlah} proses: {halaman} halaman, {detik:.2f} detik, {halaman / detik:.1f} halaman/detik")
+
+
+def bench_teks(ulang):
+    """Ukur ukur_teks pada teks data penduduk; pembanding: satu get_string_width fpdf per teks."""
+    import database
+    import ukur_teks
+    from fpdf import FPDF
+    conn = database.get_db()
+    teks = [r[0] for r in conn.execute(
+        "SELECT nama FROM penduduk UNION ALL SELECT COALESCE(pekerjaan, '-') FROM penduduk "
+        "UNION ALL SELECT COALESCE(alamat, '-') FROM penduduk")]
+    conn.close()
+    if not teks:
+        raise SystemExit("Tidak ada data penduduk untuk diukur.")
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", '', 8)
+
+    def ukur(fungsi):
+        terbaik = min(timeit.repeat(lambda: [fungsi(t) for t in teks], number=1, repeat=ulang))
+        return terbaik / len(teks) * 1e6
+
+    print(f"{len(teks)} teks, terbaik dari {ulang} kali (mikrodetik per teks)")
+    print(f"  get_string_width fpdf : {ukur(pdf.get_string_width):.2f}")
+    print(f"  ukuran_muat           : {ukur(lambda t: ukur_teks.ukuran_muat(t, 20, 7)):.2f}")
+    print(f"  word_wrap             : {ukur(lambda t: ukur_teks.word_wrap(t, pdf, 20)):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pengukuran performa aplikasi desa.")
+    sub = parser.add_subparsers(dest='perintah', required=True)
+    p = sub.add_parser('validasi', help='Validasi impor per kolom vs per baris.')
+    p.add_argument('--baris', type=int, default=100000, help='Jumlah baris sintetis.')
+    p = sub.add_parser('cetak', help='Halaman/detik cetak semua KK per jumlah proses.')
+    p.add_argument('--workers', default='1,2,4,8', help='Daftar jumlah proses, dipisah koma.')
+    p.add_argument('--ulang', type=int, default=1, help='Ulangi data KK agar dokumen lebih besar.')
+    p = sub.add_parser('teks', help='Kecepatan ukur teks PDF (ukur_teks).')
+    p.add_argument('--ulang', type=int, default=3, help='Jumlah pengulangan tiap pengukuran.')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.perintah == 'validasi':
+            bench_validasi(args.baris)
+        elif args.perintah == 'cetak':
+            bench_cetak(args.workers, args.ulang)
+        else:
+            bench_teks(args.ulang)
+
+
+if __name__ == "__main__":  # Wajib: worker cetak (forkserver) mengimpor ulang modul utama
+    main()
@@ -0,0 +1,569 @@
+# cetak.py
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import zipfile
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from config import Config
+from ukur_teks import shrink_font_for_fit, word_wrap
+
+# fpdf dan pypdf dimuat saat PDF pertama dibuat, bukan saat aplikasi start.
+
+
+# --- FUNGSI BANTUAN PDF ---
+def _pdf_baru():
+    from fpdf import FPDF
+    pdf = FPDF(orientation='L', unit='mm', format='A4')
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_creation_date(waktu_dokumen())
+    return pdf
+
+
+def waktu_dokumen():
+    """CreationDate PDF dibulatkan ke menit (sama dengan footer), supaya ETag tetap sama per isi."""
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+
+def _kop(pdf):
+    # Background watermark
+    pdf.set_text_color(230, 230, 230)
+    pdf.set_font("helvetica", 'B', 80)
+    pdf.text(30, 100, "NAGORI BAHAPAL RAYA")
+    pdf.set_text_color(0, 0, 0)
+
+    # Logo
+    try:
+        pdf.image('static/img/logo_desa.png', x=10, y=10, w=20)
+    except:
+        pass
+
+
+# --- HALAMAN KARTU KELUARGA ---
+KOLOM_KK = [28, 35, 18, 25, 25, 18, 20, 20, 25, 20, 20]
+HEADER_KK = ["NIK", "Nama", "JK", "Tmpt Lahir", "Tgl Lahir", "Agama", "Status", "Pendidikan", "Pekerjaan", "Gol. Darah", "Hubungan"]
+
+
+def halaman_kk(pdf, nomor_kk, rows, dicetak_oleh, waktu, bungkus_nama=False):
+    """
+    Satu halaman KK untuk cetak massal.
+    bungkus_nama=False: nama panjang dikecilkan fontnya (cetak semua KK);
+    True: nama dibungkus ke beberapa baris (cetak KK per dusun).
+    """
+    pdf.add_page()
+    _kop(pdf)
+
+    # Header
+    pdf.set_font("helvetica", 'B', 18)
+    pdf.cell(0, 10, "KARTU KELUARGA", new_x='LMARGIN', new_y='NEXT', align='C')
+    pdf.set_font("helvetica", '', 14)
+    pdf.cell(0, 8, f"No. KK: {nomor_kk}", new_x='LMARGIN', new_y='NEXT', align='C')
+    pdf.ln(10)
+
+    # Garis pemisah
+    pdf.set_draw_color(0, 0, 0)
+    pdf.line(10, 40, 290, 40)
+    pdf.ln(5)
+
+    # Tabel
+    col_widths = KOLOM_KK
+    pdf.set_font("helvetica", 'B', 9)
+    for i, h in enumerate(HEADER_KK):
+        pdf.cell(col_widths[i], 8, h, border=1, align='C')
+    pdf.ln(8)
+
+    pdf.set_font("helvetica", '', 8)
+    for row in rows:
+        if bungkus_nama:
+            _baris_kk_bungkus(pdf, row, col_widths)
+        else:
+            _baris_kk_ringkas(pdf, row, col_widths)
+
+    # Footer
+    pdf.ln(10)
+    pdf.set_font("helvetica", 'I', 8)
+    pdf.cell(0, 6, f"Dicetak oleh: {dicetak_oleh} | Tanggal: {waktu}", new_x='LMARGIN', new_y='NEXT', align='C')
+
+
+def _baris_kk_ringkas(pdf, row, col_widths):
+    # Kolom 1: NIK
+    pdf.cell(col_widths[0], 8, str(row['nik']), border=1, align='L')
+
+    # Kolom 2: Nama (font mengecil otomatis)
+    shrink_font_for_fit(pdf, row['nama'], col_widths[1] - 2, 8, 6)
+    pdf.cell(col_widths[1], 8, row['nama'], border=1, align='L')
+    # Reset font ke 8
+    pdf.set_font("helvetica", '', 8)
+
+    # Kolom 3: JK
+    pdf.cell(col_widths[2], 8, row['jenis_kelamin'], border=1, align='C')
+    # Kolom 4: Tempat Lahir
+    shrink_font_for_fit(pdf, row['tempat_lahir'], col_widths[3] - 2, 8, 6)
+    pdf.cell(col_widths[3], 8, row['tempat_lahir'], border=1, align='L')
+    pdf.set_font("helvetica", '', 8)
+    # Kolom 5: Tanggal Lahir
+    pdf.cell(col_widths[4], 8, row['tanggal_lahir'], border=1, align='L')
+    # Kolom 6: Agama
+    pdf.cell(col_widths[5], 8, row['agama'], border=1, align='L')
+    # Kolom 7: Status
+    pdf.cell(col_widths[6], 8, row['status_perkawinan'], border=1, align='L')
+    # Kolom 8: Pendidikan
+    pdf.cell(col_widths[7], 8, row['pendidikan'], border=1, align='L')
+    # Kolom 9: Pekerjaan
+    shrink_font_for_fit(pdf, row['pekerjaan'], col_widths[8] - 2, 8, 6)
+    pdf.cell(col_widths[8], 8, row['pekerjaan'], border=1, align='L')
+    pdf.set_font("helvetica", '', 8)
+    # Kolom 10: Gol. Darah
+    pdf.cell(col_widths[9], 8, row['golongan_darah'], border=1, align='C')
+    # Kolom 11: Hubungan
+    pdf.cell(col_widths[10], 8, row['hubungan'], border=1, align='L')
+
+    # Pindah baris
+    pdf.ln(8)
+
+
+def _baris_kk_bungkus(pdf, row, col_widths):
+    # Hitung tinggi baris berdasarkan nama
+    nama_lines = word_wrap(row['nama'], pdf, col_widths[1] - 1)
+    height = max(8, len(nama_lines) * 4)  # Minimal 8mm
+
+    x_before = pdf.get_x()
+    y_before = pdf.get_y()
+
+    # Kolom 1: NIK
+    pdf.cell(col_widths[0], height, str(row['nik']), border=1, align='L')
+
+    # Kolom 2: Nama (multi_cell)
+    pdf.set_xy(x_before + col_widths[0], y_before)
+    pdf.multi_cell(col_widths[1], 4, row['nama'], border=1, align='L')
+
+    # Reset posisi Y
+    pdf.set_xy(x_before + col_widths[0] + col_widths[1], y_before)
+
+    # Kolom 3: JK
+    pdf.cell(col_widths[2], height, row['jenis_kelamin'], border=1, align='C')
+    # Kolom 4: Tempat Lahir
+    pdf.cell(col_widths[3], height, row['tempat_lahir'], border=1, align='L')
+    # Kolom 5: Tanggal Lahir
+    pdf.cell(col_widths[4], height, row['tanggal_lahir'], border=1, align='L')
+    # Kolom 6: Agama
+    pdf.cell(col_widths[5], height, row['agama'], border=1, align='L')
+    # Kolom 7: Status
+    pdf.cell(col_widths[6], height, row['status_perkawinan'], border=1, align='L')
+    # Kolom 8: Pendidikan
+    pdf.cell(col_widths[7], height, row['pendidikan'], border=1, align='L')
+    # Kolom 9: Pekerjaan
+    pdf.cell(col_widths[8], height, row['pekerjaan'], border=1, align='L')
+    # Kolom 10: Gol. Darah
+    pdf.cell(col_widths[9], height, row['golongan_darah'], border=1, align='C')
+    # Kolom 11: Hubungan
+    pdf.cell(col_widths[10], height, row['hubungan'], border=1, align='L')
+
+    # Pindah baris
+    pdf.ln(height)
+
+
+def render_kk(nomor_kk, rows, dicetak_oleh=None, waktu=None):
+    """
+    PDF satu KK (cetak_kk): kolom No dan baris total anggota. Kembalikan bytes.
+    dicetak_oleh=None: tanpa footer (isi cache; footer dicap saat dikirim, lihat pdf_kk).
+    """
+    pdf = _pdf_baru()
+    pdf.add_page()
+    _kop(pdf)
+
+    # Header
+    pdf.set_font("helvetica", 'B', 18)
+    pdf.cell(0, 10, "KARTU KELUARGA", new_x='LMARGIN', new_y='NEXT', align='C')
+    pdf.set_font("helvetica", '', 14)
+    pdf.cell(0, 8, f"No. KK: {nomor_kk}", new_x='LMARGIN', new_y='NEXT', align='C')
+    pdf.ln(10)
+
+    # Garis pemisah
+    pdf.set_draw_color(0, 0, 0)
+    pdf.line(10, 40, 290, 40)
+    pdf.ln(5)
+
+    # Tabel
+    pdf.set_font("helvetica", 'B', 9)
+    col_widths = [10] + KOLOM_KK  # Tambah kolom No.
+    for i, h in enumerate(["No"] + HEADER_KK):
+        pdf.cell(col_widths[i], 8, h, border=1, align='C')
+    pdf.ln(8)
+
+    pdf.set_font("helvetica", '', 8)
+    for idx, row in enumerate(rows, 1):
+        # Kolom 1: No
+        pdf.cell(col_widths[0], 8, str(idx), border=1, align='C')
+        _baris_kk_ringkas(pdf, row, col_widths[1:])
+
+    # Total Anggota
+    pdf.set_font("helvetica", 'B', 8)
+    pdf.cell(col_widths[0] + col_widths[1], 8, f"Total Anggota: {len(rows)}", border=1, align='C')
+    pdf.cell(sum(col_widths[2:]), 8, "", 1)  # Gabungkan sisa kolom
+    pdf.ln(10)
+
+    if dicetak_oleh is not None:
+        _footer_kk(pdf, dicetak_oleh, waktu)
+    return bytes(pdf.output())
+
+
+def _footer_kk(pdf, dicetak_oleh, waktu):
+    """Footer cetak_kk di dasar halaman terakhir: posisinya tetap, jadi bisa dicap ke PDF dari cache."""
+    pdf.set_auto_page_break(False)
+    pdf.set_y(-12)
+    pdf.set_font("helvetica", 'I', 8)
+    pdf.cell(0, 6, f"Dicetak oleh: {dicetak_oleh} | Tanggal: {waktu}", align='C')
+
+
+def render_keluarga(keluarga, dicetak_oleh, waktu, bungkus_nama=False):
+    """Render satu potongan [(nomor_kk, anggota), ...] jadi PDF. Kembalikan (bytes, jumlah halaman)."""
+    pdf = _pdf_baru()
+    for nomor_kk, rows in keluarga:
+        halaman_kk(pdf, nomor_kk, rows, dicetak_oleh, waktu, bungkus_nama)
+    return bytes(pdf.output()), pdf.page_no()
+
+
+def potong_keluarga(keluarga, dicetak_oleh, waktu, bungkus_nama=False, ukuran=None):
+    """
+    Kelompokkan (nomor_kk, anggota) dari database.keluarga_berurutan() per CETAK_CHUNK_KK
+    jadi argumen render_keluarga. Baris diubah ke dict supaya bisa dikirim ke proses lain.
+    Dengan satu worker semuanya jadi satu potongan (tidak perlu digabung).
+    """
+    ukuran = ukuran or _ukuran_potongan(Config.CETAK_CHUNK_KK)
+    potongan = []
+    for nomor_kk, rows in keluarga:
+        potongan.append((nomor_kk, [dict(row) for row in rows]))
+        if ukuran and len(potongan) >= ukuran:
+            yield (potongan, dicetak_oleh, waktu, bungkus_nama)
+            potongan = []
+    if potongan:
+        yield (potongan, dicetak_oleh, waktu, bungkus_nama)
+
+
+def _ukuran_potongan(ukuran):
+    return ukuran if Config.CETAK_WORKERS > 1 else None
+
+
+# --- DAFTAR PENDUDUK ---
+def render_daftar(rows, nomor_awal, judul, total, dicetak_oleh, waktu, dengan_dusun=True):
+    """
+    Render satu potongan tabel daftar penduduk. Nomor urut dilanjutkan dari nomor_awal.
+    judul (list baris kop) hanya dicetak di potongan pertama, total + footer di potongan terakhir.
+    Kembalikan (bytes, jumlah halaman).
+    """
+    pdf = _pdf_baru()
+    pdf.add_page()
+    if judul:
+        _kop(pdf)
+
+        # Header
+        pdf.set_font("helvetica", 'B', 16)
+        pdf.cell(0, 10, judul[0], new_x='LMARGIN', new_y='NEXT', align='C')
+        for teks in judul[1:]:
+            pdf.set_font("helvetica", '', 12)
+            pdf.cell(0, 8, teks, new_x='LMARGIN', new_y='NEXT', align='C')
+        pdf.ln(10)
+
+    # Tabel
+    pdf.set_font("helvetica", 'B', 8)
+    if dengan_dusun:
+        col_widths = [10, 25, 28, 35, 25, 18, 20, 20, 25, 25, 30]
+        headers = ["No", "No. KK", "NIK", "Nama", "Hubungan", "JK", "Pendidikan", "Pekerjaan", "Dusun", "Alamat", "Kesejahteraan"]
+    else:
+        col_widths = [10, 25, 28, 35, 25, 18, 20, 20, 25, 30]
+        headers = ["No", "No. KK", "NIK", "Nama", "Hubungan", "JK", "Pendidikan", "Pekerjaan", "Alamat", "Kesejahteraan"]
+    for i, h in enumerate(headers):
+        pdf.cell(col_widths[i], 8, h, border=1, align='C')
+    pdf.ln(8)
+
+    pdf.set_font("helvetica", '', 7)
+    for idx, row in enumerate(rows, nomor_awal):
+        kolom = iter(col_widths)
+        # No, No. KK, NIK
+        pdf.cell(next(kolom), 8, str(idx), border=1, align='C')
+        pdf.cell(next(kolom), 8, str(row['nomor_kk'] or '-'), 1)
+        pdf.cell(next(kolom), 8, str(row['nik']), 1)
+        # Nama
+        lebar = next(kolom)
+        shrink_font_for_fit(pdf, row['nama'], lebar - 2, 7, 6)
+        pdf.cell(lebar, 8, row['nama'], 1)
+        pdf.set_font("helvetica", '', 7)
+        # Hubungan, JK, Pendidikan
+        pdf.cell(next(kolom), 8, str(row['hubungan'] or '-'), 1)
+        pdf.cell(next(kolom), 8, str(row['jenis_kelamin'] or '-'), 1)
+        pdf.cell(next(kolom), 8, str(row['pendidikan'] or '-'), 1)
+        # Pekerjaan
+        lebar = next(kolom)
+        shrink_font_for_fit(pdf, row['pekerjaan'] or '-', lebar - 2, 7, 6)
+        pdf.cell(lebar, 8, str(row['pekerjaan'] or '-'), 1)
+        pdf.set_font("helvetica", '', 7)
+        # Dusun
+        if dengan_dusun:
+            pdf.cell(next(kolom), 8, str(row['dusun']), 1)
+        # Alamat
+        lebar = next(kolom)
+        shrink_font_for_fit(pdf, row['alamat'] or '-', lebar - 2, 7, 6)
+        pdf.cell(lebar, 8, str(row['alamat'] or '-'), 1)
+        pdf.set_font("helvetica", '', 7)
+        # Kesejahteraan
+        lebar = next(kolom)
+        kesejahteraan = row['kesejahteraan'].replace(',', ', ') if row['kesejahteraan'] else '-'
+        shrink_font_for_fit(pdf, kesejahteraan, lebar - 2, 7, 6)
+        pdf.cell(lebar, 8, kesejahteraan, 1)
+        pdf.set_font("helvetica", '', 7)
+        pdf.ln(8)
+
+    if total:
+        # Total
+        pdf.set_font("helvetica", 'B', 8)
+        pdf.cell(col_widths[0] + sum(col_widths[1:4]), 8, total, border=1, align='C')
+        pdf.cell(sum(col_widths[4:]), 8, "", 1)  # Gabungkan sisa kolom
+        pdf.ln(10)
+
+        # Footer
+        pdf.set_font("helvetica", 'I', 8)
+        pdf.cell(0, 6, f"Dicetak oleh: {dicetak_oleh} | Tanggal: {waktu}", new_x='LMARGIN', new_y='NEXT', align='C')
+    return bytes(pdf.output()), pdf.page_no()
+
+
+def potong_daftar(rows, judul, label_total, dicetak_oleh, waktu, dengan_dusun=True, ukuran=None):
+    """
+    Bagi hasil query daftar penduduk per CETAK_CHUNK_BARIS jadi argumen render_daftar.
+    label_total(jumlah) -> teks baris total di potongan terakhir.
+    """
+    rows = [dict(row) for row in rows]
+    ukuran = ukuran or _ukuran_potongan(Config.CETAK_CHUNK_BARIS) or len(rows)
+    for awal in range(0, len(rows), ukuran):
+        akhir = awal + ukuran >= len(rows)
+        yield (rows[awal:awal + ukuran], awal + 1, judul if awal == 0 else None,
+               label_total(len(rows)) if akhir else None, dicetak_oleh, waktu, dengan_dusun)
+
+
+# --- RENDER PARALEL ---
+# Potongan dirender di process pool (fpdf2 murni Python, jadi thread tidak membantu karena GIL),
+# lalu digabung berurutan. Koneksi database tetap di proses web; worker hanya menerima dict.
+# Worker dibuat lewat forkserver/spawn, bukan fork: proses web sudah menjalankan thread (penulis audit,
+# jadwal backup, job impor) dan fork bisa mewarisi lock yang sedang dipegang thread itu, lalu macet.
+# Konsekuensinya modul utama (wsgi.py) diimpor ulang di worker: jalankan server hanya di bawah
+# `if __name__ == "__main__"`.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_proses(workers):
+    metode = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(metode))
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _pool_proses(Config.CETAK_WORKERS)
+        return _pool
+
+
+def _render_berurutan(fungsi, potongan, executor, workers):
+    """Yield hasil fungsi(*args) sesuai urutan potongan; maksimal 2x workers potongan di antrean."""
+    if executor is None:
+        for args in potongan:
+            yield fungsi(*args)
+        return
+    antre = deque()
+    for args in potongan:
+        antre.append(executor.submit(fungsi, *args))
+        if len(antre) >= workers * 2:
+            yield antre.popleft().result()
+    while antre:
+        yield antre.popleft().result()
+
+
+def cetak_paralel(fungsi, potongan, nama, workers=None):
+    """
+    Render setiap potongan dengan fungsi (render_keluarga / render_daftar) di process pool,
+    lalu gabungkan berurutan jadi satu PDF di memori (tidak ada file bersama antar request).
+    Tanpa pypdf, potongan dikemas berurutan dalam ZIP.
+    workers=None memakai pool bersama (CETAK_WORKERS); angka lain membuat pool sementara.
+    Kembalikan (bytes, nama file dengan ekstensi .pdf/.zip, jumlah halaman).
+    """
+    pool_sementara = None
+    if workers is None:
+        workers = Config.CETAK_WORKERS
+        executor = _executor() if workers > 1 else None
+    elif workers > 1:
+        executor = pool_sementara = _pool_proses(workers)
+    else:
+        executor = None
+
+    try:
+        hasil = _render_berurutan(fungsi, potongan, executor, workers)
+        pertama = next(hasil, None)
+        if pertama is None:
+            raise ValueError("Tidak ada data untuk dicetak.")
+        kedua = next(hasil, None)
+        if kedua is None:
+            # Hanya satu potongan: kirim apa adanya
+            return pertama[0], f"{nama}.pdf", pertama[1]
+
+        hasil = chain([pertama, kedua], hasil)
+        halaman = 0
+        buffer = io.BytesIO()
+        PdfWriter = pdf_writer()
+        if PdfWriter is not None:
+            writer = PdfWriter()
+            for data, jumlah in hasil:
+                writer.append(io.BytesIO(data))
+                halaman += jumlah
+            writer.write(buffer)
+            return buffer.getvalue(), f"{nama}.pdf", halaman
+
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+            for nomor, (data, jumlah) in enumerate(hasil, 1):
+                zf.writestr(f"{nama}_{nomor:03d}.pdf", data)
+                halaman += jumlah
+        return buffer.getvalue(), f"{nama}.zip", halaman
+    finally:
+        if pool_sementara is not None:
+            pool_sementara.shutdown()
+
+
+def pdf_writer():
+    """Kelas PdfWriter dari pypdf, atau None jika pypdf tidak terpasang (potongan dikirim sebagai ZIP)."""
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        return None
+    return PdfWriter
+
+
+# --- CACHE PDF KK ---
+# PDF cetak_kk disimpan tanpa footer, dengan nama = hash isi KK + versi template, jadi satu entri
+# dipakai semua petugas kapan pun dan data yang berubah otomatis menghasilkan kunci baru.
+# Footer (pencetak, waktu cetak) dicap di atas isi cache saat dikirim.
+# Penulisan ke KK tetap menghapus entri lamanya (hapus_cache_kk) agar ruang disk cepat kembali;
+# sisanya dibatasi LRU.
+VERSI_TEMPLATE_KK = 3  # Naikkan jika tata letak render_kk berubah
+KOLOM_CETAK_KK = ('nik', 'nama', 'jenis_kelamin', 'tempat_lahir', 'tanggal_lahir', 'agama',
+                  'status_perkawinan', 'pendidikan', 'pekerjaan', 'golongan_darah', 'hubungan')
+
+_ukuran_cache = None  # Perkiraan total byte cache di proses ini (None = belum dihitung)
+_cache_lock = threading.Lock()
+
+
+def _folder_kk(nomor_kk):
+    return os.path.join(Config.CACHE_KK_FOLDER, re.sub(r'[^0-9A-Za-z_-]', '_', str(nomor_kk)) or '_')
+
+
+def kunci_cache_kk(nomor_kk, rows):
+    """Hash isi baris yang dicetak (tanpa pencetak dan tanggal: footer tidak ikut di-cache)."""
+    h = hashlib.sha256(repr((VERSI_TEMPLATE_KK, nomor_kk)).encode())
+    for row in rows:
+        h.update(repr(tuple(row[k] for k in KOLOM_CETAK_KK)).encode())
+    return h.hexdigest()[:32]
+
+
+def ambil_cache_kk(nomor_kk, kunci):
+    """Isi PDF (tanpa footer) di cache, atau None. Waktu akses diperbarui untuk urutan LRU."""
+    path = os.path.join(_folder_kk(nomor_kk), f"{kunci}.pdf")
+    try:
+        os.utime(path)
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def stempel_kk(isi, dicetak_oleh, waktu):
+    """Cap footer ke halaman terakhir PDF KK tanpa footer. None jika pypdf tidak terpasang."""
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return None
+    pdf = _pdf_baru()
+    pdf.add_page()
+    _footer_kk(pdf, dicetak_oleh, waktu)
+    cap = PdfReader(io.BytesIO(bytes(pdf.output()))).pages[0]
+    writer = PdfWriter(clone_from=PdfReader(io.BytesIO(isi)))
+    writer.pages[-1].merge_page(cap)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def pdf_kk(nomor_kk, rows, dicetak_oleh, waktu):
+    """
+    PDF cetak_kk lengkap dengan footer. Isi tanpa footer diambil dari cache (atau dirender lalu
+    disimpan), footer dicap di atasnya. Tanpa pypdf footer tidak bisa dicap: dirender utuh tanpa cache.
+    Kembalikan (bytes, kunci cache).
+    """
+    kunci = kunci_cache_kk(nomor_kk, rows)
+    if pdf_writer() is None:
+        return render_kk(nomor_kk, rows, dicetak_oleh, waktu), kunci
+    isi = ambil_cache_kk(nomor_kk, kunci)
+    if isi is None:
+        isi = render_kk(nomor_kk, rows)
+        simpan_cache_kk(nomor_kk, kunci, isi)
+    return stempel_kk(isi, dicetak_oleh, waktu), kunci
+
+
+def simpan_cache_kk(nomor_kk, kunci, data):
+    """Simpan PDF ke cache (atomik), lalu buang entri terlama jika melewati CACHE_KK_MAX_MB."""
+    global _ukuran_cache
+    folder = _folder_kk(nomor_kk)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{kunci}.pdf")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    with _cache_lock:
+        if _ukuran_cache is not None:
+            _ukuran_cache += len(data)
+        if _ukuran_cache is None or _ukuran_cache > Config.CACHE_KK_MAX_MB * 1024 * 1024:
+            _ukuran_cache = _rapikan_cache(keep=path)
+    return path
+
+
+def _rapikan_cache(keep=None):
+    """Hapus file paling lama tidak diakses sampai total <= 90% batas. Kembalikan total byte."""
+    semua = []
+    for folder in os.scandir(Config.CACHE_KK_FOLDER):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue  # Baru dihapus proses lain
+            semua.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in semua)
+    batas = Config.CACHE_KK_MAX_MB * 1024 * 1024
+    if total <= batas:
+        return total
+    for _, size, path in sorted(semua):
+        if total <= batas * 0.9:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def hapus_cache_kk(*daftar_kk):
+    """Buang semua PDF cache untuk KK yang datanya baru ditulis."""
+    global _ukuran_cache
+    for nomor_kk in {kk for kk in daftar_kk if kk}:
+        shutil.rmtree(_folder_kk(nomor_kk), ignore_errors=True)
+    with _cache_lock:
+        _ukuran_cache = None
@@ -7,7 +7,66 @@ class Config:
     
     # Database
     DATABASE = 'desa.db'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))  # Jumlah koneksi idle yang disimpan
+    DB_BUSY_TIMEOUT = 10  # Detik menunggu kunci database sebelum menyerah
+    DB_RETRY = 3          # Percobaan ulang jika masih "database is locked"
+    # PRAGMA yang dipasang di setiap koneksi (urutan penting: journal_mode dulu)
+    DB_PRAGMAS = {
+        'journal_mode': 'WAL',      # Pembaca dan penulis bisa jalan bersamaan
+        'synchronous': 'NORMAL',    # Aman untuk WAL, jauh lebih sedikit fsync
+        'cache_size': -16000,       # 16 MB page cache per koneksi
+        'mmap_size': 67108864,      # 64 MB memory-mapped I/O
+        'temp_store': 'MEMORY',     # Sort/index sementara di memori
+        'recursive_triggers': 'ON', # INSERT OR REPLACE ikut memicu trigger DELETE
+    }
     
+    # Backup otomatis
+    BACKUP_INTERVAL_JAM = 24
+    BACKUP_TUNDA_AWAL = 60          # Detik setelah start sebelum cek backup pertama
+    BACKUP_PAGES_PER_STEP = 256     # Halaman disalin per langkah backup API
+    BACKUP_SLEEP_PER_STEP = 0.01    # Jeda antar langkah (detik) agar penulis tidak tertahan
+    BACKUP_SIMPAN_HARIAN = 7
+    BACKUP_SIMPAN_MINGGUAN = 4
+    BACKUP_SIMPAN_BULANAN = 12
+
+    # Log aktivitas asinkron
+    AUDIT_QUEUE_MAX = 10000  # Jika antrean penuh, event ditulis langsung
+    AUDIT_BATCH = 200  # Maksimal event per transaksi
+    AUDIT_FLUSH_DETIK = 1  # Jendela pengumpulan batch
+
+    # Impor Excel
+    IMPOR_CHUNK = 1000  # Baris per executemany
+    IMPOR_BACA_CHUNK = 5000  # Baris .xlsx yang dibaca dan di-commit per potongan
+    IMPOR_WORKERS = int(os.environ.get('IMPOR_WORKERS', 2))  # Job impor yang berjalan bersamaan
+    IMPOR_SIMPAN_LAPORAN_HARI = 7  # Umur workbook kesalahan impor sebelum dihapus
+    IMPOR_DETAK_DETIK = 10  # Interval heartbeat job impor milik proses yang masih hidup
+    IMPOR_DETAK_KADALUARSA_DETIK = 60  # Tanpa heartbeat selama ini: pemilik job dianggap mati
+
+    # Daftar penduduk (index)
+    HALAMAN_OFFSET_MAKS = 20  # Halaman terdalam yang dicapai lewat OFFSET (hasil pencarian, link lama tanpa cursor)
+
+    # Ekspor data penduduk
+    EKSPOR_CHUNK = 5000  # Baris per halaman query saat menulis file ekspor
+
+    # Cetak PDF massal (paralel antar proses)
+    # 0 = otomatis: jumlah core, maksimal 4 (container sering melaporkan jumlah core host, bukan kuotanya)
+    CETAK_WORKERS = int(os.environ.get('CETAK_WORKERS', 0)) or min(os.cpu_count() or 1, 4)
+    CETAK_CHUNK_KK = 50  # KK per potongan PDF yang dirender satu proses
+    CETAK_CHUNK_BARIS = 1000  # Baris daftar penduduk per potongan
+
+    # Cache PDF KK (cetak_kk)
+    CACHE_KK_MAX_MB = int(os.environ.get('CACHE_KK_MAX_MB', 200))  # Lewat batas: entri terlama dibuang
+
+    # Grafik dashboard
+    GRAFIK_DASHBOARD = os.environ.get('GRAFIK_DASHBOARD', 'browser')  # 'browser' (Chart.js) atau 'server' (PNG)
+    GRAFIK_MAX_AGE = 365 * 24 * 3600  # Detik cache browser untuk PNG (nama file berisi hash data)
+    GRAFIK_REFRESH_DETIK = 60  # Interval muat ulang data grafik di browser
+    GRAFIK_SIMPAN_LAMA_DETIK = 3600  # Versi PNG lama baru dihapus setelah ini (halaman terbuka masih memakainya)
+
+    # Anggaran start-up worker (flask cek-impor)
+    STARTUP_MAX_MS = int(os.environ.get('STARTUP_MAX_MS', 600))  # Waktu 'import app' maksimal
+    STARTUP_MODUL_BERAT = ('pandas', 'numpy', 'matplotlib', 'fpdf', 'PIL', 'openpyxl', 'pypdf', 'pyarrow')
+
     # Folder utama
     UPLOAD_FOLDER = 'static/uploads/foto'
     PDF_FOLDER = 'laporan/pdf'
@@ -15,6 +74,8 @@ class Config:
     CHART_FOLDER = 'static/charts'
     TEMPLATE_FOLDER = 'template'
     EKSPOR_FOLDER = 'ekspor'
+    IMPOR_FOLDER = 'impor'  # File upload yang menunggu diproses job impor
+    CACHE_KK_FOLDER = 'laporan/cache_kk'
 
     @staticmethod
     def init_app(app):
@@ -28,7 +89,9 @@ class Config:
             'backup',
             'static/charts',
             'template',
-            'ekspor'
+            'ekspor',
+            'impor',
+            'laporan/cache_kk'
         ]
         
         for folder in folders:
@@ -0,0 +1,466 @@
+# database.py
+import sqlite3
+import threading
+import time
+from itertools import groupby
+from queue import Queue, Empty, Full
+from flask import g, has_app_context
+from config import Config
+
+
+def is_locked_error(e):
+    pesan = str(e).lower()
+    return 'locked' in pesan or 'busy' in pesan
+
+
+def dengan_retry(conn, fungsi, *args):
+    """
+    Jalankan fungsi database, ulangi dengan jeda bertambah jika database terkunci.
+    busy_timeout sudah menunggu di level SQLite; ini lapisan terakhir saat antrean panjang.
+    Hanya di luar transaksi: di dalam transaksi yang sudah terbuka, snapshot WAL-nya bisa sudah usang
+    (SQLITE_BUSY_SNAPSHOT) dan pernyataan yang sama baru berhasil setelah rollback, jadi error
+    langsung diteruskan ke pemanggil. conn=None (COMMIT): selalu boleh diulang.
+    """
+    if conn is not None and conn.in_transaction:
+        return fungsi(*args)
+    for percobaan in range(Config.DB_RETRY + 1):
+        try:
+            return fungsi(*args)
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e) or percobaan == Config.DB_RETRY:
+                raise
+            if conn is not None and conn.in_transaction:
+                conn.rollback()  # Transaksi implisit yang dibuka pernyataan ini sendiri
+            time.sleep(0.1 * (2 ** percobaan))
+
+
+class RetryCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        return dengan_retry(self.connection, super().execute, *args)
+
+    def executemany(self, *args):
+        return dengan_retry(self.connection, super().executemany, *args)
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Koneksi SQLite yang dipinjam dari pool.
+    close() tidak benar-benar menutup file, tapi mengembalikan koneksi ke pool.
+    Selama request berjalan, close() diabaikan; koneksi dikembalikan saat teardown.
+    """
+    pool = None
+    terikat_request = False
+
+    def cursor(self, factory=RetryCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return dengan_retry(self, super().execute, *args)
+
+    def executemany(self, *args):
+        return dengan_retry(self, super().executemany, *args)
+
+    def commit(self):
+        return dengan_retry(None, super().commit)
+
+    def close(self):
+        if self.terikat_request:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            self.tutup_permanen()
+
+    def tutup_permanen(self):
+        sqlite3.Connection.close(self)
+
+
+def configure_connection(conn):
+    """Pasang PRAGMA penyimpanan dari Config.DB_PRAGMAS di koneksi baru."""
+    for nama, nilai in Config.DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {nama} = {nilai}")
+
+
+class ConnectionPool:
+    """
+    Pool koneksi SQLite sederhana.
+    Koneksi dibuat sekali, dikonfigurasi sekali, lalu dipakai ulang antar request.
+    """
+
+    def __init__(self, database, max_idle=5):
+        self.database = database
+        self.max_idle = max_idle
+        self._idle = Queue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self.dibuat = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=Config.DB_BUSY_TIMEOUT,
+                               factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        configure_connection(conn)
+        conn.pool = self
+        with self._lock:
+            self.dibuat += 1
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Koneksi rusak, jangan dikembalikan ke pool
+            conn.tutup_permanen()
+            return
+        conn.terikat_request = False
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.tutup_permanen()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().tutup_permanen()
+            except Empty:
+                break
+
+
+pool = ConnectionPool(Config.DATABASE, max_idle=Config.DB_POOL_SIZE)
+
+
+def get_db():
+    """
+    Ambil koneksi database.
+    Di dalam request: satu koneksi yang sama untuk seluruh request (disimpan di g).
+    Di luar request (startup, thread background): koneksi pinjaman, kembalikan dengan close().
+    """
+    if has_app_context():
+        if '_db' not in g:
+            conn = pool.acquire()
+            conn.terikat_request = True
+            g._db = conn
+        return g._db
+    return pool.acquire()
+
+
+def close_db(exception=None):
+    conn = g.pop('_db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+# --- INDEX PENDUDUK ---
+# Urutan keluarga yang dipakai di index(), cetak_kk() dan laporan per dusun
+URUT_KELUARGA = "CASE WHEN hubungan='Kepala Keluarga' THEN 0 ELSE 1 END"
+
+PENDUDUK_INDEXES = {
+    'idx_penduduk_kk_urut': f"penduduk (nomor_kk, ({URUT_KELUARGA}), nama)",
+    'idx_penduduk_dusun_kk_urut': f"penduduk (dusun, nomor_kk, ({URUT_KELUARGA}), nama)",
+    'idx_penduduk_dusun_jk': "penduduk (dusun, jenis_kelamin)",
+    'idx_penduduk_nama': "penduduk (nama)",
+    'idx_penduduk_dusun_nama': "penduduk (dusun, nama)",
+    'idx_penduduk_tanggal_input': "penduduk (tanggal_input)",
+}
+
+
+def ensure_indexes(conn):
+    """Buat index sekunder penduduk yang belum ada, lalu perbarui statistik planner. Commit oleh pemanggil."""
+    for nama, definisi in PENDUDUK_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {nama} ON {definisi}")
+    conn.execute("ANALYZE penduduk")
+
+
+# --- KELUARGA BERURUTAN (CETAK KK MASSAL) ---
+SQL_KELUARGA = f"""SELECT * FROM penduduk
+    WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != '' {{filter}}
+    ORDER BY nomor_kk, {URUT_KELUARGA}, nama"""
+
+
+def keluarga_berurutan(conn, dusun=None, nik=None):
+    """
+    Baca semua keluarga dengan satu query berurutan (index idx_penduduk_kk_urut),
+    lalu kelompokkan per KK sambil membaca cursor. Yield (nomor_kk, list anggota).
+    dusun / nik: hanya KK yang punya anggota di dusun itu / KK milik NIK itu;
+    seluruh anggota KK tetap ikut, sama seperti cetak_kk().
+    """
+    filter_sql, params = "", ()
+    if dusun is not None:
+        filter_sql, params = "AND nomor_kk IN (SELECT nomor_kk FROM penduduk WHERE dusun = ?)", (dusun,)
+    elif nik is not None:
+        filter_sql, params = "AND nomor_kk IN (SELECT nomor_kk FROM penduduk WHERE nik = ?)", (nik,)
+    cursor = conn.cursor()
+    cursor.execute(SQL_KELUARGA.format(filter=filter_sql), params)
+    for nomor_kk, anggota in groupby(cursor, key=lambda row: row['nomor_kk']):
+        yield nomor_kk, list(anggota)
+
+
+# --- PENCARIAN FULL-TEXT (FTS5) ---
+FTS_MIN_PANJANG = 3  # Tokenizer trigram butuh minimal 3 karakter
+
+FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS penduduk_fts_ai AFTER INSERT ON penduduk BEGIN
+        INSERT INTO penduduk_fts (rowid, nama, nik, nomor_kk, alamat)
+        VALUES (new.id, new.nama, new.nik, new.nomor_kk, new.alamat);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS penduduk_fts_ad AFTER DELETE ON penduduk BEGIN
+        INSERT INTO penduduk_fts (penduduk_fts, rowid, nama, nik, nomor_kk, alamat)
+        VALUES ('delete', old.id, old.nama, old.nik, old.nomor_kk, old.alamat);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS penduduk_fts_au AFTER UPDATE OF id, nama, nik, nomor_kk, alamat ON penduduk BEGIN
+        INSERT INTO penduduk_fts (penduduk_fts, rowid, nama, nik, nomor_kk, alamat)
+        VALUES ('delete', old.id, old.nama, old.nik, old.nomor_kk, old.alamat);
+        INSERT INTO penduduk_fts (rowid, nama, nik, nomor_kk, alamat)
+        VALUES (new.id, new.nama, new.nik, new.nomor_kk, new.alamat);
+    END""",
+]
+
+
+def ensure_fts(conn):
+    """
+    Buat tabel bayangan penduduk_fts (trigram) + trigger sinkronisasi.
+    Saat tabel baru dibuat, isi langsung dari data penduduk yang sudah ada.
+    """
+    ada = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'penduduk_fts'").fetchone()
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS penduduk_fts USING fts5 (
+        nama, nik, nomor_kk, alamat,
+        content = 'penduduk', content_rowid = 'id', tokenize = 'trigram'
+    )""")
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger)
+    if not ada:
+        conn.execute("INSERT INTO penduduk_fts (penduduk_fts) VALUES ('rebuild')")
+
+
+def fts_query(teks):
+    """Ubah kata kunci jadi frasa FTS5 (cocok sebagai substring di kolom mana pun)."""
+    return '"' + teks.replace('"', '""') + '"'
+
+
+# Query penting beserta index yang harus dipakai planner
+EXPECTED_PLANS = [
+    ("Daftar per KK (index)",
+     f"SELECT nomor_kk, nik, nama FROM penduduk ORDER BY nomor_kk, {URUT_KELUARGA}, nama LIMIT 50",
+     (), 'idx_penduduk_kk_urut'),
+    ("Daftar per KK kepala dusun (index)",
+     f"SELECT nomor_kk, nik, nama FROM penduduk WHERE dusun = ? ORDER BY nomor_kk, {URUT_KELUARGA}, nama LIMIT 50",
+     ('SATU',), 'idx_penduduk_dusun_kk_urut'),
+    ("Daftar per NIK (index)",
+     "SELECT nomor_kk, nik, nama FROM penduduk ORDER BY nama LIMIT 50",
+     (), 'idx_penduduk_nama'),
+    ("Daftar per NIK kepala dusun, halaman berikut (index)",
+     "SELECT nomor_kk, nik, nama FROM penduduk WHERE dusun = ? AND (nama, id) > (?, ?) ORDER BY nama, id LIMIT 50",
+     ('SATU', 'A', 0), 'idx_penduduk_dusun_nama'),
+    ("Anggota satu KK (cetak_kk)",
+     f"SELECT * FROM penduduk WHERE nomor_kk = ? ORDER BY {URUT_KELUARGA}, nama",
+     ('0',), 'idx_penduduk_kk_urut'),
+    ("Semua KK satu dusun (cetak KK massal)",
+     SQL_KELUARGA.format(filter="AND nomor_kk IN (SELECT nomor_kk FROM penduduk WHERE dusun = ?)"),
+     ('SATU',), 'idx_penduduk_kk_urut'),
+    ("Daftar semua penduduk (cetak_daftar_semua)",
+     f"SELECT nomor_kk, nik, nama FROM penduduk ORDER BY dusun, nomor_kk, {URUT_KELUARGA}, nama",
+     (), 'idx_penduduk_dusun_kk_urut'),
+    ("Jiwa & gender per dusun (statistik)",
+     """SELECT dusun, COUNT(*), SUM(CASE WHEN jenis_kelamin = 'L' THEN 1 ELSE 0 END)
+        FROM penduduk WHERE dusun IS NOT NULL AND TRIM(dusun) != '' GROUP BY dusun ORDER BY dusun""",
+     (), 'idx_penduduk_dusun_jk'),
+    ("KK per dusun (statistik)",
+     """SELECT dusun, COUNT(DISTINCT nomor_kk) FROM penduduk
+        WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != '' AND dusun IS NOT NULL AND TRIM(dusun) != ''
+        GROUP BY dusun ORDER BY dusun""",
+     (), 'idx_penduduk_dusun_kk_urut'),
+    ("Total KK",
+     "SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE nomor_kk IS NOT NULL AND TRIM(nomor_kk) != ''",
+     (), 'idx_penduduk_kk_urut'),
+    ("Input per tanggal (progress)",
+     "SELECT COUNT(*) FROM penduduk WHERE tanggal_input BETWEEN ? AND ?",
+     ('2025-01-01', '2025-12-31'), 'idx_penduduk_tanggal_input'),
+]
+
+
+def cek_query_plan(conn):
+    """
+    Jalankan EXPLAIN QUERY PLAN untuk setiap query di EXPECTED_PLANS.
+    Kembalikan list (nama, ok, rencana). ok=False jika index yang diharapkan tidak dipakai
+    atau SQLite masih butuh temp B-tree untuk ORDER BY.
+    """
+    hasil = []
+    for nama, sql, params, index in EXPECTED_PLANS:
+        rencana = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        teks = " | ".join(rencana)
+        ok = index in teks and 'TEMP B-TREE FOR ORDER BY' not in teks
+        hasil.append((nama, ok, teks))
+    return hasil
+
+
+# --- STATISTIK (TABEL AGREGAT) ---
+# Hitungan per dimensi dijaga trigger, jadi halaman statistik cukup membaca beberapa baris.
+# lingkup: '*' untuk seluruh desa, atau nama dusun (IFNULL(dusun, '')).
+STATISTIK_DIMENSI = {
+    'jiwa': "''",
+    'agama': "IFNULL({r}.agama, '')",
+    'pendidikan': "IFNULL({r}.pendidikan, '')",
+    'jenis_kelamin': "IFNULL({r}.jenis_kelamin, '')",
+    'bulan': "IFNULL(SUBSTR({r}.tanggal_input, 1, 7), '')",
+}
+STATISTIK_LINGKUP = ["'*'", "IFNULL({r}.dusun, '')"]
+KK_VALID = "TRIM(IFNULL({r}.nomor_kk, '')) != ''"
+
+
+def _statistik_perubahan(r, tanda):
+    """Pernyataan SQL untuk menambah (tanda=+1) atau mengurangi (-1) hitungan baris r (new/old)."""
+    sql = []
+    for dimensi, nilai in STATISTIK_DIMENSI.items():
+        for lingkup in STATISTIK_LINGKUP:
+            sql.append(f"""INSERT INTO statistik (dimensi, lingkup, nilai, jumlah)
+                VALUES ('{dimensi}', {lingkup.format(r=r)}, {nilai.format(r=r)}, {tanda})
+                ON CONFLICT (dimensi, lingkup, nilai) DO UPDATE SET jumlah = jumlah + excluded.jumlah;""")
+    # KK dihitung unik: statistik_kk menyimpan jumlah anggota per KK,
+    # hitungan 'kk' berubah hanya saat anggota naik dari 0 ke 1 atau turun ke 0
+    for lingkup in STATISTIK_LINGKUP:
+        lingkup = lingkup.format(r=r)
+        if tanda > 0:
+            sql.append(f"""INSERT INTO statistik_kk (nomor_kk, lingkup, anggota)
+                SELECT {r}.nomor_kk, {lingkup}, 1 WHERE {KK_VALID.format(r=r)}
+                ON CONFLICT (nomor_kk, lingkup) DO UPDATE SET anggota = anggota + 1;""")
+            syarat = "anggota = 1"
+        else:
+            sql.append(f"""UPDATE statistik_kk SET anggota = anggota - 1
+                WHERE nomor_kk = {r}.nomor_kk AND lingkup = {lingkup};""")
+            syarat = "anggota = 0"
+        sql.append(f"""INSERT INTO statistik (dimensi, lingkup, nilai, jumlah)
+            SELECT 'kk', {lingkup}, '', {tanda} FROM statistik_kk
+            WHERE nomor_kk = {r}.nomor_kk AND lingkup = {lingkup} AND {syarat}
+            ON CONFLICT (dimensi, lingkup, nilai) DO UPDATE SET jumlah = jumlah + excluded.jumlah;""")
+    return "\n".join(sql)
+
+
+def _statistik_triggers():
+    kolom = "nomor_kk, dusun, agama, pendidikan, jenis_kelamin, tanggal_input"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS penduduk_statistik_ai AFTER INSERT ON penduduk BEGIN
+            {_statistik_perubahan('new', 1)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS penduduk_statistik_ad AFTER DELETE ON penduduk BEGIN
+            {_statistik_perubahan('old', -1)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS penduduk_statistik_au AFTER UPDATE OF {kolom} ON penduduk BEGIN
+            {_statistik_perubahan('old', -1)}
+            {_statistik_perubahan('new', 1)}
+        END""",
+    ]
+
+
+def ensure_statistik(conn):
+    """Buat tabel agregat + trigger. Jika tabel baru dibuat, isi dari data yang ada."""
+    ada = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'statistik'").fetchone()
+    conn.execute("""CREATE TABLE IF NOT EXISTS statistik (
+        dimensi TEXT NOT NULL,
+        lingkup TEXT NOT NULL,
+        nilai TEXT NOT NULL,
+        jumlah INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimensi, lingkup, nilai)
+    ) WITHOUT ROWID""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS statistik_kk (
+        nomor_kk TEXT NOT NULL,
+        lingkup TEXT NOT NULL,
+        anggota INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (nomor_kk, lingkup)
+    ) WITHOUT ROWID""")
+    for trigger in _statistik_triggers():
+        conn.execute(trigger)
+    if not ada:
+        rebuild_statistik(conn)
+
+
+def _statistik_live(conn):
+    """Hitung ulang semua agregat langsung dari penduduk: {(dimensi, lingkup, nilai): jumlah}."""
+    hasil = {}
+    for dimensi, nilai in STATISTIK_DIMENSI.items():
+        for lingkup in STATISTIK_LINGKUP:
+            sql = f"""SELECT {lingkup.format(r='p')}, {nilai.format(r='p')}, COUNT(*)
+                      FROM penduduk p GROUP BY 1, 2"""
+            for lk, nl, jumlah in conn.execute(sql):
+                hasil[(dimensi, lk, nl)] = jumlah
+    for lingkup in STATISTIK_LINGKUP:
+        sql = f"""SELECT {lingkup.format(r='p')}, COUNT(DISTINCT p.nomor_kk)
+                  FROM penduduk p WHERE {KK_VALID.format(r='p')} GROUP BY 1"""
+        for lk, jumlah in conn.execute(sql):
+            hasil[('kk', lk, '')] = jumlah
+    return hasil
+
+
+def rebuild_statistik(conn):
+    """Kosongkan dan isi ulang tabel agregat dari data penduduk. Commit oleh pemanggil."""
+    conn.execute("DELETE FROM statistik")
+    conn.execute("DELETE FROM statistik_kk")
+    conn.executemany("INSERT INTO statistik (dimensi, lingkup, nilai, jumlah) VALUES (?, ?, ?, ?)",
+                     [kunci + (jumlah,) for kunci, jumlah in _statistik_live(conn).items()])
+    for lingkup in STATISTIK_LINGKUP:
+        conn.execute(f"""INSERT INTO statistik_kk (nomor_kk, lingkup, anggota)
+            SELECT p.nomor_kk, {lingkup.format(r='p')}, COUNT(*) FROM penduduk p
+            WHERE {KK_VALID.format(r='p')} GROUP BY 1, 2""")
+
+
+def cek_statistik(conn):
+    """Bandingkan tabel agregat dengan GROUP BY langsung. Kembalikan list selisih (kunci, tersimpan, live)."""
+    live = _statistik_live(conn)
+    tersimpan = {(d, l, n): j for d, l, n, j in
+                 conn.execute("SELECT dimensi, lingkup, nilai, jumlah FROM statistik WHERE jumlah != 0")}
+    selisih = []
+    for kunci in sorted(set(live) | set(tersimpan)):
+        if live.get(kunci, 0) != tersimpan.get(kunci, 0):
+            selisih.append((kunci, tersimpan.get(kunci, 0), live.get(kunci, 0)))
+    return selisih
+
+
+def hitung_statistik(conn, dimensi, lingkup='*'):
+    """Total satu dimensi tanpa nilai (mis. 'jiwa', 'kk') untuk seluruh desa atau satu dusun."""
+    row = conn.execute("SELECT jumlah FROM statistik WHERE dimensi = ? AND lingkup = ? AND nilai = ''",
+                       (dimensi, lingkup)).fetchone()
+    return row[0] if row else 0
+
+
+def rincian_statistik(conn, dimensi, lingkup='*', urut='jumlah DESC'):
+    """Daftar (nilai, jumlah) satu dimensi, format sama dengan GROUP BY lama."""
+    return conn.execute(f"""SELECT nilai AS {dimensi}, jumlah FROM statistik
+        WHERE dimensi = ? AND lingkup = ? AND jumlah > 0 ORDER BY {urut}""", (dimensi, lingkup)).fetchall()
+
+
+def statistik_per_dusun(conn, dimensi, nilai=''):
+    """Daftar (dusun, jumlah) untuk dusun yang terisi, urut nama dusun."""
+    return conn.execute("""SELECT lingkup AS dusun, jumlah FROM statistik
+        WHERE dimensi = ? AND nilai = ? AND lingkup != '*' AND TRIM(lingkup) != '' AND jumlah > 0
+        ORDER BY lingkup""", (dimensi, nilai)).fetchall()
+
+
+# --- HASH ISI (DETEKSI PERUBAHAN IMPOR) ---
+# Impor menyimpan hash isi baris di penduduk.hash_isi dan melewati baris yang hash-nya sama.
+# Perubahan dari jalur lain (form edit, rollback) mengosongkan hash lewat trigger,
+# supaya impor berikutnya tidak mengira baris itu masih sama dengan file.
+KOLOM_ISI = ("nomor_kk, nik, nama, hubungan, jenis_kelamin, tempat_lahir, tanggal_lahir, agama, "
+             "status_perkawinan, pendidikan, pekerjaan, alamat, rt_rw, dusun, golongan_darah, "
+             "kesejahteraan, foto_ktp")
+
+HASH_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS penduduk_hash_au AFTER UPDATE OF {KOLOM_ISI} ON penduduk
+    WHEN new.hash_isi IS old.hash_isi AND new.hash_isi IS NOT NULL BEGIN
+        UPDATE penduduk SET hash_isi = NULL WHERE id = new.id;
+    END"""
+
+
+def ensure_hash_isi(conn):
+    """Tambah kolom hash_isi + trigger pengosongnya. Commit oleh pemanggil."""
+    kolom = {row[1] for row in conn.execute("PRAGMA table_info(penduduk)")}
+    if 'hash_isi' not in kolom:
+        conn.execute("ALTER TABLE penduduk ADD COLUMN hash_isi TEXT")
+    conn.execute(HASH_TRIGGER)
@@ -0,0 +1,143 @@
+# ekspor.py
+import csv
+import importlib.util
+import io
+import tempfile
+from config import Config
+from database import pool
+
+# --- EKSPOR DATA PENDUDUK ---
+# Data dibaca per halaman (keyset pada id) dan langsung ditulis ke file sementara (Excel, Parquet)
+# atau dialirkan ke response (CSV), jadi memori tetap kecil berapa pun jumlah penduduknya.
+
+# Kolom tabel -> judul kolom di file ekspor (urutan = urutan kolom)
+KOLOM_EKSPOR = {
+    'id': 'id',
+    'nomor_kk': 'Nomor KK',
+    'nik': 'NIK',
+    'nama': 'Nama',
+    'hubungan': 'Hubungan',
+    'jenis_kelamin': 'Jenis Kelamin',
+    'tempat_lahir': 'Tempat Lahir',
+    'tanggal_lahir': 'Tanggal Lahir',
+    'agama': 'Agama',
+    'status_perkawinan': 'Status Perkawinan',
+    'pendidikan': 'Pendidikan',
+    'pekerjaan': 'Pekerjaan',
+    'alamat': 'Alamat',
+    'rt_rw': 'RT/RW',
+    'dusun': 'Dusun',
+    'golongan_darah': 'Gol. Darah',
+    'kesejahteraan': 'Program Kesejahteraan',
+    'tanggal_input': 'Tanggal Input',
+    'foto_ktp': 'Foto KTP',
+}
+
+
+def format_ekspor():
+    """Format ekspor yang tersedia. Parquet hanya jika pyarrow terpasang (dicek tanpa mengimpornya)."""
+    return ['excel', 'csv'] + (['parquet'] if importlib.util.find_spec('pyarrow') else [])
+
+
+def _where(kondisi):
+    return "".join(f" AND {k}" for k in kondisi)
+
+
+def ada_penduduk(conn, kondisi=(), params=()):
+    """Apakah ada baris penduduk yang lolos filter."""
+    return conn.execute(f"SELECT 1 FROM penduduk WHERE 1{_where(kondisi)} LIMIT 1", params).fetchone() is not None
+
+
+def halaman_penduduk(conn, kolom=None, kondisi=(), params=(), ukuran=None):
+    """
+    Hasilkan list tuple baris penduduk per halaman, urut id.
+    kondisi/params: filter SQL tambahan (hak akses, dusun), mis. ["dusun = ?"], ("SATU",).
+    Tiap halaman query sendiri (WHERE id > terakhir), jadi tidak ada transaksi baca yang ditahan lama.
+    """
+    kolom = list(kolom or KOLOM_EKSPOR)
+    ukuran = ukuran or Config.EKSPOR_CHUNK
+    # id selalu diambil (untuk halaman berikutnya) lalu dibuang jika tidak diminta
+    sql = (f"SELECT id, {', '.join(kolom)} FROM penduduk WHERE id > ?{_where(kondisi)} "
+           f"ORDER BY id LIMIT ?")
+    terakhir = 0
+    while True:
+        rows = conn.execute(sql, (terakhir, *params, ukuran)).fetchall()
+        if not rows:
+            return
+        terakhir = rows[-1][0]
+        yield [tuple(row)[1:] for row in rows]
+        if len(rows) < ukuran:
+            return
+
+
+def tulis_excel(conn, kolom=None, kondisi=(), params=()):
+    """
+    Tulis data penduduk ke file .xlsx sementara (openpyxl write-only) dan kembalikan file-nya,
+    posisi di awal. File tanpa nama di disk: terhapus sendiri saat ditutup.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    kolom = list(kolom or KOLOM_EKSPOR)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Data Penduduk')
+    tebal = Font(bold=True)
+    header = []
+    for k in kolom:
+        cell = WriteOnlyCell(ws, value=KOLOM_EKSPOR[k])
+        cell.font = tebal
+        header.append(cell)
+    ws.append(header)
+    for rows in halaman_penduduk(conn, kolom, kondisi, params):
+        for row in rows:
+            ws.append(row)
+
+    f = tempfile.TemporaryFile(dir=Config.EKSPOR_FOLDER)
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+def baris_csv(kolom=None, kondisi=(), params=()):
+    """
+    Generator teks CSV (header + satu potongan per halaman) untuk response streaming.
+    Memakai koneksi pool sendiri karena berjalan setelah view selesai.
+    """
+    kolom = list(kolom or KOLOM_EKSPOR)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([KOLOM_EKSPOR[k] for k in kolom])
+    conn = pool.acquire()
+    try:
+        for rows in halaman_penduduk(conn, kolom, kondisi, params):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        conn.close()
+    if buffer.tell():
+        yield buffer.getvalue()  # Hanya header (tidak ada baris)
+
+
+def tulis_parquet(conn, kolom=None, kondisi=(), params=()):
+    """
+    Tulis data penduduk ke file .parquet sementara, satu record batch (row group) per halaman.
+    Kembalikan file-nya, posisi di awal.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Ekspor Parquet membutuhkan paket pyarrow (pip install pyarrow).")
+
+    kolom = list(kolom or KOLOM_EKSPOR)
+    schema = pa.schema([(KOLOM_EKSPOR[k], pa.int64() if k == 'id' else pa.string()) for k in kolom])
+    f = tempfile.TemporaryFile(dir=Config.EKSPOR_FOLDER)
+    with pq.ParquetWriter(f, schema) as writer:
+        for rows in halaman_penduduk(conn, kolom, kondisi, params):
+            kolom_arrow = [pa.array(nilai, type=field.type) for nilai, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(kolom_arrow, schema=schema))
+    f.seek(0)
+    return f
@@ -0,0 +1,136 @@
+# grafik.py
+import hashlib
+import os
+import threading
+import time
+from matplotlib.figure import Figure  # Tanpa pyplot: aman dipakai beberapa thread sekaligus
+from config import Config
+
+# --- GRAFIK DASHBOARD ---
+# Nama file grafik memuat hash data agregatnya (chart_dusun_<kunci>.png), jadi grafik hanya
+# dirender ulang saat datanya berubah dan browser boleh menyimpannya lama.
+# Naikkan VERSI_GRAFIK jika tampilan grafik diubah.
+# Versi lama tidak langsung dihapus: halaman yang baru dirender mungkin masih memuatnya, jadi file
+# baru dihapus GRAFIK_SIMPAN_LAMA_DETIK setelah tidak dipakai lagi (mtime = saat digantikan).
+VERSI_GRAFIK = 1
+
+_lock = threading.Lock()
+_aktif = {}  # nama grafik -> nama file yang sedang dipakai halaman
+
+
+def _bar(data, kolom, judul, xlabel, ylabel, warna, ukuran):
+    fig = Figure(figsize=ukuran)
+    ax = fig.subplots()
+    ax.bar([row[kolom] for row in data], [row['jumlah'] for row in data], color=warna)
+    ax.set_title(judul)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
+
+
+def _grafik_dusun(data):
+    return _bar(data, 'dusun', 'Jumlah Jiwa per Dusun', 'Dusun', 'Jumlah Jiwa', 'skyblue', (8, 5))
+
+
+def _grafik_agama(data):
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    ax.pie([row['jumlah'] for row in data], labels=[row['agama'] for row in data],
+           autopct='%1.1f%%', startangle=90)
+    ax.set_title('Persentase Agama')
+    ax.axis('equal')
+    return fig
+
+
+def _grafik_pendidikan(data):
+    return _bar(data, 'pendidikan', 'Pendidikan Terakhir Penduduk', 'Pendidikan', 'Jumlah',
+                'lightgreen', (10, 5))
+
+
+def _grafik_pertumbuhan(data):
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot([row['bulan'] for row in data], [row['jumlah'] for row in data], marker='o', color='orange')
+    ax.set_title('Pertumbuhan Penduduk per Bulan')
+    ax.set_xlabel('Bulan')
+    ax.set_ylabel('Jumlah Penduduk Baru')
+    ax.grid(True)
+    return fig
+
+
+GRAFIK = {
+    'dusun': _grafik_dusun,
+    'agama': _grafik_agama,
+    'pendidikan': _grafik_pendidikan,
+    'pertumbuhan': _grafik_pertumbuhan,
+}
+
+
+def kunci_grafik(nama, data):
+    """Hash isi data agregat satu grafik."""
+    isi = repr((VERSI_GRAFIK, nama, [tuple(row) for row in data]))
+    return hashlib.sha256(isi.encode()).hexdigest()[:16]
+
+
+def siapkan_grafik(**data):
+    """
+    Pastikan file grafik untuk data saat ini ada, render hanya yang belum ada.
+    Kembalikan {nama: nama_file} (None jika datanya kosong).
+    """
+    hasil = {}
+    for nama, rows in data.items():
+        if not rows:
+            hasil[nama] = None
+            continue
+        nama_file = f"chart_{nama}_{kunci_grafik(nama, rows)}.png"
+        path = os.path.join(Config.CHART_FOLDER, nama_file)
+        if _aktif.get(nama) != nama_file or not os.path.exists(path):
+            with _lock:
+                _ganti_aktif(nama, nama_file)
+                _render_grafik(nama, rows, nama_file)
+        hasil[nama] = nama_file
+    return hasil
+
+
+def _ganti_aktif(nama, nama_file):
+    """Catat file aktif grafik; versi yang digantikan diberi mtime sekarang (awal masa simpannya)."""
+    if _aktif.get(nama) == nama_file:
+        return
+    if nama in _aktif:
+        digantikan = [_aktif[nama]]
+    else:  # Proses baru: file aktif sebelumnya tidak diketahui
+        digantikan = [f for f in _versi_grafik(nama) if f != nama_file]
+    _aktif[nama] = nama_file
+    for f in digantikan:
+        try:
+            os.utime(os.path.join(Config.CHART_FOLDER, f))
+        except FileNotFoundError:
+            pass
+
+
+def _versi_grafik(nama):
+    if not os.path.isdir(Config.CHART_FOLDER):
+        return []
+    return [f for f in os.listdir(Config.CHART_FOLDER) if f.startswith(f"chart_{nama}_") and f.endswith('.png')]
+
+
+def _render_grafik(nama, rows, nama_file):
+    path = os.path.join(Config.CHART_FOLDER, nama_file)
+    if os.path.exists(path):  # Sudah dirender thread lain saat menunggu lock
+        return
+    os.makedirs(Config.CHART_FOLDER, exist_ok=True)
+    fig = GRAFIK[nama](rows)
+    fig.tight_layout()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format='png')
+    os.replace(tmp, path)  # Atomik: pembaca tidak pernah melihat file setengah jadi
+    # Versi lama yang sudah lewat masa simpannya
+    batas = time.time() - Config.GRAFIK_SIMPAN_LAMA_DETIK
+    for f in _versi_grafik(nama):
+        path_lama = os.path.join(Config.CHART_FOLDER, f)
+        try:
+            if f != nama_file and os.path.getmtime(path_lama) < batas:
+                os.remove(path_lama)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,729 @@
+# importer.py
+import os
+import csv
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, date
+try:
+    import fcntl  # Tidak ada di Windows
+except ImportError:
+    fcntl = None
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook, Workbook
+from config import Config
+from database import pool, dengan_retry
+from audit import catat_aktivitas
+from cetak import hapus_cache_kk
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet opsional
+    pa = pc = pq = None
+
+# --- IMPOR DATA PENDUDUK ---
+# Data diimpor per kolom (dict nama_kolom -> list nilai) dengan executemany.
+# File (.xlsx, .csv, .parquet) dibaca per potongan IMPOR_BACA_CHUNK baris, dan tiap potongan
+# disimpan dan di-commit sebelum potongan berikutnya dibaca: memori tetap datar berapa pun barisnya.
+
+KOLOM_WAJIB = ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun']
+KOLOM_IMPOR = ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'tempat_lahir', 'tanggal_lahir',
+               'agama', 'status_perkawinan', 'pendidikan', 'pekerjaan', 'alamat', 'rt_rw', 'dusun',
+               'golongan_darah', 'kesejahteraan', 'foto_ktp']
+
+
+def _nilai(v):
+    """Ubah nilai sel menjadi tipe yang bisa disimpan SQLite."""
+    if isinstance(v, (datetime, date)):
+        return v.strftime('%Y-%m-%d')
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def sql_upsert(kolom):
+    """
+    INSERT ... ON CONFLICT(nik) DO UPDATE: baris lama tetap memakai id yang sama.
+    Hanya kolom yang ada di file yang ditimpa; tanggal_input tetap tanggal data pertama kali masuk.
+    Baris baru: kolom impor yang tidak ada di file diisi '' (bukan NULL), sama seperti impor lama.
+    """
+    semua = kolom + ['hash_isi', 'tanggal_input']
+    kosong = [k for k in KOLOM_IMPOR if k not in kolom]
+    update = ', '.join(f"{k} = excluded.{k}" for k in kolom + ['hash_isi'] if k != 'nik')
+    return f'''INSERT INTO penduduk ({', '.join(semua + kosong)})
+               VALUES ({', '.join(['?'] * len(semua) + ["''"] * len(kosong))})
+               ON CONFLICT(nik) DO UPDATE SET {update}'''
+
+
+def hash_baris(data, kolom):
+    """
+    Hash isi tiap baris (64-bit, pandas hash_pandas_object) untuk kolom yang ada di file.
+    Diawali CRC nama kolom: file dengan susunan kolom berbeda tidak dianggap sama.
+    """
+    susunan = zlib.crc32(','.join(kolom).encode())
+    nilai = pd.util.hash_pandas_object(pd.DataFrame({k: data[k] for k in kolom}), index=False)
+    return [f"{susunan:08x}{h:016x}" for h in nilai.tolist()]
+
+
+def nik_terdaftar(conn, daftar_nik):
+    """
+    Dict NIK -> (dusun, hash_isi) untuk NIK dari daftar_nik yang sudah ada di tabel penduduk.
+    Satu query untuk seluruh daftar: NIK dikirim sebagai satu array JSON.
+    """
+    rows = conn.execute("""SELECT nik, dusun, hash_isi FROM penduduk
+                           WHERE nik IN (SELECT value FROM json_each(?))""",
+                        (json.dumps(list(daftar_nik)),)).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def upsert_penduduk(conn, data, terdaftar=None, dry_run=False):
+    """
+    Simpan data (dict kolom -> list nilai, semua list sama panjang) ke tabel penduduk.
+    Baris yang hash isinya sama dengan yang tersimpan dilewati (tidak ditulis sama sekali).
+    Tidak commit; pemanggil yang menentukan batas transaksi.
+    terdaftar: dict NIK -> hash_isi yang sudah tersimpan, diperbarui di tempat.
+    dry_run: hanya hitung, tidak menulis apa pun.
+    Kembalikan (baru, diperbarui, sama, gagal).
+    """
+    kolom = [k for k in KOLOM_IMPOR if k in data]
+    tanggal_input = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [tuple(_nilai(v) for v in row) + (h, tanggal_input)
+            for row, h in zip(zip(*(data[k] for k in kolom)), hash_baris(data, kolom))]
+    idx_nik, idx_hash = kolom.index('nik'), len(kolom)
+    idx_kk = kolom.index('nomor_kk') if 'nomor_kk' in kolom else None
+
+    gagal = [row for row in rows if not str(row[idx_nik]).strip()]
+    rows = [row for row in rows if str(row[idx_nik]).strip()]
+    if terdaftar is None:
+        terdaftar = {nik: h for nik, (_, h) in nik_terdaftar(conn, {row[idx_nik] for row in rows}).items()}
+
+    # Hanya baris baru atau yang isinya berubah yang perlu ditulis
+    sama = sum(1 for row in rows if terdaftar.get(row[idx_nik], False) == row[idx_hash])
+    rows = [row for row in rows if terdaftar.get(row[idx_nik], False) != row[idx_hash]]
+    if dry_run:
+        baru = sum(1 for row in rows if row[idx_nik] not in terdaftar)
+        return baru, len(rows) - baru, sama, len(gagal)
+
+    if rows and not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")  # SAVEPOINT di luar transaksi akan commit sendiri saat RELEASE
+    baru = diperbarui = 0
+    sql = sql_upsert(kolom)
+    for i in range(0, len(rows), Config.IMPOR_CHUNK):
+        potongan = rows[i:i + Config.IMPOR_CHUNK]
+        conn.execute("SAVEPOINT impor")
+        try:
+            conn.executemany(sql, potongan)
+            tersimpan = potongan
+        except sqlite3.IntegrityError:
+            # Cari baris yang bermasalah satu per satu; baris lain tetap disimpan
+            conn.execute("ROLLBACK TO impor")
+            tersimpan = []
+            for row in potongan:
+                try:
+                    conn.execute(sql, row)
+                    tersimpan.append(row)
+                except sqlite3.IntegrityError:
+                    gagal.append(row)
+        conn.execute("RELEASE impor")
+        if idx_kk is not None:
+            hapus_cache_kk(*{row[idx_kk] for row in tersimpan})
+        for row in tersimpan:
+            if row[idx_nik] in terdaftar:
+                diperbarui += 1
+            else:
+                baru += 1
+            terdaftar[row[idx_nik]] = row[idx_hash]
+    return baru, diperbarui, sama, len(gagal)
+
+
+def _teks(v):
+    """Nilai sel -> teks, seperti yang diketik di Excel (NIK angka tidak menjadi 3.5e+15)."""
+    if v is None:
+        return ''
+    if isinstance(v, (datetime, date)):
+        return v.strftime('%Y-%m-%d')
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _potong(rows, kolom, ukuran):
+    """
+    Kelompokkan baris menjadi dict kolom -> list nilai, paling banyak `ukuran` baris per potongan.
+    Kolom '_baris' berisi nomor baris di Excel (header = baris 1), untuk laporan kesalahan.
+    """
+    posisi = {k: i for i, k in enumerate(kolom) if k in KOLOM_IMPOR}
+    data = {k: [] for k in ['_baris', *posisi]}
+    jumlah = 0
+    for nomor, row in enumerate(rows, start=2):
+        if not any(v is not None and str(v).strip() for v in row):
+            continue  # Baris kosong di akhir sheet
+        data['_baris'].append(nomor)
+        for k, i in posisi.items():
+            data[k].append(_teks(row[i]) if i < len(row) else '')
+        jumlah += 1
+        if jumlah == ukuran:
+            yield data
+            data = {k: [] for k in data}
+            jumlah = 0
+    if jumlah:
+        yield data
+
+
+# --- SUMBER FILE IMPOR ---
+# Setiap format membuka file dan menghasilkan (kolom, perkiraan_baris, iterator potongan).
+# Nama kolom sama dengan template/template_upload.xlsx (huruf besar/kecil diabaikan).
+
+def _nama_kolom(header):
+    return [str(h).strip().lower() if h is not None else '' for h in header]
+
+
+@contextmanager
+def _sumber_xlsx(path, ukuran):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        perkiraan = ws.max_row - 1 if ws.max_row else None  # Dari tag <dimension>, bisa tidak ada
+        rows = ws.iter_rows(values_only=True)
+        kolom = _nama_kolom(next(rows, None) or [])
+        yield kolom, perkiraan, _potong(rows, kolom, ukuran)
+    finally:
+        wb.close()
+
+
+def _pemisah_csv(path):
+    """Tebak pemisah kolom (Excel berbahasa Indonesia menyimpan CSV dengan ';')."""
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        contoh = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(contoh, delimiters=',;\t|').delimiter
+    except csv.Error:
+        return ','
+
+
+def _hitung_baris(path):
+    """Jumlah baris data (tanpa header), dihitung dari jumlah newline per blok 1 MB."""
+    jumlah = 0
+    with open(path, 'rb') as f:
+        for blok in iter(lambda: f.read(1024 * 1024), b''):
+            jumlah += blok.count(b'\n')
+    return max(jumlah - 1, 0)
+
+
+@contextmanager
+def _sumber_csv(path, ukuran):
+    """
+    Nomor '_baris' = nomor baris saat CSV dibuka di Excel: baris kosong ikut dihitung (lalu dilewati,
+    seperti sheet .xlsx), dan satu record dengan teks ber-kutip yang memuat enter tetap satu baris,
+    meskipun di file teksnya memakan beberapa baris.
+    """
+    opsi = dict(sep=_pemisah_csv(path), dtype=str, keep_default_na=False, skip_blank_lines=False,
+                encoding='utf-8-sig', encoding_errors='replace')
+    kolom = _nama_kolom(pd.read_csv(path, nrows=0, **opsi).columns)
+    pembaca = pd.read_csv(path, chunksize=ukuran, **opsi)
+
+    def potongan():
+        for df in pembaca:
+            df.columns = kolom
+            isi = np.strings.strip(df.fillna('').to_numpy(dtype=str))  # Baris pendek: kolom sisanya NaN
+            ada = (isi != '').any(axis=1)  # Baris kosong (termasuk ";;;") tidak diimpor
+            if not ada.any():
+                continue
+            data = {'_baris': (df.index[ada] + 2).tolist()}  # Header = baris 1
+            for i, k in enumerate(kolom):
+                if k in KOLOM_IMPOR and k not in data:
+                    data[k] = isi[ada, i].tolist()
+            yield data
+
+    try:
+        yield kolom, _hitung_baris(path), potongan()
+    finally:
+        pembaca.close()
+
+
+def _teks_arrow(kolom):
+    """Kolom Arrow -> list teks: angka/tanggal di-cast di Arrow, null menjadi ''."""
+    if pa.types.is_floating(kolom.type) and pc.all(pc.equal(pc.floor(kolom), kolom)).as_py():
+        kolom = pc.cast(kolom, pa.int64())  # NIK tersimpan sebagai float tetap 16 digit
+    if pa.types.is_timestamp(kolom.type):
+        kolom = pc.strftime(kolom, format='%Y-%m-%d')  # Sama dengan tanggal dari sel Excel
+    elif not pa.types.is_string(kolom.type):
+        kolom = pc.cast(kolom, pa.string())
+    return pc.utf8_trim_whitespace(pc.fill_null(kolom, '')).to_pylist()
+
+
+@contextmanager
+def _sumber_parquet(path, ukuran):
+    if pq is None:
+        raise ValueError("Impor Parquet membutuhkan paket pyarrow (pip install pyarrow).")
+    f = pq.ParquetFile(path)
+    try:
+        kolom = _nama_kolom(f.schema_arrow.names)
+        asli = {k: nama for k, nama in zip(kolom, f.schema_arrow.names) if k in KOLOM_IMPOR}
+
+        def potongan():
+            nomor = 2
+            # Hanya kolom impor yang dibaca dari file (format kolumnar)
+            for batch in f.iter_batches(batch_size=ukuran, columns=list(asli.values())):
+                data = {'_baris': list(range(nomor, nomor + batch.num_rows))}
+                for k, nama in asli.items():
+                    data[k] = _teks_arrow(batch.column(nama))
+                nomor += batch.num_rows
+                yield data
+
+        yield kolom, f.metadata.num_rows, potongan()
+    finally:
+        f.close()
+
+
+SUMBER_IMPOR = {'.xlsx': _sumber_xlsx, '.csv': _sumber_csv}
+if pq is not None:
+    SUMBER_IMPOR['.parquet'] = _sumber_parquet
+FORMAT_IMPOR = list(SUMBER_IMPOR)
+
+
+# --- VALIDASI IMPOR ---
+# Aturan sama dengan validasi_data() di form tambah/edit, tapi dijalankan per kolom
+# (ufunc np.strings) untuk satu potongan sekaligus.
+
+DUSUN_VALID = ['SATU', 'DUA', 'TIGA', 'EMPAT']
+
+
+class ValidasiImpor:
+    """
+    Validasi potongan demi potongan satu file impor.
+    NIK yang sudah lolos disimpan sebagai array int64 terurut (8 byte per baris),
+    jadi NIK ganda antar potongan tetap terdeteksi tanpa menyimpan seluruh file.
+    dusun_user: jika diisi (kepala dusun), hanya data dusun itu yang boleh diimpor.
+    """
+
+    def __init__(self, conn, dusun_user=None):
+        self.conn = conn
+        self.dusun_user = dusun_user
+        self.nik_terlihat = np.empty(0, dtype=np.int64)
+
+    def periksa(self, data):
+        """
+        Kembalikan (valid, salah, terdaftar): valid berupa dict kolom -> list siap disimpan,
+        salah berupa DataFrame baris yang ditolak dengan kolom 'kesalahan',
+        terdaftar berupa dict NIK -> hash_isi untuk NIK valid yang sudah ada di database.
+        Pemeriksaan memakai ufunc np.strings (jalan di C, bukan loop Python per baris).
+        """
+        nik = np.strings.strip(np.asarray(data['nik'], dtype=str))
+        nomor_kk = np.strings.strip(np.asarray(data['nomor_kk'], dtype=str))
+        nama = _kapital(np.strings.strip(np.asarray(data['nama'], dtype=str)))
+        dusun = _kapital(np.strings.strip(np.asarray(data['dusun'], dtype=str)))
+        aturan = []  # (baris yang salah, pesan)
+
+        nik_ok = _enam_belas_digit(nik)
+        aturan.append((~nik_ok, "NIK harus 16 digit angka."))
+        aturan.append((~_enam_belas_digit(nomor_kk), "Nomor KK harus 16 digit angka."))
+        huruf = np.strings.replace(nama, ' ', '')
+        nama_ok = np.strings.isalpha(huruf) & np.strings.isupper(huruf) & _ascii(huruf)
+        aturan.append((~nama_ok, "Nama hanya boleh huruf kapital dan spasi."))
+        dusun_ok = np.isin(dusun, DUSUN_VALID)
+        aturan.append((~dusun_ok, f"Dusun harus salah satu dari: {', '.join(DUSUN_VALID)}."))
+        if self.dusun_user:
+            aturan.append((dusun_ok & (dusun != self.dusun_user), "Dusun di luar wilayah Anda."))
+
+        # Satu query untuk semua NIK potongan ini
+        terdaftar = nik_terdaftar(self.conn, nik[nik_ok].tolist())
+        if self.dusun_user and terdaftar:
+            dusun_db = np.array([terdaftar.get(n, (self.dusun_user,))[0] for n in nik.tolist()], dtype=object)
+            aturan.append((dusun_db != self.dusun_user, "NIK sudah terdaftar di dusun lain."))
+
+        # NIK ganda: sama dengan baris lolos sebelumnya di potongan ini atau di potongan sebelumnya.
+        # Baris yang ditolak karena aturan lain tidak dihitung, jadi baris valid berikutnya tetap lolos.
+        nik_int = np.zeros(len(nik), dtype=np.int64)
+        nik_int[nik_ok] = _ke_int(nik[nik_ok])
+        kandidat = nik_ok & ~np.logical_or.reduce([salah for salah, _ in aturan])
+        pertama = pd.Series(np.flatnonzero(kandidat), index=nik_int[kandidat])
+        pertama = pertama[~pertama.index.duplicated()]  # Baris kandidat pertama per NIK
+        sebelumnya = pd.Series(nik_int).map(pertama).to_numpy() < np.arange(len(nik))
+        ganda = nik_ok & (sebelumnya | _ada_di(nik_int, self.nik_terlihat))
+        aturan.append((ganda, "NIK ganda dalam file."))
+
+        tolak = np.logical_or.reduce([salah for salah, _ in aturan])
+        lolos = ~tolak
+        self.nik_terlihat = np.sort(np.concatenate([self.nik_terlihat, nik_int[lolos]]), kind='stable')
+
+        bersih = {'nik': nik, 'nomor_kk': nomor_kk, 'nama': nama, 'dusun': dusun}
+        valid = {k: (bersih[k] if k in bersih else np.asarray(v, dtype=object))[lolos].tolist()
+                 for k, v in data.items() if k != '_baris'}
+        # Kombinasi aturan yang dilanggar sebagai bit; teks pesan cukup dibuat sekali per kombinasi
+        kode = np.zeros(len(nik), dtype=np.int64)
+        for bit, (baris_salah, _) in enumerate(aturan):
+            kode |= baris_salah.astype(np.int64) << bit
+        idx = np.flatnonzero(tolak)
+        salah = pd.DataFrame({k: np.asarray(v, dtype=object)[idx] for k, v in data.items()})
+        salah['kesalahan'] = pd.Series(kode[idx]).map(
+            {k: ' '.join(teks for bit, (_, teks) in enumerate(aturan) if k >> bit & 1)
+             for k in np.unique(kode[idx]).tolist()}).to_numpy()
+        return valid, salah, {n: h for n, (_, h) in terdaftar.items()}
+
+
+def _kapital(arr):
+    """Ubah ke huruf kapital; np.strings.upper lambat, jadi hanya untuk baris yang belum kapital."""
+    kecil = ~np.strings.isupper(arr) & (np.strings.str_len(arr) > 0)
+    if kecil.any():
+        arr = arr.copy()
+        arr[kecil] = np.strings.upper(arr[kecil])
+    return arr
+
+
+def _ascii(arr):
+    """True jika semua karakter ASCII (array 'U' disimpan sebagai kode UTF-32)."""
+    if arr.dtype.itemsize == 0:
+        return np.ones(len(arr), dtype=bool)
+    return arr.view(np.uint32).reshape(len(arr), -1).max(axis=1) < 128
+
+
+def _ke_int(arr):
+    """NIK 16 digit (sudah divalidasi) -> int64, dihitung dari kode karakter tanpa parsing per baris."""
+    digit = arr.astype('U16').view(np.uint32).reshape(len(arr), 16).astype(np.int64) - ord('0')
+    return digit @ (10 ** np.arange(15, -1, -1, dtype=np.int64))
+
+
+def _enam_belas_digit(arr):
+    return (np.strings.str_len(arr) == 16) & np.strings.isdigit(arr)
+
+
+def _ada_di(nilai, terurut):
+    """Versi np.isin untuk array pembanding yang sudah terurut (cukup searchsorted)."""
+    if not len(terurut):
+        return np.zeros(len(nilai), dtype=bool)
+    posisi = np.searchsorted(terurut, nilai).clip(max=len(terurut) - 1)
+    return terurut[posisi] == nilai
+
+
+class LaporanKesalahan:
+    """Workbook baris yang ditolak, ditulis bertahap (openpyxl write-only) dan disimpan di akhir."""
+
+    def __init__(self, path, kolom):
+        self.path = path
+        self.kolom = ['_baris', 'kesalahan'] + [k for k in KOLOM_IMPOR if k in kolom]
+        self.jumlah = 0
+        self.wb = self.ws = None  # Dibuat saat baris pertama ditolak
+
+    def tambah(self, salah):
+        if self.wb is None:
+            self.wb = Workbook(write_only=True)
+            self.ws = self.wb.create_sheet('Kesalahan')
+            self.ws.append(['baris', 'kesalahan'] + self.kolom[2:])
+        for row in salah[self.kolom].itertuples(index=False):
+            self.ws.append(list(row))
+        self.jumlah += len(salah)
+
+    def simpan(self):
+        """Simpan hanya jika ada baris yang ditolak. Kembalikan path, atau None."""
+        if not self.jumlah:
+            return None
+        self.wb.save(self.path)
+        return self.path
+
+
+def impor_file(conn, path, ukuran=None, progres=None, dusun_user=None, file_error=None, dry_run=False):
+    """
+    Impor file .xlsx/.csv/.parquet secara streaming. Setiap potongan divalidasi, disimpan dan
+    di-commit sendiri, jadi kunci tulis database tidak ditahan selama file besar diproses.
+    progres(baru, diperbarui, sama, gagal, perkiraan_total) dipanggil setelah setiap potongan.
+    Baris yang ditolak validasi ditulis ke workbook file_error (jika ada yang ditolak).
+    dry_run: validasi dan bandingkan saja, tanpa menulis ke database.
+    Raise ValueError jika format tidak didukung atau kolom wajib tidak ada.
+    Kembalikan (baru, diperbarui, sama, gagal).
+    """
+    ekstensi = os.path.splitext(path)[1].lower()
+    if ekstensi not in SUMBER_IMPOR:
+        raise ValueError(f"Format harus salah satu dari: {', '.join(FORMAT_IMPOR)}")
+    with SUMBER_IMPOR[ekstensi](path, ukuran or Config.IMPOR_BACA_CHUNK) as (kolom, perkiraan, potongan):
+        if not set(KOLOM_WAJIB).issubset(kolom):
+            raise ValueError(f'Kolom tidak lengkap: {", ".join(KOLOM_WAJIB)}')
+        validasi = ValidasiImpor(conn, dusun_user)
+        laporan = LaporanKesalahan(file_error, kolom) if file_error else None
+        total = [0, 0, 0, 0]
+        if progres:
+            progres(*total, perkiraan)
+        for data in potongan:
+            valid, salah, terdaftar = validasi.periksa(data)
+            try:
+                hasil = upsert_penduduk(conn, valid, terdaftar=terdaftar, dry_run=dry_run)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if laporan and len(salah):
+                laporan.tambah(salah)
+            total = [a + b for a, b in zip(total, hasil)]
+            total[3] += len(salah)
+            if progres:
+                progres(*total, perkiraan)
+        if laporan:
+            laporan.simpan()
+        return tuple(total)
+
+
+# --- JOB IMPOR LATAR BELAKANG ---
+# File upload disimpan ke IMPOR_FOLDER lalu diproses thread pool; request langsung selesai.
+# Progres disimpan di tabel impor_job dan dibaca halaman upload lewat /upload/status/<job_id>.
+
+_executor = ThreadPoolExecutor(max_workers=Config.IMPOR_WORKERS, thread_name_prefix='impor')
+_job_lock_file = None
+_proses_job = None  # (pid, id pemilik) proses ini; dibuat ulang jika proses di-fork
+_proses_job_lock = threading.Lock()
+_job_lepas = set()  # Job proses ini yang status akhirnya gagal ditulis: tidak di-heartbeat lagi
+
+PESAN_JOB_TERPUTUS = "Impor terhenti karena aplikasi dimulai ulang. Silakan upload ulang file."
+
+
+def buat_job(file, username, dry_run=False):
+    """
+    Simpan file upload, catat job baru, dan antrekan ke thread pool. Kembalikan job_id.
+    dry_run: job pratinjau; file disimpan agar bisa dijalankan sungguhan dengan jalankan_pratinjau().
+    """
+    job_id = uuid.uuid4().hex
+    os.makedirs(Config.IMPOR_FOLDER, exist_ok=True)
+    hapus_file_lama()
+    file.save(_path_job(job_id, file.filename))
+    _antrekan(job_id, username, file.filename, dry_run)
+    return job_id
+
+
+def jalankan_pratinjau(job_pratinjau):
+    """Buat job impor sungguhan dari file job pratinjau (tanpa upload ulang). Kembalikan job_id, atau None."""
+    if not job_pratinjau['dry_run'] or job_pratinjau['status'] != 'selesai':
+        return None
+    job_id = uuid.uuid4().hex
+    try:
+        # File dipindah, jadi pratinjau yang sama tidak bisa dijalankan dua kali
+        os.replace(_path_job(job_pratinjau['id'], job_pratinjau['nama_file']),
+                   _path_job(job_id, job_pratinjau['nama_file']))
+    except FileNotFoundError:
+        return None
+    _antrekan(job_id, job_pratinjau['username'], job_pratinjau['nama_file'], False)
+    return job_id
+
+
+def _antrekan(job_id, username, nama_file, dry_run):
+    pemilik = _pemilik()  # Kunci bersama diambil sebelum job tercatat
+    conn = pool.acquire()
+    try:
+        conn.execute("""INSERT INTO impor_job (id, username, nama_file, dry_run, dibuat, pemilik, detak)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                     (job_id, username, nama_file, int(dry_run), datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                      pemilik, time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+    _executor.submit(_jalankan_job, job_id, _path_job(job_id, nama_file))
+
+
+def _path_job(job_id, nama_file):
+    """File upload job disimpan dengan ekstensi aslinya (menentukan format pembaca)."""
+    return os.path.join(Config.IMPOR_FOLDER, job_id + os.path.splitext(nama_file)[1].lower())
+
+
+def hapus_file_lama():
+    """Hapus workbook kesalahan dan file pratinjau yang lebih tua dari IMPOR_SIMPAN_LAPORAN_HARI."""
+    batas = time.time() - Config.IMPOR_SIMPAN_LAPORAN_HARI * 86400
+    for nama in os.listdir(Config.IMPOR_FOLDER):
+        path = os.path.join(Config.IMPOR_FOLDER, nama)
+        if os.path.isfile(path) and os.path.getmtime(path) < batas:
+            os.remove(path)
+
+
+def _jalankan_job(job_id, path):
+    conn = pool.acquire()
+    dry_run = False
+    try:
+        job = conn.execute("""SELECT j.username, j.nama_file, j.dry_run, u.role, u.dusun FROM impor_job j
+                              LEFT JOIN user u ON u.username = j.username WHERE j.id = ?""", (job_id,)).fetchone()
+        if job is None:
+            return  # Baris job sudah dihapus: tidak ada yang perlu dilaporkan, file upload dibuang
+        dry_run = bool(job['dry_run'])
+        dusun_user = job['dusun'] if job['role'] == 'kepala_dusun' else None
+        file_error = os.path.join(Config.IMPOR_FOLDER, f"{job_id}_kesalahan.xlsx")
+        conn.execute("UPDATE impor_job SET status = 'berjalan', mulai = ? WHERE id = ?", (time.time(), job_id))
+        conn.commit()
+
+        def progres(baru, diperbarui, sama, gagal, perkiraan):
+            conn.execute("""UPDATE impor_job SET diproses = ?, baru = ?, diperbarui = ?, sama = ?, gagal = ?,
+                            total_baris = ?, detak = ? WHERE id = ?""",
+                         (baru + diperbarui + sama + gagal, baru, diperbarui, sama, gagal, perkiraan,
+                          time.time(), job_id))
+            conn.commit()
+
+        baru, diperbarui, sama, gagal = impor_file(conn, path, progres=progres, dusun_user=dusun_user,
+                                                   file_error=file_error, dry_run=dry_run)
+        diproses = baru + diperbarui + sama + gagal
+        conn.execute("""UPDATE impor_job SET status = 'selesai', selesai = ?, diproses = ?, total_baris = ?,
+                        baru = ?, diperbarui = ?, sama = ?, gagal = ?, file_error = ? WHERE id = ?""",
+                     (time.time(), diproses, diproses, baru, diperbarui, sama, gagal,
+                      file_error if os.path.exists(file_error) else None, job_id))
+        conn.commit()
+        if not dry_run:
+            catat_aktivitas(job['username'], 'UPLOAD_EXCEL',
+                            f"{job['nama_file']}: baru {baru}, diperbarui {diperbarui}, "
+                            f"tidak berubah {sama}, gagal {gagal}")
+    except Exception as e:
+        conn.rollback()
+        dry_run = False  # File gagal dibaca tidak perlu disimpan
+        pesan = str(e) if isinstance(e, ValueError) else f"Error membaca file: {str(e)}"
+        _tandai_gagal(conn, job_id, pesan)
+    finally:
+        conn.close()
+        if not dry_run and os.path.exists(path):
+            os.remove(path)
+
+
+def _tandai_gagal(conn, job_id, pesan):
+    """
+    Tulis status 'gagal' (diulang jika database terkunci). Jika tetap gagal, job tidak lagi di-heartbeat:
+    setelah IMPOR_DETAK_KADALUARSA_DETIK pulihkan_job menganggapnya terputus dan menandainya gagal,
+    jadi halaman upload tidak menunggu selamanya.
+    """
+    def tulis():
+        try:
+            conn.execute("UPDATE impor_job SET status = 'gagal', selesai = ?, pesan = ? WHERE id = ?",
+                         (time.time(), pesan, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    try:
+        dengan_retry(conn, tulis)
+    except Exception as e:
+        print(f"❌ Gagal menyimpan status job impor {job_id}: {str(e)}")
+        _job_lepas.add(job_id)
+
+
+def _pemilik():
+    """
+    Id pemilik job untuk proses ini (host, pid, acak). Panggilan pertama di proses ini juga mengambil
+    kunci bersama .job.lock dan menyalakan thread heartbeat; keduanya bertahan selama proses hidup.
+    """
+    global _proses_job, _job_lock_file
+    with _proses_job_lock:
+        if _proses_job and _proses_job[0] == os.getpid():
+            return _proses_job[1]
+        pemilik = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if fcntl is not None:
+            os.makedirs(Config.IMPOR_FOLDER, exist_ok=True)
+            f = open(os.path.join(Config.IMPOR_FOLDER, '.job.lock'), 'w')
+            fcntl.flock(f, fcntl.LOCK_SH)  # Menunggu jika proses lain sedang memulihkan job
+            _job_lock_file = f  # Salinan warisan fork ditimpa; kunci proses induk tetap milik induk
+        _proses_job = (os.getpid(), pemilik)
+        threading.Thread(target=_detak, args=(pemilik,), name='impor-detak', daemon=True).start()
+        return pemilik
+
+
+def _detak(pemilik):
+    """Perbarui heartbeat semua job aktif milik proses ini, termasuk yang masih antre di _executor."""
+    while True:
+        time.sleep(Config.IMPOR_DETAK_DETIK)
+        lepas = list(_job_lepas)
+        conn = pool.acquire()
+        try:
+            conn.execute(f"""UPDATE impor_job SET detak = ?
+                             WHERE pemilik = ? AND status IN ('menunggu', 'berjalan')
+                             AND id NOT IN ({', '.join('?' * len(lepas))})""", (time.time(), pemilik, *lepas))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"❌ Gagal memperbarui heartbeat job impor: {str(e)}")
+        finally:
+            conn.close()
+
+
+@contextmanager
+def _kunci_pemulihan():
+    """
+    Coba naikkan kunci bersama menjadi eksklusif (tanpa menunggu). True: tidak ada proses lain yang
+    menjalankan job, jadi semua job aktif milik pemilik lain pasti terputus.
+    """
+    if fcntl is None:
+        yield False
+        return
+    try:
+        fcntl.flock(_job_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fcntl.flock(_job_lock_file, fcntl.LOCK_SH)  # Konversi yang gagal bisa melepas kunci lama
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        fcntl.flock(_job_lock_file, fcntl.LOCK_SH)
+
+
+def pulihkan_job():
+    """
+    Ambil alih job 'menunggu'/'berjalan' yang pemiliknya sudah mati (restart/deploy/worker didaur ulang):
+    heartbeat-nya lewat IMPOR_DETAK_KADALUARSA_DETIK, atau tidak ada proses lain yang memegang kunci job.
+    Job milik proses yang masih hidup tidak disentuh. Antrekan ulang jika file upload masih ada,
+    selain itu tandai gagal agar halaman upload berhenti menunggu. Kembalikan jumlah job.
+    """
+    pemilik = _pemilik()
+    conn = pool.acquire()
+    ulang = []
+    jumlah = 0
+    try:
+        with _kunci_pemulihan() as semua_terputus:
+            batas = time.time() if semua_terputus else time.time() - Config.IMPOR_DETAK_KADALUARSA_DETIK
+            # Job proses ini sendiri hanya jika status akhirnya gagal ditulis (_job_lepas)
+            lepas = list(_job_lepas)
+            rows = conn.execute(f"""SELECT id, nama_file, pemilik, detak FROM impor_job
+                                    WHERE status IN ('menunggu', 'berjalan')
+                                    AND (pemilik IS NOT ? OR id IN ({', '.join('?' * len(lepas))}))
+                                    AND (detak IS NULL OR detak < ?)""", (pemilik, *lepas, batas)).fetchall()
+            for row in rows:
+                # Diklaim atomik: proses lain yang memulihkan bersamaan tidak mengambil job yang sama
+                cur = conn.execute("""UPDATE impor_job SET pemilik = ?, detak = ? WHERE id = ?
+                                      AND pemilik IS ? AND detak IS ?""",
+                                   (pemilik, time.time(), row['id'], row['pemilik'], row['detak']))
+                if not cur.rowcount:
+                    continue
+                jumlah += 1
+                _job_lepas.discard(row['id'])
+                path = _path_job(row['id'], row['nama_file'] or '')
+                if os.path.exists(path):
+                    conn.execute("""UPDATE impor_job SET status = 'menunggu', mulai = NULL, total_baris = NULL,
+                                    diproses = 0, baru = 0, diperbarui = 0, sama = 0, gagal = 0 WHERE id = ?""",
+                                 (row['id'],))
+                    ulang.append((row['id'], path))
+                else:
+                    conn.execute("UPDATE impor_job SET status = 'gagal', selesai = ?, pesan = ? WHERE id = ?",
+                                 (time.time(), PESAN_JOB_TERPUTUS, row['id']))
+            conn.commit()
+    finally:
+        conn.close()
+    for job_id, path in ulang:
+        _executor.submit(_jalankan_job, job_id, path)
+    return jumlah
+
+
+def status_job(conn, job_id):
+    """Status job sebagai dict, ditambah throughput (baris/detik) dan perkiraan sisa waktu (detik)."""
+    row = conn.execute("SELECT * FROM impor_job WHERE id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    throughput = eta = None
+    if job['mulai']:
+        durasi = (job['selesai'] or time.time()) - job['mulai']
+        if durasi > 0 and job['diproses']:
+            throughput = round(job['diproses'] / durasi, 1)
+        if job['status'] == 'berjalan' and throughput and job['total_baris']:
+            eta = round(max(job['total_baris'] - job['diproses'], 0) / throughput, 1)
+    job['throughput'] = throughput
+    job['eta_detik'] = eta
+    return job
@@ -0,0 +1,191 @@
+# migrations.py
+from datetime import datetime
+import sqlite3
+import database
+from database import get_db
+
+
+# --- MIGRASI SKEMA ---
+# Setiap migrasi punya nomor urut dan hanya dijalankan sekali (dicatat di schema_version).
+# Tambahkan migrasi baru di akhir daftar; jangan ubah migrasi yang sudah pernah dirilis.
+
+def m001_tabel_dasar(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS penduduk (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nomor_kk TEXT,
+        nik TEXT UNIQUE,
+        nama TEXT,
+        hubungan TEXT,
+        jenis_kelamin TEXT,
+        tempat_lahir TEXT,
+        tanggal_lahir TEXT,
+        agama TEXT,
+        status_perkawinan TEXT,
+        pendidikan TEXT,
+        pekerjaan TEXT,
+        alamat TEXT,
+        rt_rw TEXT,
+        dusun TEXT,
+        golongan_darah TEXT,
+        kesejahteraan TEXT,
+        tanggal_input TEXT,
+        foto_ktp TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS user (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT,
+        role TEXT,
+        dusun TEXT,
+        nik_masyarakat TEXT
+    )''')
+    conn.execute("""CREATE TABLE IF NOT EXISTS log_penghapusan (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nik TEXT NOT NULL,
+        nama TEXT NOT NULL,
+        alasan_hapus TEXT,
+        dusun TEXT,
+        tanggal_hapus DATETIME DEFAULT CURRENT_TIMESTAMP,
+        dihapus_oleh TEXT
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS log_aktivitas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        aksi TEXT NOT NULL,
+        detail TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+
+
+def m002_log_penghapusan_lengkap(conn):
+    # hapus() menyimpan semua kolom penduduk ke log agar bisa di-rollback
+    kolom_ada = {row['name'] for row in conn.execute("PRAGMA table_info(log_penghapusan)")}
+    for kolom in ['tempat_lahir', 'tanggal_lahir', 'jenis_kelamin', 'agama', 'status_perkawinan',
+                  'pendidikan', 'pekerjaan', 'alamat', 'rt_rw', 'golongan_darah', 'hubungan',
+                  'nomor_kk', 'kesejahteraan']:
+        if kolom not in kolom_ada:
+            conn.execute(f"ALTER TABLE log_penghapusan ADD COLUMN {kolom} TEXT")
+
+
+def m003_user_default(conn):
+    conn.execute("INSERT OR IGNORE INTO user (username, password, role) VALUES (?, ?, ?)",
+                 ('admin', '1234', 'admin'))
+    conn.execute("INSERT OR IGNORE INTO user (username, password, role, dusun) VALUES (?, ?, ?, ?)",
+                 ('kepala_satu', '1234', 'kepala_dusun', 'SATU'))
+    conn.execute("INSERT OR IGNORE INTO user (username, password, role, nik_masyarakat) VALUES (?, ?, ?, ?)",
+                 ('warga1', '1234', 'masyarakat', '1234567890123456'))
+
+
+def m004_index_penduduk(conn):
+    database.ensure_indexes(conn)
+
+
+def m005_pencarian_fts(conn):
+    database.ensure_fts(conn)
+
+
+def m006_tabel_statistik(conn):
+    database.ensure_statistik(conn)
+
+
+def m007_job_impor(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS impor_job (
+        id TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        nama_file TEXT,
+        status TEXT NOT NULL DEFAULT 'menunggu',
+        total_baris INTEGER,
+        diproses INTEGER NOT NULL DEFAULT 0,
+        baru INTEGER NOT NULL DEFAULT 0,
+        diperbarui INTEGER NOT NULL DEFAULT 0,
+        gagal INTEGER NOT NULL DEFAULT 0,
+        pesan TEXT,
+        dibuat TEXT NOT NULL,
+        mulai REAL,
+        selesai REAL
+    )""")
+
+
+def m008_laporan_kesalahan_impor(conn):
+    conn.execute("ALTER TABLE impor_job ADD COLUMN file_error TEXT")
+
+
+def m009_hash_isi_penduduk(conn):
+    database.ensure_hash_isi(conn)
+    conn.execute("ALTER TABLE impor_job ADD COLUMN sama INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE impor_job ADD COLUMN dry_run INTEGER NOT NULL DEFAULT 0")
+
+
+def m010_pemilik_job_impor(conn):
+    conn.execute("ALTER TABLE impor_job ADD COLUMN pemilik TEXT")  # Proses yang menjalankan job
+    conn.execute("ALTER TABLE impor_job ADD COLUMN detak REAL")  # Heartbeat terakhir pemilik (time.time())
+
+
+MIGRATIONS = [
+    (1, "Tabel dasar penduduk, user, log", m001_tabel_dasar),
+    (2, "Kolom lengkap log_penghapusan", m002_log_penghapusan_lengkap),
+    (3, "User default", m003_user_default),
+    (4, "Index sekunder penduduk", m004_index_penduduk),
+    (5, "Pencarian FTS5 penduduk", m005_pencarian_fts),
+    (6, "Tabel agregat statistik", m006_tabel_statistik),
+    (7, "Tabel job impor", m007_job_impor),
+    (8, "Laporan kesalahan job impor", m008_laporan_kesalahan_impor),
+    (9, "Hash isi penduduk dan pratinjau impor", m009_hash_isi_penduduk),
+    (10, "Pemilik dan heartbeat job impor", m010_pemilik_job_impor),
+]
+
+VERSI_TERBARU = MIGRATIONS[-1][0]
+
+
+def versi_sekarang(conn):
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0  # Tabel schema_version belum ada
+    return row[0] or 0
+
+
+def upgrade(conn):
+    """
+    Jalankan semua migrasi yang belum diterapkan, dalam satu transaksi.
+    BEGIN IMMEDIATE memegang kunci tulis database, jadi jika beberapa worker start
+    bersamaan hanya satu yang menjalankan migrasi; yang lain menunggu lalu melihat versi terbaru.
+    Kembalikan daftar nomor migrasi yang diterapkan.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            nama TEXT NOT NULL,
+            diterapkan TEXT NOT NULL
+        )""")
+        versi = versi_sekarang(conn)
+        diterapkan = []
+        for nomor, nama, fungsi in MIGRATIONS:
+            if nomor <= versi:
+                continue
+            fungsi(conn)
+            conn.execute("INSERT INTO schema_version (version, nama, diterapkan) VALUES (?, ?, ?)",
+                         (nomor, nama, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            diterapkan.append(nomor)
+        conn.commit()
+        return diterapkan
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def upgrade_jika_perlu():
+    """
+    Dipanggil saat aplikasi start: cukup satu SELECT jika skema sudah terbaru.
+    """
+    conn = get_db()
+    try:
+        if versi_sekarang(conn) >= VERSI_TERBARU:
+            return []
+        diterapkan = upgrade(conn)
+        for nomor in diterapkan:
+            print(f"✅ Migrasi {nomor:03d} diterapkan")
+        return diterapkan
+    finally:
+        conn.close()
@@ -0,0 +1,26 @@
+# tests/conftest.py
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def aplikasi(tmp_path_factory):
+    """Modul app yang berjalan di salinan desa.db (folder kerja sementara), bukan database asli."""
+    kerja = tmp_path_factory.mktemp('desa')
+    shutil.copy(os.path.join(ROOT, 'desa.db'), kerja / 'desa.db')
+    os.chdir(kerja)  # Path di Config relatif terhadap folder kerja
+    sys.path.insert(0, ROOT)
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(aplikasi):
+    with aplikasi.app.test_client() as c:
+        c.post('/login', data={'username': 'admin', 'password': '1234'})
+        yield c
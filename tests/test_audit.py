@@ -0,0 +1,32 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+
+def test_batch_tidak_dibuang_saat_database_terkunci(aplikasi, monkeypatch):
+    """Batch yang gagal disimpan (database terkunci) diulang sampai tersimpan, bukan dibuang."""
+    import audit
+    import database
+    asli = audit._simpan
+    gagal = [2]
+
+    def simpan_terkunci(conn, events):
+        if gagal[0]:
+            gagal[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        asli(conn, events)
+
+    monkeypatch.setattr(audit, '_simpan', simpan_terkunci)
+    monkeypatch.setattr(database.Config, 'DB_RETRY', 0)  # Lapisan retry habis: batch harus diulang penulis
+    monkeypatch.setattr(audit, 'time', SimpleNamespace(sleep=lambda detik: None, monotonic=time.monotonic))
+    events = [('admin', 'TES_AUDIT_TERKUNCI', f'event {i}', '2026-01-01 00:00:00') for i in range(3)]
+    audit._tulis_sampai_berhasil(events)
+
+    conn = database.pool.acquire()
+    try:
+        jumlah = conn.execute("SELECT COUNT(*) FROM log_aktivitas WHERE aksi = 'TES_AUDIT_TERKUNCI'").fetchone()[0]
+        conn.execute("DELETE FROM log_aktivitas WHERE aksi = 'TES_AUDIT_TERKUNCI'")
+        conn.commit()
+    finally:
+        conn.close()
+    assert (gagal[0], jumlah) == (0, 3)
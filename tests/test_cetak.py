@@ -0,0 +1,52 @@
+import io
+from datetime import datetime
+
+
+class _WaktuTetap(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 5, 1, 9, 30, tzinfo=tz)
+
+
+def _teks_pdf(data):
+    from pypdf import PdfReader
+    return "\n".join(page.extract_text() for page in PdfReader(io.BytesIO(data)).pages)
+
+
+def test_cetak_kk_dari_cache(aplikasi, client, monkeypatch):
+    """
+    KK yang sama dicetak petugas lain: isi diambil dari cache (tidak dirender ulang), footer tetap
+    memuat pencetak dan waktu cetak saat ini. Permintaan bersyarat dengan ETag yang cocok dapat 304.
+    """
+    import cetak
+    import database
+    conn = database.pool.acquire()
+    try:
+        nomor_kk = conn.execute("SELECT nomor_kk FROM penduduk WHERE dusun = 'SATU' "
+                                "AND TRIM(IFNULL(nomor_kk, '')) != '' LIMIT 1").fetchone()['nomor_kk']
+    finally:
+        conn.close()
+    cetak.hapus_cache_kk(nomor_kk)
+    monkeypatch.setattr(aplikasi, 'datetime', _WaktuTetap)
+    render = []
+    render_asli = cetak.render_kk
+    monkeypatch.setattr(cetak, 'render_kk', lambda *args: render.append(args) or render_asli(*args))
+
+    url = f'/cetak/kk/{nomor_kk}'
+    pertama = client.get(url)
+    assert pertama.status_code == 200
+    assert 'Dicetak oleh: admin | Tanggal: 01-05-2026 09:30' in _teks_pdf(pertama.data)
+
+    with aplikasi.app.test_client() as petugas_lain:
+        petugas_lain.post('/login', data={'username': 'kepala_satu', 'password': '1234'})
+        kedua = petugas_lain.get(url)
+    assert kedua.status_code == 200
+    assert 'Dicetak oleh: kepala_satu | Tanggal: 01-05-2026 09:30' in _teks_pdf(kedua.data)
+    assert len(render) == 1  # Folder kerja (conftest) bukan folder aplikasi: cache tetap terbaca
+
+    ketiga = client.get(url)
+    assert ketiga.status_code == 200
+    assert ketiga.headers['ETag'] == pertama.headers['ETag']
+    r = client.get(url, headers={'If-None-Match': ketiga.headers['ETag']})
+    assert r.status_code == 304
+    assert len(render) == 1
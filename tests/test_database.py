@@ -0,0 +1,179 @@
+# tests/test_database.py
+import sqlite3
+import threading
+import time
+
+
+def _koneksi(path):
+    import database
+    conn = sqlite3.connect(path, factory=database.PooledConnection, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA busy_timeout = 0")  # Hanya lapisan retry Python yang menunggu
+    return conn
+
+
+def test_retry_hanya_di_luar_transaksi(aplikasi, tmp_path):
+    """Di dalam transaksi terbuka, 'database is locked' langsung diteruskan; di luar transaksi diulang."""
+    import pytest
+    path = str(tmp_path / 'kunci.db')
+    pemegang, conn = _koneksi(path), _koneksi(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    pemegang.execute("BEGIN IMMEDIATE")
+
+    conn.execute("SELECT * FROM t").fetchall()
+    conn.execute("BEGIN")
+    conn.execute("SELECT * FROM t").fetchall()  # Snapshot transaksi sudah diambil
+    mulai = time.perf_counter()
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO t VALUES (1)")
+    assert time.perf_counter() - mulai < 0.1  # Tidak ada jeda retry
+    conn.rollback()
+
+    # Di luar transaksi: diulang sampai kunci dilepas
+    threading.Timer(0.15, pemegang.rollback).start()
+    conn.execute("INSERT INTO t VALUES (2)")
+    conn.commit()
+    assert conn.execute("SELECT x FROM t").fetchall() == [(2,)]
+    pemegang.tutup_permanen()
+    conn.tutup_permanen()
+
+
+def _semua_halaman(app, kunci_urut, per_kk, mundur=False):
+    """Telusuri semua halaman keyset (maju dari awal, atau mundur dari halaman terakhir)."""
+    import database
+    base_query = f"SELECT id, nomor_kk, nama, {database.URUT_KELUARGA} AS urut_keluarga FROM penduduk"
+    conn = database.pool.acquire()
+    try:
+        cursor = conn.cursor()
+        halaman = []
+        after = before = None
+        while True:
+            rows, has_prev, has_next = app.ambil_halaman_keyset(
+                cursor, base_query, [], (), kunci_urut, 50, after=after, before=before,
+                akhir=mundur and before is None, per_kk=per_kk)
+            assert rows
+            halaman.append([tuple(row) for row in rows])
+            # Cursor lewat encode/decode seperti di link halaman
+            if mundur:
+                if not has_prev:
+                    break
+                before = app.decode_cursor(app.encode_cursor([rows[0][alias] for _, alias in kunci_urut]))
+            else:
+                if not has_next:
+                    break
+                after = app.decode_cursor(app.encode_cursor([rows[-1][alias] for _, alias in kunci_urut]))
+        urut = ", ".join(ekspresi for ekspresi, _ in kunci_urut)
+        semua = [tuple(row) for row in cursor.execute(f"{base_query} ORDER BY {urut}").fetchall()]
+    finally:
+        conn.close()
+    if mundur:
+        halaman.reverse()
+    return halaman, semua
+
+
+def test_paginasi_keyset_maju_mundur(aplikasi):
+    """Maju dan mundur, urut KK dan NIK: setiap baris tepat sekali, berurutan, dan KK tidak terpotong."""
+    for kunci_urut, per_kk in [(aplikasi.KUNCI_URUT_KK, True), (aplikasi.KUNCI_URUT_NIK, False)]:
+        for mundur in (False, True):
+            halaman, semua = _semua_halaman(aplikasi, kunci_urut, per_kk, mundur=mundur)
+            assert len(halaman) > 2
+            assert [row for rows in halaman for row in rows] == semua
+            if per_kk:
+                kk_per_halaman = [{row[1] for row in rows} for rows in halaman]
+                for i, kk in enumerate(kk_per_halaman):
+                    assert not kk & set().union(*kk_per_halaman[i + 1:])
+
+
+def test_cursor_rusak_kembali_ke_halaman_pertama(client):
+    """Cursor yang diubah atau tidak valid tidak membuat 500; daftar kembali ke halaman 1."""
+    import base64
+    import json
+    import re
+
+    def cursor(nilai):
+        return base64.urlsafe_b64encode(json.dumps(nilai).encode()).decode().rstrip('=')
+
+    for view in ('kk', 'nik'):
+        r = client.get(f'/?view={view}')
+        assert r.status_code == 200
+        halaman_1 = re.findall(rb'\b\d{16}\b', r.data)
+        assert halaman_1
+        for rusak in ['!!!bukan-base64', cursor({'nama': 'A'}), cursor(['A']),
+                      cursor([{'x': 1}, [2]]), cursor([{'x': 1}, 'A', 'B', [2]])]:
+            for arah in ('after', 'before'):
+                r = client.get('/', query_string={'view': view, arah: rusak})
+                assert r.status_code == 200, (view, arah, rusak)
+                assert re.findall(rb'\b\d{16}\b', r.data) == halaman_1, (view, arah, rusak)
+
+
+def test_statistik_trigger_tanpa_selisih(aplikasi):
+    """Insert, update (pindah dusun, ganti jenis kelamin dan KK), delete dan upsert: agregat tetap cocok."""
+    import database
+    sql_insert = ("INSERT INTO penduduk (nik, nomor_kk, nama, hubungan, jenis_kelamin, dusun, agama, "
+                  "pendidikan, tanggal_input) VALUES (?, ?, ?, ?, ?, ?, 'ISLAM', 'SD', '2026-01-15 08:00:00')")
+    conn = database.pool.acquire()
+
+    def cocok():
+        assert database.cek_statistik(conn) == []
+        hitung = lambda sql, *args: conn.execute(sql, args).fetchone()[0]
+        assert database.hitung_statistik(conn, 'jiwa') == hitung("SELECT COUNT(*) FROM penduduk")
+        assert database.hitung_statistik(conn, 'kk') == hitung(
+            "SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE TRIM(IFNULL(nomor_kk, '')) != ''")
+        for dusun in ('SATU', 'DUA'):
+            assert database.hitung_statistik(conn, 'jiwa', dusun) == hitung(
+                "SELECT COUNT(*) FROM penduduk WHERE dusun = ?", dusun)
+            assert database.hitung_statistik(conn, 'kk', dusun) == hitung(
+                "SELECT COUNT(DISTINCT nomor_kk) FROM penduduk WHERE dusun = ? AND TRIM(nomor_kk) != ''", dusun)
+            per_jk = dict(tuple(r) for r in database.rincian_statistik(conn, 'jenis_kelamin', dusun))
+            langsung = dict(tuple(r) for r in conn.execute(
+                "SELECT jenis_kelamin, COUNT(*) FROM penduduk WHERE dusun = ? GROUP BY 1", (dusun,)))
+            assert per_jk == langsung
+
+    try:
+        cocok()
+        conn.executemany(sql_insert, [
+            ('9900000000000041', '9910000000000041', 'KEPALA A', 'Kepala Keluarga', 'L', 'SATU'),
+            ('9900000000000042', '9910000000000041', 'ANAK A', 'Anak', 'P', 'SATU'),
+            ('9900000000000043', '9910000000000043', 'KEPALA B', 'Kepala Keluarga', 'P', 'DUA'),
+            ('9900000000000044', '', 'TANPA KK', 'Anak', 'L', 'DUA'),
+        ])
+        cocok()
+        conn.execute("UPDATE penduduk SET dusun = 'DUA' WHERE nik = '9900000000000042'")  # KK A di dua dusun
+        cocok()
+        conn.execute("UPDATE penduduk SET jenis_kelamin = 'L' WHERE nik = '9900000000000043'")
+        cocok()
+        conn.execute("UPDATE penduduk SET nomor_kk = '9910000000000043' WHERE nik = '9900000000000042'")
+        conn.execute("UPDATE penduduk SET nomor_kk = '9910000000000041' WHERE nik = '9900000000000044'")
+        cocok()
+        conn.execute("DELETE FROM penduduk WHERE nik = '9900000000000041'")
+        cocok()
+        # INSERT OR REPLACE: baris lama dihapus lewat recursive_triggers, lalu baris baru dihitung
+        conn.execute(sql_insert.replace("INSERT", "INSERT OR REPLACE"),
+                     ('9900000000000043', '9910000000000045', 'KEPALA B', 'Kepala Keluarga', 'P', 'SATU'))
+        cocok()
+        # Upsert gaya impor: ON CONFLICT DO UPDATE memicu trigger UPDATE
+        conn.execute(sql_insert + " ON CONFLICT (nik) DO UPDATE SET dusun = excluded.dusun, "
+                     "jenis_kelamin = excluded.jenis_kelamin, nomor_kk = excluded.nomor_kk",
+                     ('9900000000000044', '9910000000000045', 'TANPA KK', 'Anak', 'P', 'SATU'))
+        cocok()
+        conn.execute("DELETE FROM penduduk WHERE nik LIKE '99000000000000%'")
+        cocok()
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_lompatan_offset_dibatasi(client, monkeypatch):
+    """Link halaman tanpa cursor dan hasil pencarian FTS tidak melompat lebih dalam dari HALAMAN_OFFSET_MAKS."""
+    import re
+    from config import Config
+    monkeypatch.setattr(Config, 'HALAMAN_OFFSET_MAKS', 3)
+    for args in ({'view': 'nik', 'page': 999}, {'view': 'kk', 'page': 999},
+                 {'view': 'nik', 'q': 'an', 'page': 999}, {'view': 'nik', 'q': 'ani', 'page': 999}):
+        r = client.get('/', query_string=dict(args, limit=50))
+        assert r.status_code == 200, args
+        aktif = re.search(rb'<li class="page-item active">\s*<a class="page-link"[^>]*>(\d+)</a>', r.data)
+        assert aktif and int(aktif.group(1)) <= 3, args
+        if args.get('q') == 'ani':  # 300+ hasil: halaman 4 dst. tidak ditawarkan
+            assert b'Persempit kata kunci' in r.data
@@ -0,0 +1,52 @@
+import csv
+import io
+
+import pytest
+
+
+@pytest.fixture
+def client_kepala_dusun(aplikasi):
+    with aplikasi.app.test_client() as c:
+        c.post('/login', data={'username': 'kepala_satu', 'password': '1234'})
+        yield c
+
+
+def _csv(client, **args):
+    r = client.get('/ekspor/csv', query_string=args)
+    assert r.status_code == 200
+    return list(csv.reader(io.StringIO(r.get_data(as_text=True))))
+
+
+def test_ekspor_kepala_dusun_hanya_dusunnya(client_kepala_dusun):
+    """Kepala dusun hanya mengekspor dusunnya, juga jika ?dusun meminta dusun lain."""
+    import pyarrow.parquet as pq
+    import database
+    conn = database.pool.acquire()
+    try:
+        jumlah = conn.execute("SELECT COUNT(*) FROM penduduk WHERE dusun = 'SATU'").fetchone()[0]
+    finally:
+        conn.close()
+    assert jumlah
+
+    rows = _csv(client_kepala_dusun, kolom='nik,dusun')
+    assert rows[0] == ['NIK', 'Dusun']
+    assert len(rows) - 1 == jumlah
+    assert {row[1] for row in rows[1:]} == {'SATU'}
+    assert _csv(client_kepala_dusun, kolom='nik,dusun', dusun='DUA') == [['NIK', 'Dusun']]
+
+    r = client_kepala_dusun.get('/ekspor/parquet', query_string={'kolom': 'nik,dusun'})
+    assert r.status_code == 200
+    tabel = pq.read_table(io.BytesIO(r.data))
+    assert tabel.column_names == ['NIK', 'Dusun']
+    assert tabel.num_rows == jumlah
+    assert set(tabel.column('Dusun').to_pylist()) == {'SATU'}
+
+
+def test_ekspor_kolom_tidak_dikenal_ditolak(client):
+    """?kolom hanya menerima nama dari KOLOM_EKSPOR; selain itu 400, tidak pernah masuk ke SELECT."""
+    for url in ('/ekspor/excel', '/ekspor/csv', '/ekspor/parquet'):
+        for kolom in ['nik,password', 'nik,(SELECT password FROM user)', "nik,nama FROM user --"]:
+            r = client.get(url, query_string={'kolom': kolom})
+            assert r.status_code == 400, (url, kolom)
+            assert 'Kolom tidak dikenal' in r.get_json()['error']
+    assert _csv(client, kolom=' nik , nama ')[0] == ['NIK', 'Nama']
@@ -0,0 +1,42 @@
+# tests/test_grafik.py
+import os
+import sqlite3
+import time
+
+
+def test_versi_lama_grafik_disimpan_selama_masa_tenggang(aplikasi, tmp_path, monkeypatch):
+    """Grafik baru tidak langsung menghapus versi sebelumnya; hanya yang sudah lewat masa simpannya."""
+    import grafik
+    from config import Config
+    monkeypatch.setattr(Config, 'CHART_FOLDER', str(tmp_path))
+    monkeypatch.setattr(grafik, '_aktif', {})
+
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row  # Bentuk data sama dengan hasil query dashboard
+
+    def siapkan(jumlah):
+        rows = conn.execute("SELECT 'ISLAM' AS agama, ? AS jumlah", (jumlah,)).fetchall()
+        return grafik.siapkan_grafik(agama=rows)['agama']
+
+    a, b = siapkan(1), siapkan(2)
+    assert sorted(os.listdir(tmp_path)) == sorted([a, b])  # Halaman yang masih memuat a tidak 404
+
+    lama = time.time() - Config.GRAFIK_SIMPAN_LAMA_DETIK - 60
+    os.utime(tmp_path / a, (lama, lama))
+    c = siapkan(3)
+    assert sorted(os.listdir(tmp_path)) == sorted([b, c])
+
+
+def test_kartu_dashboard_sesuai_api_untuk_kepala_dusun(aplikasi):
+    """Kartu dashboard kepala dusun memakai lingkup yang sama dengan /api/statistik (grafiknya)."""
+    import re
+    with aplikasi.app.test_client() as client:
+        client.post('/login', data={'username': 'kepala_satu', 'password': '1234'})
+        r = client.get('/dashboard')
+        assert r.status_code == 200
+        kartu = [int(n) for n in re.findall(rb'<p class="display-6 mb-0">(\d+)</p>', r.data)]
+        api = client.get('/api/statistik').get_json()
+
+    assert kartu == [api['total_jiwa'], api['total_kk'], len(api['dusun']['label'])]
+    assert api['dusun']['label'] == ['SATU']
+    assert api['total_jiwa'] == sum(api['agama']['jumlah'])
@@ -0,0 +1,259 @@
+# tests/test_impor.py
+from openpyxl import Workbook
+
+
+def _xlsx(path, header, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def _impor(path):
+    import database
+    import importer
+    conn = database.pool.acquire()
+    try:
+        return importer.impor_file(conn, path)
+    finally:
+        conn.close()
+
+
+def test_impor_kolom_minimal_bisa_dicetak(client, tmp_path):
+    """File tanpa kolom opsional: baris baru diisi '' (bukan NULL) dan cetak KK tetap jalan."""
+    import database
+    path = _xlsx(tmp_path / 'minimal.xlsx',
+                 ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun'],
+                 [['9900000000000001', '9910000000000001', 'WARGA MINIMAL', 'Kepala Keluarga', 'L', 'SATU'],
+                  ['9900000000000002', '9910000000000001', 'ANAK MINIMAL', 'Anak', 'P', 'SATU']])
+    baru, diperbarui, sama, gagal = _impor(path)
+    assert (baru, gagal) == (2, 0)
+
+    conn = database.pool.acquire()
+    try:
+        row = conn.execute("SELECT tempat_lahir, agama, pekerjaan, pendidikan FROM penduduk WHERE nik = ?",
+                           ('9900000000000001',)).fetchone()
+    finally:
+        conn.close()
+    assert tuple(row) == ('', '', '', '')
+
+    for url in ['/cetak/kk/9910000000000001', '/cetak/kk/dusun/SATU']:
+        r = client.get(url)
+        assert r.status_code == 200, url
+        assert r.data[:4] == b'%PDF'
+
+
+def test_impor_kolom_minimal_tidak_menimpa_kolom_lain(client, tmp_path):
+    """Baris yang sudah ada: kolom yang tidak ada di file tetap nilai lamanya."""
+    import database
+    header = ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun']
+    _impor(_xlsx(tmp_path / 'lengkap.xlsx', header + ['agama'],
+                 [['9900000000000011', '9910000000000011', 'WARGA LAMA', 'Kepala Keluarga', 'L', 'DUA', 'Islam']]))
+    _impor(_xlsx(tmp_path / 'minimal.xlsx', header,
+                 [['9900000000000011', '9910000000000011', 'WARGA BARU', 'Kepala Keluarga', 'L', 'DUA']]))
+
+    conn = database.pool.acquire()
+    try:
+        row = conn.execute("SELECT nama, agama FROM penduduk WHERE nik = ?", ('9900000000000011',)).fetchone()
+    finally:
+        conn.close()
+    assert tuple(row) == ('WARGA BARU', 'Islam')
+
+
+def test_job_terputus_dipulihkan_saat_start(aplikasi, tmp_path):
+    """Job proses yang sudah mati: diantrekan ulang jika filenya masih ada, selain itu ditandai gagal."""
+    import os
+    import time
+    import database
+    import importer
+    from config import Config
+    os.makedirs(Config.IMPOR_FOLDER, exist_ok=True)
+    _xlsx(importer._path_job('jobterputusadafile', 'data.xlsx'),
+          ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun'],
+          [['9900000000000021', '9910000000000021', 'WARGA JOB', 'Kepala Keluarga', 'L', 'SATU']])
+    conn = database.pool.acquire()
+    try:
+        for job_id, status, pemilik in [('jobterputusadafile', 'berjalan', 'host:1:mati'),
+                                        ('jobterputustanpafile', 'menunggu', None),
+                                        ('jobprosesini', 'menunggu', importer._pemilik())]:
+            conn.execute("INSERT INTO impor_job (id, username, nama_file, status, dibuat, diproses, pemilik, detak) "
+                         "VALUES (?, 'admin', 'data.xlsx', ?, '2000-01-01 00:00:00', 5, ?, ?)",
+                         (job_id, status, pemilik, time.time()))
+        conn.commit()
+
+        # Tidak ada proses lain yang memegang kunci job: heartbeat yang masih baru pun tidak berarti hidup
+        assert importer.pulihkan_job() == 2
+        for _ in range(100):
+            job = importer.status_job(conn, 'jobterputusadafile')
+            if job['status'] not in ('menunggu', 'berjalan'):
+                break
+            time.sleep(0.1)
+        assert (job['status'], job['baru']) == ('selesai', 1)
+        job = importer.status_job(conn, 'jobterputustanpafile')
+        assert (job['status'], job['pesan']) == ('gagal', importer.PESAN_JOB_TERPUTUS)
+        assert importer.status_job(conn, 'jobprosesini')['status'] == 'menunggu'  # Milik proses ini
+        conn.execute("DELETE FROM impor_job WHERE id = 'jobprosesini'")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_job_milik_proses_hidup_tidak_diambil_alih(aplikasi, monkeypatch):
+    """Worker yang start belakangan tidak mengambil alih job yang masih dijalankan worker lain."""
+    import fcntl
+    import os
+    import time
+    import database
+    import importer
+    from config import Config
+    importer._pemilik()  # Proses ini (worker B) sudah memegang kunci bersama
+    # Worker A: proses lain yang hidup, memegang kunci bersama lewat deskripsi file sendiri
+    kunci_a = open(os.path.join(Config.IMPOR_FOLDER, '.job.lock'), 'w')
+    fcntl.flock(kunci_a, fcntl.LOCK_SH)
+    conn = database.pool.acquire()
+    try:
+        for job_id, detak in [('jobworkerhidup', time.time()),
+                              ('jobworkermati', time.time() - Config.IMPOR_DETAK_KADALUARSA_DETIK - 1)]:
+            conn.execute("INSERT INTO impor_job (id, username, nama_file, status, dibuat, diproses, pemilik, detak) "
+                         "VALUES (?, 'admin', 'data.xlsx', 'berjalan', '2000-01-01 00:00:00', 5, ?, ?)",
+                         (job_id, 'host:' + job_id, detak))
+        conn.commit()
+
+        # Dua worker B berbeda (dan job dibuat sebelum keduanya start): hanya job tanpa heartbeat diambil
+        for pemilik_b in ['host:b1', 'host:b2']:
+            monkeypatch.setattr(importer, '_proses_job', (os.getpid(), pemilik_b))
+            importer.pulihkan_job()
+        job = importer.status_job(conn, 'jobworkerhidup')
+        assert (job['status'], job['diproses'], job['pemilik']) == ('berjalan', 5, 'host:jobworkerhidup')
+        job = importer.status_job(conn, 'jobworkermati')
+        assert (job['status'], job['pemilik']) == ('gagal', 'host:b1')
+
+        # Worker A berhenti: kunci dilepas, job yang tersisa baru boleh diambil alih
+        kunci_a.close()
+        assert importer.pulihkan_job() == 1
+        assert importer.status_job(conn, 'jobworkerhidup')['status'] == 'gagal'
+        conn.execute("DELETE FROM impor_job WHERE id IN ('jobworkerhidup', 'jobworkermati')")
+        conn.commit()
+    finally:
+        kunci_a.close()
+        conn.close()
+
+
+def test_nik_baris_ditolak_tidak_dianggap_ganda(aplikasi):
+    """NIK dari baris yang ditolak aturan lain tidak membuat baris valid berikutnya jadi 'ganda'."""
+    import database
+    import importer
+    header = {'hubungan': 'Anak', 'jenis_kelamin': 'L', 'nomor_kk': '9910000000000031'}
+    conn = database.pool.acquire()
+    try:
+        validasi = importer.ValidasiImpor(conn)
+        potongan = [
+            # Baris 2 ditolak (nama), baris 3 valid dengan NIK sama, baris 4 ganda sungguhan
+            [('9900000000000031', 'warga 1', 'SATU'), ('9900000000000031', 'WARGA BENAR', 'SATU'),
+             ('9900000000000031', 'WARGA LAIN', 'SATU'), ('9900000000000032', 'WARGA X', 'LUAR')],
+            # Potongan berikutnya: NIK 32 sebelumnya ditolak (dusun), NIK 31 sudah lolos
+            [('9900000000000032', 'WARGA Y', 'DUA'), ('9900000000000031', 'WARGA Z', 'DUA')],
+        ]
+        hasil = []
+        baris = 2
+        for rows in potongan:
+            data = {'nik': [r[0] for r in rows], 'nama': [r[1] for r in rows], 'dusun': [r[2] for r in rows],
+                    '_baris': list(range(baris, baris + len(rows)))}
+            data.update({k: [v] * len(rows) for k, v in header.items()})
+            baris += len(rows)
+            valid, salah, _ = validasi.periksa(data)
+            hasil.append((valid['nama'], dict(zip(salah['_baris'], salah['kesalahan']))))
+    finally:
+        conn.close()
+
+    assert hasil[0][0] == ['WARGA BENAR']
+    assert 'ganda' not in hasil[0][1][2] and 'ganda' in hasil[0][1][4]
+    assert hasil[1][0] == ['WARGA Y']
+    assert hasil[1][1] == {7: "NIK ganda dalam file."}
+
+
+def test_impor_ulang_melewati_baris_sama(client, tmp_path):
+    """File yang sama diimpor ulang: semua 'sama'. Baris yang diedit lewat form dianggap berubah lagi."""
+    header = ['nik', 'nomor_kk', 'nama', 'hubungan', 'jenis_kelamin', 'dusun', 'alamat']
+    rows = [['9900000000000061', '9910000000000061', 'KEPALA ULANG', 'Kepala Keluarga', 'L', 'TIGA', 'JALAN A'],
+            ['9900000000000062', '9910000000000061', 'ISTRI ULANG', 'Istri', 'P', 'TIGA', 'JALAN A'],
+            ['9900000000000063', '9910000000000061', 'ANAK ULANG', 'Anak', 'P', 'TIGA', 'JALAN A']]
+    path = _xlsx(tmp_path / 'ulang.xlsx', header, rows)
+    assert _impor(path) == (3, 0, 0, 0)
+    assert _impor(path) == (0, 0, 3, 0)
+
+    # Edit lewat form: trigger mengosongkan hash_isi
+    form = dict(zip(header, rows[1]), nama='ISTRI DIEDIT')
+    assert client.post('/edit/9900000000000062', data=form).status_code == 302
+    assert _impor(path) == (0, 1, 2, 0)
+    assert _impor(path) == (0, 0, 3, 0)
+
+    import database
+    conn = database.pool.acquire()
+    try:
+        assert conn.execute("SELECT nama FROM penduduk WHERE nik = '9900000000000062'").fetchone()[0] == 'ISTRI ULANG'
+    finally:
+        conn.close()
+
+
+def test_status_gagal_tidak_tersimpan_job_tetap_dipulihkan(aplikasi, monkeypatch):
+    """Status 'gagal' yang tidak bisa ditulis: heartbeat job dihentikan sehingga pemulihan menandainya gagal."""
+    import os
+    import sqlite3
+    import time
+    import database
+    import importer
+    from config import Config
+
+    class KoneksiTerkunci:
+        in_transaction = False
+
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+        def rollback(self):
+            pass
+
+    monkeypatch.setattr(Config, 'DB_RETRY', 0)
+    conn = database.pool.acquire()
+    try:
+        conn.execute("INSERT INTO impor_job (id, username, nama_file, status, dibuat, pemilik, detak) "
+                     "VALUES ('jobstatusterkunci', 'admin', 'data.xlsx', 'berjalan', '2000-01-01 00:00:00', ?, ?)",
+                     (importer._pemilik(), time.time()))
+        conn.commit()
+        importer._tandai_gagal(KoneksiTerkunci(), 'jobstatusterkunci', 'Error membaca file')
+        assert 'jobstatusterkunci' in importer._job_lepas
+
+        # Tanpa heartbeat, job melewati batas kedaluwarsa
+        conn.execute("UPDATE impor_job SET detak = ? WHERE id = 'jobstatusterkunci'",
+                     (time.time() - Config.IMPOR_DETAK_KADALUARSA_DETIK - 1,))
+        conn.commit()
+        importer.pulihkan_job()
+        job = importer.status_job(conn, 'jobstatusterkunci')
+        assert (job['status'], job['pesan']) == ('gagal', importer.PESAN_JOB_TERPUTUS)
+        assert 'jobstatusterkunci' not in importer._job_lepas
+        conn.execute("DELETE FROM impor_job WHERE id = 'jobstatusterkunci'")
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Baris job sudah tidak ada: job selesai tanpa error, file upload dibuang
+    os.makedirs(Config.IMPOR_FOLDER, exist_ok=True)
+    path = importer._path_job('jobtanpabaris', 'data.csv')
+    open(path, 'w').close()
+    importer._jalankan_job('jobtanpabaris', path)
+    assert not os.path.exists(path)
+
+
+def test_nomor_baris_csv_dengan_baris_kosong(aplikasi, tmp_path):
+    """Nomor baris CSV tetap cocok dengan Excel setelah baris kosong dan teks ber-kutip yang memuat enter."""
+    import importer
+    path = tmp_path / 'data.csv'
+    path.write_text('nik,nama,dusun\n1,"NAMA\nDUA BARIS",SATU\n\n2,B,DUA\n,,\n3\n', encoding='utf-8')
+    with importer._sumber_csv(str(path), 2) as (kolom, _, potongan):
+        hasil = [(baris, nik, nama) for data in potongan
+                 for baris, nik, nama in zip(data['_baris'], data['nik'], data['nama'])]
+    assert hasil == [(2, '1', 'NAMA\nDUA BARIS'), (4, '2', 'B'), (6, '3', '')]
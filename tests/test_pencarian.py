@@ -0,0 +1,51 @@
+import re
+
+
+def _nik_ditemukan(client, q, semua_nik=None):
+    r = client.get('/', query_string={'view': 'nik', 'q': q, 'limit': 500})
+    assert r.status_code == 200
+    nik = {n.decode() for n in re.findall(rb'\b\d{16}\b', r.data)}
+    return nik & semua_nik if semua_nik is not None else nik
+
+
+def test_pencarian_fts_mengikuti_edit_dan_hapus(client):
+    """Penduduk yang diedit dicari dengan nama barunya (nama lama tidak lagi cocok); yang dihapus hilang."""
+    import database
+    nik = '9900000000000051'
+    conn = database.pool.acquire()
+    try:
+        conn.execute("INSERT INTO penduduk (nik, nomor_kk, nama, hubungan, jenis_kelamin, dusun) "
+                     "VALUES (?, '9910000000000051', 'WARGA CARIPERTAMA', 'Kepala Keluarga', 'L', 'SATU')", (nik,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert nik in _nik_ditemukan(client, 'caripertama')
+
+    form = {'nama': 'WARGA CARIKEDUA', 'nik': nik, 'nomor_kk': '9910000000000051', 'dusun': 'SATU',
+            'hubungan': 'Kepala Keluarga', 'jenis_kelamin': 'L', 'alamat': 'JALAN CARIALAMAT'}
+    assert client.post(f'/edit/{nik}', data=form).status_code == 302
+    assert nik not in _nik_ditemukan(client, 'caripertama')
+    assert nik in _nik_ditemukan(client, 'carikedua')
+    assert nik in _nik_ditemukan(client, 'carialamat')
+
+    assert client.post(f'/hapus/{nik}', data={'alasan': 'Pindah'}).status_code == 302
+    client.get('/')  # Pesan flash "Data NIK ... berhasil dihapus!" memuat NIK-nya
+    assert nik not in _nik_ditemukan(client, 'carikedua')
+    assert nik not in _nik_ditemukan(client, 'carialamat')
+
+
+def test_pencarian_pendek_lewat_like(client):
+    """Kata kunci 1-2 huruf (di bawah batas trigram) memakai LIKE, hasilnya sama dengan pencarian lama."""
+    import database
+    conn = database.pool.acquire()
+    try:
+        semua_nik = {row[0] for row in conn.execute("SELECT nik FROM penduduk")}
+        for q in ['q', 'x', 'zu', 'xi']:
+            pola = f'%{q}%'
+            harapan = {row[0] for row in conn.execute(
+                "SELECT nik FROM penduduk WHERE nomor_kk LIKE ? OR nik LIKE ? OR nama LIKE ?", (pola,) * 3)}
+            assert harapan and len(harapan) <= 500, q
+            assert len(q) < database.FTS_MIN_PANJANG
+            assert _nik_ditemukan(client, q, semua_nik) == harapan, q
+    finally:
+        conn.close()
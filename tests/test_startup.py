@@ -0,0 +1,12 @@
+import os
+
+
+def test_import_app_dalam_anggaran(aplikasi):
+    """`python -X importtime -c "import app"`: pandas, matplotlib, fpdf tidak dimuat dan waktunya dalam anggaran."""
+    from config import Config
+    waktu = aplikasi.ukur_impor_app(ulang=3, cwd=os.getcwd())  # Folder kerja sementara (conftest)
+    dimuat = {nama.split('.')[0] for nama in waktu}
+    for modul in ('pandas', 'matplotlib', 'fpdf'):
+        assert modul not in dimuat, f"{modul} dimuat saat import app"
+    assert aplikasi.periksa_impor_app(waktu) == [], f"import app {waktu['app'][0] / 1000:.0f} ms"
+    assert waktu['app'][0] / 1000 <= Config.STARTUP_MAX_MS
@@ -0,0 +1,100 @@
+# ukur_teks.py
+import math
+
+# --- UKUR TEKS PDF ---
+# Lebar teks font inti (helvetica dll.) = jumlah lebar glyph (satuan 1/1000 em) x ukuran font.
+# Tabel lebar per font dihitung sekali, jadi mengukur teks cukup satu penjumlahan tanpa
+# memanggil set_font / get_string_width fpdf berulang-ulang.
+# Asumsi: tanpa char spacing / stretching (tidak dipakai di aplikasi ini).
+
+MM_PER_PT = 25.4 / 72
+LANGKAH_FONT = 0.5  # Pengecilan font per langkah (pt), sama seperti versi lama
+
+_tabel = {}
+
+
+def tabel_lebar(family='helvetica', style=''):
+    """List 256 lebar glyph (1/1000 em) untuk karakter latin-1 font inti."""
+    kunci = (family.lower(), style.upper())
+    if kunci not in _tabel:
+        from fpdf import FPDF  # Hanya untuk membaca metrik font, sekali per font
+        pdf = FPDF()
+        pdf.set_font(family, style)
+        cw = pdf.current_font.cw
+        _tabel[kunci] = [cw.get(chr(i), 0) for i in range(256)]
+    return _tabel[kunci]
+
+
+def unit_teks(text, tabel):
+    """Jumlah lebar glyph teks (1/1000 em). Karakter di luar latin-1 dihitung sebagai '?'."""
+    return sum(map(tabel.__getitem__, text.encode('latin-1', 'replace')))
+
+
+def lebar_mm(unit, ukuran_pt):
+    return unit * ukuran_pt * 0.001 * MM_PER_PT
+
+
+def ukuran_muat(text, max_width, original_size, min_size=6, family='helvetica', style=''):
+    """
+    Ukuran font terbesar (pt, turun per LANGKAH_FONT dari original_size) yang membuat teks
+    muat dalam max_width mm, tapi tidak lebih kecil dari langkah pertama yang <= min_size.
+    Dihitung langsung dari lebar teks (lebar sebanding dengan ukuran font).
+    """
+    unit = unit_teks(text or '', tabel_lebar(family, style))
+    if lebar_mm(unit, original_size) <= max_width:
+        return original_size
+    langkah_min = math.ceil((original_size - min_size) / LANGKAH_FONT)
+    muat = max_width / lebar_mm(unit, 1)  # Ukuran (pt) yang pas di max_width
+    n = min(max(1, math.ceil((original_size - muat) / LANGKAH_FONT)), langkah_min)
+    # Koreksi pembulatan floating point di batas langkah
+    while n > 1 and lebar_mm(unit, original_size - (n - 1) * LANGKAH_FONT) <= max_width:
+        n -= 1
+    return original_size - n * LANGKAH_FONT
+
+
+def shrink_font_for_fit(pdf, text, max_width, original_size, min_size=6):
+    """
+    Perkecil ukuran font sampai teks muat dalam lebar kolom.
+    Digunakan agar nama panjang tidak memicu multi_cell (yang bikin jelek).
+    """
+    pdf.set_font("helvetica", '', ukuran_muat(text, max_width, original_size, min_size))
+    return pdf.font_size
+
+
+def word_wrap(text, pdf, max_width):
+    """
+    Bungkus teks per kata sesuai font aktif pdf; kata yang lebih panjang dari satu baris dipotong.
+    Setiap kata diukur sekali (linear), tidak mengukur ulang seluruh baris.
+    """
+    tabel = tabel_lebar(pdf.font_family, pdf.font_style)
+    batas = max_width / lebar_mm(1, pdf.font_size_pt)  # max_width dalam 1/1000 em
+    spasi = tabel[ord(' ')]
+    lines = []
+    current_line, current_unit = "", 0
+    for word in text.split(' '):
+        if not word:
+            continue
+        unit = unit_teks(word, tabel)
+        if current_line and current_unit + spasi + unit <= batas:
+            current_line, current_unit = f"{current_line} {word}", current_unit + spasi + unit
+        elif not current_line and unit <= batas:
+            current_line, current_unit = word, unit
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line, current_unit = _potong_kata(word, tabel, batas)
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+
+def _potong_kata(word, tabel, batas):
+    """Awalan terpanjang kata yang muat dalam batas (1/1000 em)."""
+    if unit_teks(word, tabel) <= batas:
+        return word, unit_teks(word, tabel)
+    total = 0
+    for i, b in enumerate(word.encode('latin-1', 'replace')):
+        if total + tabel[b] > batas:
+            return word[:i], total
+        total += tabel[b]
+    return word, total